@@ -0,0 +1,341 @@
+"""Backtest power ranking weights against past seasons.
+
+Every complete season is replayed week by week with the same metrics and
+ranks as /power-rankings-history. After each week, the power rankings
+from a set of weights are compared with how teams finished the regular
+season from then on: the Spearman correlation between the power ranking
+and each team's win percentage over the remaining weeks, 1 if the order
+matched exactly. A set of weights scores the mean correlation over every
+week of every season.
+
+The metric ranks of every season are computed once and put in shared
+memory, then weight sets are scored in chunks across a process pool.
+
+Usage:
+    cd backend
+    python -m bench.backtest
+    python -m bench.backtest --league 15x12 --league 10x10 --grid 0,1,2,3
+    python -m bench.backtest --search random --samples 5000
+    python -m bench.backtest --responses /tmp/league --save weights.json
+
+--responses reads a league saved as {year}/{view}.json files, the layout
+bench.synthetic --out writes, and needs mMatchupScore, mSettings and
+mTeam for each year.
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from bench.synthetic import generate_league
+from power_rankings import DEFAULT_WEIGHTS, RankingsHistory, score_matrix
+from utils import weeks_in_season
+
+METRICS = tuple(DEFAULT_WEIGHTS)
+
+# name -> ndarray in shared memory, set in each worker by attach
+_shared = {}
+
+
+def load_responses(directory):
+    """Read a league saved as {year}/{view}.json files"""
+    league = {}
+    for year in sorted(os.listdir(directory)):
+        if not year.isdigit():
+            continue
+        league[int(year)] = {}
+        for name in os.listdir(os.path.join(directory, year)):
+            view, ext = os.path.splitext(name)
+            if ext == '.json':
+                with open(os.path.join(directory, year, name)) as f:
+                    league[int(year)][view] = json.load(f)
+    return league
+
+
+def season_arrays(views):
+    """Replay a season and rank every metric after each week.
+
+    Returns None for seasons whose regular season hasn't finished.
+
+    Returns:
+        ranks (ndarray) -- metric by team by week ranks, 1 is best
+        results (ndarray) -- team by week, 1 for a win, 0.5 for a tie, 0
+            for a loss and NaN for a bye
+    """
+    settings = views["mSettings"]
+    regular_weeks = (
+        settings["settings"]["scheduleSettings"]["matchupPeriodCount"]
+    )
+    if weeks_in_season(settings, False) < regular_weeks:
+        return None
+
+    schedule = views["mMatchupScore"]["schedule"]
+    team_ids = [team["id"] for team in views["mTeam"]["teams"]]
+    team_ids, weeks, points, won = score_matrix(schedule, regular_weeks,
+                                                team_ids)
+    history = RankingsHistory(team_ids)
+    history.extend(weeks, points, won)
+
+    results = np.where(won, 1.0, np.where(np.isnan(points), np.nan, 0.0))
+    rows = {team_id: row for row, team_id in enumerate(team_ids)}
+    cols = {week: col for col, week in enumerate(weeks)}
+    for matchup in schedule:
+        week = matchup["matchupPeriodId"]
+        if matchup.get("winner") == "TIE" and week in cols:
+            for side in ("away", "home"):
+                results[rows[matchup[side]["teamId"]], cols[week]] = 0.5
+
+    ranks = np.stack([np.column_stack(history.ranks[metric])
+                      for metric in METRICS])
+    return ranks, results
+
+
+def rest_of_season(results):
+    """Rank teams by win percentage over the weeks after each week.
+
+    Returns:
+        target (ndarray) -- team by week ranks, 1 is best
+        valid (ndarray) -- teams with games left after the week
+    """
+    teams, weeks = results.shape
+    played = ~np.isnan(results)
+    # sums over the weeks after each week
+    wins = np.nancumsum(results[:, ::-1], axis=1)[:, ::-1]
+    games = np.cumsum(played[:, ::-1], axis=1)[:, ::-1]
+    wins = np.column_stack((wins[:, 1:], np.zeros(teams)))
+    games = np.column_stack((games[:, 1:], np.zeros(teams)))
+
+    valid = games > 0
+    pct = np.divide(wins, games, out=np.zeros(wins.shape), where=valid)
+    target = masked_ranks(-pct[None], valid)[0]
+    return target, valid
+
+
+def masked_ranks(values, valid):
+    """Average ranks along the team axis, only counting valid teams.
+
+    Arguments:
+        values (ndarray) -- batch by team by week, lower ranks first
+        valid (ndarray) -- team by week
+    """
+    mine = values[:, :, None, :]
+    theirs = values[:, None, :, :]
+    others = valid[None, None, :, :]
+    below = ((theirs < mine) & others).sum(axis=2)
+    tied = ((theirs == mine) & others).sum(axis=2)
+    return below + (tied + 1) / 2
+
+
+def prepare(leagues):
+    """Stack every complete season into padded arrays.
+
+    Returns:
+        arrays (dict) -- ranks (season, metric, team, week), target and
+            valid (season, team, week)
+    """
+    seasons = []
+    for league in leagues:
+        for year in sorted(league):
+            arrays = season_arrays(league[year])
+            if arrays is not None:
+                seasons.append(arrays)
+    if not seasons:
+        raise SystemExit('No complete seasons to backtest')
+
+    teams = max(ranks.shape[1] for ranks, _results in seasons)
+    weeks = max(ranks.shape[2] for ranks, _results in seasons)
+    shape = (len(seasons), teams, weeks)
+    arrays = {
+        "ranks": np.zeros((len(seasons), len(METRICS), teams, weeks)),
+        "target": np.zeros(shape),
+        "valid": np.zeros(shape, dtype=bool),
+    }
+    for idx, (ranks, results) in enumerate(seasons):
+        _metrics, season_teams, season_weeks = ranks.shape
+        target, valid = rest_of_season(results)
+        arrays["ranks"][idx, :, :season_teams, :season_weeks] = ranks
+        arrays["target"][idx, :season_teams, :season_weeks] = target
+        arrays["valid"][idx, :season_teams, :season_weeks] = valid
+    return arrays
+
+
+def share(arrays):
+    """Copy arrays into shared memory blocks.
+
+    Returns:
+        blocks (list) -- SharedMemory blocks, unlink them when done
+        specs (dict) -- name to (block name, shape, dtype) for attach
+    """
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def attach(specs):
+    """Map the shared arrays in a worker process"""
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        # keep the block open for as long as the array is used
+        _shared[name + "_block"] = block
+        _shared[name] = np.ndarray(shape, dtype, buffer=block.buf)
+
+
+def evaluate(weights):
+    """Score weight sets on every shared season.
+
+    Arguments:
+        weights (ndarray) -- weight set by metric
+
+    Returns:
+        scores (ndarray) -- mean correlation for each weight set
+    """
+    total = np.zeros(len(weights))
+    count = 0
+    for ranks, target, valid in zip(_shared["ranks"], _shared["target"],
+                                    _shared["valid"]):
+        # average ranks always have a mean of (n + 1) / 2
+        mean = (valid.sum(axis=0) + 1) / 2
+        y = np.where(valid, target - mean, 0)
+        # weeks where every team left finished the same can't be scored
+        weeks = (y * y).sum(axis=0) > 0
+        if not weeks.any():
+            continue
+        ranks = ranks[:, :, weeks]
+        valid = valid[:, weeks]
+        mean = mean[weeks]
+        y = y[:, weeks]
+
+        scores = np.einsum('km,mtw->ktw', weights, ranks)
+        predicted = masked_ranks(scores, valid)
+        x = np.where(valid, predicted - mean, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rho = (x * y).sum(axis=1) / np.sqrt(
+                (x * x).sum(axis=1) * (y * y).sum(axis=0)
+            )
+        total += np.nan_to_num(rho).sum(axis=1)
+        count += weeks.sum()
+    return total / max(count, 1)
+
+
+def grid(values):
+    """Every combination of values for each metric, without repeats.
+
+    Weight sets that are multiples of each other rank teams the same, so
+    only the first of them is kept.
+    """
+    weights = []
+    seen = set()
+    for combo in itertools.product(values, repeat=len(METRICS)):
+        total = sum(combo)
+        if total <= 0:
+            continue
+        key = tuple(round(value / total, 6) for value in combo)
+        if key not in seen:
+            seen.add(key)
+            weights.append(combo)
+    return np.array(weights, dtype=np.float64)
+
+
+def random_weights(samples, seed, high=5):
+    """Random weight sets with each weight from 0 to high in halves"""
+    rng = np.random.default_rng(seed)
+    weights = rng.integers(0, 2 * high + 1, size=(samples, len(METRICS))) / 2
+    return weights[weights.sum(axis=1) > 0]
+
+
+def backtest(leagues, weights, processes=None, chunk=64):
+    """Score every weight set across every complete season.
+
+    Returns:
+        scores (ndarray) -- mean correlation for each weight set
+    """
+    arrays = prepare(leagues)
+    blocks, specs = share(arrays)
+    try:
+        chunks = [weights[start:start + chunk]
+                  for start in range(0, len(weights), chunk)]
+        with ProcessPoolExecutor(processes, initializer=attach,
+                                 initargs=(specs,)) as pool:
+            return np.concatenate(list(pool.map(evaluate, chunks)))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--league', metavar='SEASONSxTEAMS', action='append',
+                        help='synthetic leagues to backtest, 12x10 if no '
+                             'leagues are given')
+    parser.add_argument('--responses', metavar='DIR', action='append',
+                        help='saved leagues to backtest')
+    parser.add_argument('--tie-rate', type=float, default=0.005,
+                        help='fraction of synthetic games that end in a tie')
+    parser.add_argument('--search', choices=('grid', 'random'),
+                        default='grid')
+    parser.add_argument('--grid', default='0,1,2,3',
+                        help='weights to try for each metric')
+    parser.add_argument('--samples', type=int, default=2000,
+                        help='weight sets for a random search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes, one per CPU by default')
+    parser.add_argument('--top', type=int, default=10,
+                        help='best weight sets to print')
+    parser.add_argument('--save', metavar='PATH',
+                        help='save every weight set and score as JSON')
+    args = parser.parse_args()
+
+    leagues = []
+    for directory in args.responses or []:
+        leagues.append(load_responses(directory))
+    if args.league or not leagues:
+        for idx, size in enumerate(args.league or ['12x10']):
+            seasons, teams = size.split('x')
+            leagues.append(generate_league(
+                idx + 1, int(seasons), int(teams), seed=args.seed + idx,
+                tie_rate=args.tie_rate
+            ))
+
+    if args.search == 'grid':
+        weights = grid([float(value) for value in args.grid.split(',')])
+    else:
+        weights = random_weights(args.samples, args.seed)
+    default = np.array([DEFAULT_WEIGHTS[metric] for metric in METRICS],
+                       dtype=np.float64)
+    weights = np.vstack((default, weights))
+
+    start = time.perf_counter()
+    scores = backtest(leagues, weights, args.processes)
+    elapsed = time.perf_counter() - start
+
+    order = np.argsort(-scores, kind='stable')
+    print('%d weight sets in %.1fs' % (len(weights), elapsed))
+    print('%-8s %s' % ('score', ' '.join('%-12s' % m for m in METRICS)))
+    for idx in order[:args.top]:
+        print('%-8.4f %s' % (scores[idx], ' '.join(
+            '%-12g' % value for value in weights[idx])))
+    place = int(np.flatnonzero(order == 0)[0]) + 1
+    print('default  %.4f, #%d of %d' % (scores[0], place, len(weights)))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump([
+                dict(zip(METRICS, weights[idx].tolist()),
+                     score=float(scores[idx]))
+                for idx in order
+            ], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
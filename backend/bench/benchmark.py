@@ -0,0 +1,357 @@
+"""Benchmark every route in server.py against the local ESPN stand-in.
+
+Starts bench.espn_standin in a subprocess with synthetic leagues of
+different ages and sizes, points the backend at it and, for each league
+and route, reports:
+
+    cold_ms -- one request with empty caches
+    warm_ms -- the same request again
+    p50_ms, p99_ms -- latency of every request in the concurrent run,
+        which starts from empty caches with --clients clients at once
+    upstream -- ESPN requests made by the cold request
+    upstream_kb -- JSON decoded by the cold request
+    peak_rss_mb -- highest resident memory seen while running the route
+
+Results can be saved as a baseline and compared against later runs so
+regressions in the data layer are caught.
+
+Usage:
+    cd backend
+    python -m bench.benchmark
+    python -m bench.benchmark --save before
+    python -m bench.benchmark --compare before --threshold 0.2
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(BACKEND, 'bench', 'baselines')
+
+# league id -> (seasons, teams)
+LEAGUES = {
+    1: (3, 8),
+    2: (12, 12),
+    3: (25, 20),
+}
+
+# metrics where a higher number is a regression, and how they're compared
+TIMED_METRICS = ('cold_ms', 'warm_ms', 'p50_ms', 'p99_ms')
+COUNTED_METRICS = ('upstream', 'upstream_kb')
+
+
+def routes(owners):
+    """Every route in server.py with typical query strings"""
+    return {
+        "/info": "",
+        "/standings": "",
+        "/head-to-head-form": "",
+        "/head-to-head": "team1=" + owners[0] + "&team2=" + owners[1],
+        "/head-to-head-matrix": "",
+        "/individual-weeks": "bestworst=best&count=10&playoffs=true",
+        "/individual-seasons": "bestworst=best&count=10",
+        "/matchups": "bestworst=worst&count=10&playoffs=false",
+        "/power-rankings": "",
+        "/power-rankings-history": "",
+        "/playoff-odds": "seed=1",
+        "/schedule-luck": "permutations=1000&seed=1",
+        "/keepers": "",
+    }
+
+
+def free_port():
+    """Find an unused local port for the stand-in"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_standin(port, leagues, latency, options):
+    """Run the stand-in in its own process so it doesn't share the GIL"""
+    args = [sys.executable, '-m', 'bench.espn_standin', '--port', str(port),
+            '--latency', str(latency),
+            '--tie-rate', str(options["tie_rate"]),
+            '--turnover-rate', str(options["turnover_rate"])]
+    for league_id, (seasons, teams) in leagues.items():
+        args += ['--league', '%d:%dx%d' % (league_id, seasons, teams)]
+    proc = subprocess.Popen(args, cwd=BACKEND, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+    for _attempt in range(100):
+        try:
+            standin_stats('http://127.0.0.1:%d' % port)
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('ESPN stand-in did not start')
+
+
+def standin_stats(base_url, reset=False):
+    """Read, or reset, the stand-in's request counters"""
+    if reset:
+        req = urllib.request.Request(base_url + '/__reset', method='POST')
+    else:
+        req = urllib.request.Request(base_url + '/__stats')
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())
+
+
+class RSSSampler:
+    """Track peak resident memory on a background thread"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss())
+            time.sleep(self.interval)
+
+
+def rss():
+    """Current resident memory in bytes, from /proc on Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, pct):
+    """Nearest rank percentile"""
+    ordered = sorted(values)
+    idx = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def timed_get(client, url):
+    """Make one request and return its latency in milliseconds"""
+    start = time.perf_counter()
+    resp = client.get(url)
+    elapsed = (time.perf_counter() - start) * 1000
+    if resp.status_code != 200:
+        raise RuntimeError(url + ' returned ' + str(resp.status_code))
+    return elapsed
+
+
+def clear_caches():
+    """Empty the response cache and warehouse so requests go upstream"""
+    import cache
+    import identity
+    import power_rankings
+    import scores
+    import warehouse
+    cache.responses.clear()
+    cache.current_seasons.clear()
+    identity.clear()
+    power_rankings.clear()
+    scores.clear()
+    warehouse.clear()
+
+
+def bench_route(app, base_url, url, clients, requests):
+    """Measure a single route for a single league"""
+    result = {}
+    with RSSSampler() as sampler:
+        clear_caches()
+        standin_stats(base_url, reset=True)
+        result["cold_ms"] = timed_get(app.test_client(), url)
+        stats = standin_stats(base_url)
+        result["upstream"] = stats["requests"]
+        result["upstream_kb"] = round(stats["bytes"] / 1024, 1)
+
+        result["warm_ms"] = timed_get(app.test_client(), url)
+
+        clear_caches()
+        latencies = []
+        lock = threading.Lock()
+
+        def client_run():
+            client = app.test_client()
+            for _request in range(requests):
+                elapsed = timed_get(client, url)
+                with lock:
+                    latencies.append(elapsed)
+
+        threads = [threading.Thread(target=client_run) for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        result["p50_ms"] = statistics.median(latencies)
+        result["p99_ms"] = percentile(latencies, 99)
+
+    result["peak_rss_mb"] = round(sampler.peak / 1024 / 1024, 1)
+    for metric in TIMED_METRICS:
+        result[metric] = round(result[metric], 2)
+    return result
+
+
+def run(leagues, latency, clients, requests, options):
+    """Benchmark every route for every league.
+
+    options are passed to bench.synthetic.generate_league, and must match
+    what the stand-in was started with.
+
+    Returns:
+        results (dict) -- "league/route" to metrics
+    """
+    port = free_port()
+    base_url = 'http://127.0.0.1:%d' % port
+    proc = start_standin(port, leagues, latency, options)
+
+    os.environ['ESPN_API_URL'] = base_url + '/apis/v3/games/ffl'
+    scratch = tempfile.mkdtemp(prefix='almanac-bench-')
+    os.environ['ALMANAC_CACHE_DIR'] = os.path.join(scratch, 'cache')
+    os.environ['ALMANAC_WAREHOUSE_PATH'] = os.path.join(scratch,
+                                                        'warehouse.sqlite3')
+    sys.path.insert(0, BACKEND)
+    import server
+    from bench.synthetic import generate_league
+
+    results = {}
+    try:
+        for league_id, (seasons, teams) in leagues.items():
+            league = generate_league(league_id, seasons, teams,
+                                     seed=league_id, **options)
+            # two owners who have played each other, head to head fails
+            # for owners who never met
+            latest = league[max(league)]
+            first_game = next(
+                matchup for matchup in latest["mMatchupScore"]["schedule"]
+                if "away" in matchup
+            )
+            owners = [
+                team["owners"][0]
+                for side in ("away", "home")
+                for team in latest["mNav"]["teams"]
+                if team["id"] == first_game[side]["teamId"]
+            ]
+            name = '%dx%d' % (seasons, teams)
+            for route, query in routes(owners).items():
+                url = route + '?leagueId=' + str(league_id)
+                if query:
+                    url += '&' + query
+                result = bench_route(server.app, base_url, url, clients,
+                                     requests)
+                results[name + ' ' + route] = result
+                print_result(name + ' ' + route, result)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return results
+
+
+def print_result(name, result):
+    """Print one row of the results table"""
+    row = '%-28s' % name
+    for metric in TIMED_METRICS + COUNTED_METRICS + ('peak_rss_mb',):
+        row += ' %-19s' % (metric + '=' + str(result[metric]))
+    print(row.rstrip(), flush=True)
+
+
+def compare(results, baseline, threshold):
+    """Find metrics that got worse than the baseline.
+
+    Timings may grow by up to threshold (0.2 is 20%) before they count as
+    regressions, upstream requests and bytes may not grow at all.
+
+    Returns:
+        regressions (list) -- description of each regression
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        for metric in TIMED_METRICS:
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append('%s %s %s -> %s' % (
+                    name, metric, before[metric], result[metric]))
+        for metric in COUNTED_METRICS:
+            if result[metric] > before[metric]:
+                regressions.append('%s %s %s -> %s' % (
+                    name, metric, before[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--latency', type=float, default=20,
+                        help='milliseconds the stand-in adds per response')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='concurrent clients for p50/p99')
+    parser.add_argument('--requests', type=int, default=5,
+                        help='requests per concurrent client')
+    parser.add_argument('--league', metavar='SEASONSxTEAMS', action='append',
+                        help='league sizes to run instead of the defaults')
+    parser.add_argument('--tie-rate', type=float, default=0.005,
+                        help='fraction of synthetic games that end in a tie')
+    parser.add_argument('--turnover-rate', type=float, default=0.08,
+                        help='chance a synthetic team changes owner each year')
+    parser.add_argument('--save', metavar='NAME',
+                        help='save results as a baseline')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='compare results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown before a timing regresses')
+    args = parser.parse_args()
+
+    leagues = LEAGUES
+    if args.league:
+        leagues = {}
+        for idx, size in enumerate(args.league):
+            seasons, teams = size.split('x')
+            leagues[idx + 1] = (int(seasons), int(teams))
+
+    options = {
+        "tie_rate": args.tie_rate,
+        "turnover_rate": args.turnover_rate,
+    }
+    results = run(leagues, args.latency, args.clients, args.requests, options)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, args.save + '.json')
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Saved baseline to', path)
+
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, args.compare + '.json')
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against', path)
+
+
+if __name__ == '__main__':
+    main()
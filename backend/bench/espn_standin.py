@@ -0,0 +1,374 @@
+"""Local stand-in for the ESPN fantasy API.
+
+Serves the same two URL shapes utils.load_data builds, so the backend can
+be pointed at it with ESPN_API_URL and run with no network:
+
+    /apis/v3/games/{game}/seasons/{year}/segments/0/leagues/{id}?view=...
+    /apis/v3/games/{game}/leagueHistory/{id}?seasonId={year}&view=...
+
+Responses come from one of four sources:
+
+    fixtures -- the sample responses in api/ (ffl) and baseball/api/ (flb)
+    synthetic -- generated leagues from bench.synthetic, see --league
+    replay -- a cassette recorded earlier with --record
+    record -- proxy to the real ESPN API and save every response
+
+Usage:
+    cd backend
+    python -m bench.espn_standin --port 8080 --latency 40 --error-rate 0.01
+    python -m bench.espn_standin --league 1:25x20 --league 2:5x8
+    python -m bench.espn_standin --record cassettes/gridiron.jsonl.gz
+    python -m bench.espn_standin --replay cassettes/gridiron.jsonl.gz
+    ESPN_API_URL=http://localhost:8080/apis/v3/games/ffl \\
+        FLASK_APP=server.py flask run
+"""
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import random
+import threading
+from aiohttp import ClientSession, web
+from bench.synthetic import generate_league
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+FIXTURE_DIRS = {
+    "ffl": os.path.join(ROOT, 'api'),
+    "flb": os.path.join(ROOT, 'baseball', 'api'),
+}
+ESPN_HOST = 'https://lm-api-reads.fantasy.espn.com'
+NOT_FOUND = {
+    "messages": ["Not found"],
+    "details": [{
+        "message": "Not found",
+        "shortMessage": "Not found",
+        "resolution": None,
+        "type": "GENERAL_NOT_FOUND",
+        "metaData": None
+    }]
+}
+
+
+def merge_views(responses):
+    """Merge single view responses the way ESPN merges combined views.
+
+    Top level dicts are merged key by key and the teams lists are merged
+    team by team, so mTeam plus mRoster gives teams with names and rosters.
+    """
+    merged = {}
+    for resp in responses:
+        for key, value in resp.items():
+            if key not in merged:
+                merged[key] = copy.deepcopy(value)
+            elif key == "teams":
+                by_id = {team["id"]: team for team in merged[key]}
+                for team in value:
+                    if team["id"] in by_id:
+                        by_id[team["id"]].update(copy.deepcopy(team))
+                    else:
+                        merged[key].append(copy.deepcopy(team))
+            elif isinstance(value, dict) and isinstance(merged[key], dict):
+                merged[key].update(copy.deepcopy(value))
+            else:
+                merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def request_key(request):
+    """Identify a request by path, sorted query and fantasy filter header"""
+    query = sorted(request.query.items())
+    return json.dumps([
+        request.path,
+        query,
+        request.headers.get('x-fantasy-filter')
+    ])
+
+
+class FixtureSource:
+    """Serve the sample responses for every league and season.
+
+    The samples only cover one season, so seasonId is rewritten to the
+    requested year. Views without a sample are left out of the response.
+    The samples are trimmed down, so routes that match teams across views
+    need a recorded cassette to give real answers.
+    """
+
+    def __init__(self, fixture_dirs=None):
+        self.fixture_dirs = fixture_dirs or FIXTURE_DIRS
+        self._fixtures = {}
+
+    def fixture(self, game, view):
+        """Load and memoize a single sample response"""
+        if (game, view) not in self._fixtures:
+            path = os.path.join(self.fixture_dirs.get(game, ''), view + '.json')
+            resp = None
+            if os.path.exists(path):
+                with open(path) as f:
+                    resp = json.load(f)
+                if isinstance(resp, list):
+                    resp = resp[0]
+            self._fixtures[(game, view)] = resp
+        return self._fixtures[(game, view)]
+
+    async def respond(self, request, league):
+        """Build the response for a parsed league request.
+
+        Returns:
+            resp (tuple) -- status and JSON body
+        """
+        views = [self.fixture(league["game"], view) for view in league["views"]]
+        views = [view for view in views if view is not None]
+        if not views:
+            return 404, NOT_FOUND
+
+        body = merge_views(views)
+        body["seasonId"] = league["year"]
+        body["id"] = league["league_id"]
+        if league["history"]:
+            body = [body]
+        return 200, body
+
+
+class LeagueSource:
+    """Serve generated leagues, such as those from bench.synthetic.
+
+    Merged responses are serialized once and reused so the stand-in adds as
+    little as possible to benchmark timings.
+    """
+
+    def __init__(self, leagues):
+        # league id -> year -> view -> response
+        self.leagues = leagues
+        self._responses = {}
+
+    async def respond(self, request, league):
+        key = (league["league_id"], league["year"], tuple(league["views"]),
+               league["history"])
+        if key not in self._responses:
+            season = self.leagues.get(league["league_id"], {}).get(
+                league["year"]
+            )
+            if season is None:
+                return 404, NOT_FOUND
+
+            body = merge_views(
+                [season[view] for view in league["views"] if view in season]
+            )
+            if league["history"]:
+                body = [body]
+            self._responses[key] = json.dumps(body)
+        return 200, self._responses[key]
+
+
+def parse_league_spec(spec):
+    """Parse a --league value like 1:25x20 into league id, seasons, teams"""
+    league_id, size = spec.split(':')
+    seasons, teams = size.split('x')
+    return int(league_id), int(seasons), int(teams)
+
+
+class ReplaySource:
+    """Serve responses from a cassette recorded by RecordSource"""
+
+    def __init__(self, path):
+        self.entries = {}
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                entry = json.loads(line)
+                self.entries[entry["key"]] = entry
+
+    async def respond(self, request, league):
+        entry = self.entries.get(request_key(request))
+        if entry is None:
+            return 404, NOT_FOUND
+        return entry["status"], json.loads(entry["body"])
+
+
+class RecordSource:
+    """Proxy to the real ESPN API and append every response to a cassette.
+
+    Cassettes are gzipped JSON lines. Each line is appended as its own gzip
+    member so a recording that gets interrupted is still readable.
+    """
+
+    def __init__(self, path, upstream=ESPN_HOST):
+        self.path = path
+        self.upstream = upstream
+        self._lock = threading.Lock()
+        self._session = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    async def respond(self, request, league):
+        if self._session is None:
+            self._session = ClientSession()
+
+        headers = {}
+        for name in ('x-fantasy-filter', 'Cookie'):
+            if name in request.headers:
+                headers[name] = request.headers[name]
+
+        url = self.upstream + request.path_qs
+        async with self._session.get(url, headers=headers) as resp:
+            status = resp.status
+            body = await resp.text()
+
+        entry = {"key": request_key(request), "status": status, "body": body}
+        with self._lock, gzip.open(self.path, 'at') as f:
+            f.write(json.dumps(entry) + '\n')
+        return status, json.loads(body)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def parse_league_request(request):
+    """Pull the game, league, season and views out of a league request"""
+    info = request.match_info
+    query = request.query
+    history = 'year' not in info
+    year = query.get('seasonId') if history else info['year']
+    if year is None:
+        return None
+
+    week = query.get('scoringPeriodId')
+    return {
+        "game": info['game'],
+        "league_id": int(info['league_id']),
+        "year": int(year),
+        "views": query.getall('view', []),
+        "week": int(week) if week else None,
+        "history": history,
+    }
+
+
+def create_app(source, latency=0, jitter=0, error_rate=0, error_status=503,
+               seed=None):
+    """Create the stand-in web app.
+
+    Arguments:
+        source (object) -- FixtureSource, ReplaySource or RecordSource, or
+            anything else with an async respond(request, league) method
+        latency (float) -- milliseconds added to every response
+        jitter (float) -- up to this many extra random milliseconds
+        error_rate (float) -- fraction of requests that fail on purpose
+        error_status (int) -- HTTP status of the injected failures
+        seed (int or None) -- seed for jitter and error injection
+
+    Returns:
+        app (web.Application) -- the aiohttp app, serve with web.run_app
+    """
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0, "bytes": 0, "views": {}}
+
+    async def league(request):
+        parsed = parse_league_request(request)
+        if parsed is None:
+            return web.json_response(NOT_FOUND, status=404)
+
+        stats["requests"] += 1
+        for view in parsed["views"]:
+            stats["views"][view] = stats["views"].get(view, 0) + 1
+
+        delay = latency + (rng.uniform(0, jitter) if jitter else 0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response(
+                {"messages": ["Injected error"]}, status=error_status
+            )
+
+        status, body = await source.respond(request, parsed)
+        text = body if isinstance(body, str) else json.dumps(body)
+        stats["bytes"] += len(text)
+        return web.Response(
+            text=text, status=status, content_type='application/json'
+        )
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    async def reset_stats(request):
+        stats.update({"requests": 0, "errors": 0, "bytes": 0, "views": {}})
+        return web.json_response(stats)
+
+    async def close_source(app):
+        if hasattr(source, 'close'):
+            await source.close()
+
+    app = web.Application()
+    app.router.add_get(
+        '/apis/v3/games/{game}/seasons/{year:\\d+}/segments/0/leagues/'
+        '{league_id:\\d+}',
+        league
+    )
+    app.router.add_get(
+        '/apis/v3/games/{game}/leagueHistory/{league_id:\\d+}', league
+    )
+    app.router.add_get('/__stats', get_stats)
+    app.router.add_post('/__reset', reset_stats)
+    app.on_cleanup.append(close_source)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='up to this many extra random milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests that fail on purpose')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=None)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--league', metavar='ID:SEASONSxTEAMS',
+                        action='append',
+                        help='serve a synthetic league, e.g. 1:25x20')
+    source.add_argument('--replay', metavar='CASSETTE',
+                        help='serve responses from a recorded cassette')
+    source.add_argument('--record', metavar='CASSETTE',
+                        help='proxy to ESPN and record every response')
+    parser.add_argument('--upstream', default=ESPN_HOST,
+                        help='ESPN host to proxy to when recording')
+    parser.add_argument('--tie-rate', type=float, default=0.005,
+                        help='fraction of synthetic games that end in a tie')
+    parser.add_argument('--turnover-rate', type=float, default=0.08,
+                        help='chance a synthetic team changes owner each year')
+    parser.add_argument('--playoff-teams', type=int, default=None,
+                        help='teams in each synthetic playoff bracket')
+    args = parser.parse_args()
+
+    if args.league:
+        leagues = {}
+        for spec in args.league:
+            league_id, seasons, teams = parse_league_spec(spec)
+            leagues[league_id] = generate_league(
+                league_id, seasons, teams, seed=league_id,
+                playoff_teams=args.playoff_teams, tie_rate=args.tie_rate,
+                turnover_rate=args.turnover_rate
+            )
+        source = LeagueSource(leagues)
+    elif args.replay:
+        source = ReplaySource(args.replay)
+    elif args.record:
+        source = RecordSource(args.record, args.upstream)
+    else:
+        source = FixtureSource()
+
+    app = create_app(source, args.latency, args.jitter, args.error_rate,
+                     args.error_status, args.seed)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
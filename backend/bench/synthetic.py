@@ -0,0 +1,467 @@
+"""Synthetic ESPN league history for benchmarks and the stand-in server.
+
+Builds every view the backend reads (mStatus, mNav, mTeam, mSettings,
+mMatchupScore, mRoster and mDraftDetail) for each season of a made up
+league, shaped like the samples in api/. Leagues can be any size and
+include the awkward parts of real league history:
+
+    playoff brackets -- seeded WINNERS_BRACKET rounds with first round byes
+        for the top seeds, a third place game and a LOSERS_CONSOLATION_LADDER
+        for teams that missed the playoffs
+    byes -- leagues with an odd number of teams have a home-only matchup
+        every week
+    ties -- a fraction of games end level and have winner TIE
+    owner turnover -- members leave and new members take over their team,
+        and members change their names, between seasons
+
+Usage:
+    cd backend
+    python -m bench.synthetic --seasons 25 --teams 20 --out /tmp/league
+"""
+import argparse
+import json
+import math
+import os
+import random
+from datetime import date, datetime
+
+ROSTER_SIZE = 16
+DRAFT_ROUNDS = 12
+# teams are seeded by record, ESPN's playoffSeedingRule is what breaks a
+# tie in record, here total points for
+SEEDING_RULE = "TOTAL_POINTS_SCORED"
+FIRST_NAMES = ['Joe', 'Mike', 'Chris', 'Matt', 'Dave', 'Nick', 'Ryan',
+               'Kevin', 'Brian', 'Steve', 'Dan', 'Tom', 'Jeff', 'Andy']
+LAST_NAMES = ['Blow', 'Smith', 'Jones', 'Miller', 'Davis', 'Wilson',
+              'Moore', 'Taylor', 'Clark', 'Lewis', 'Walker', 'Hall']
+NICKNAMES = ['Sharks', 'Gruden Says', 'Laces Out', 'Urban Achievers',
+             'Tush Push', 'Waiver Wire', 'Bench Warmers', 'Sleepers',
+             'Handcuffs', 'Fumblers', 'Bye Weeks', 'Goal Liners']
+
+
+def owner_id(rng):
+    """Make an ESPN style member ID"""
+    return '{%08X-%04X-%04X-%04X-%012X}' % (
+        rng.getrandbits(32), rng.getrandbits(16), rng.getrandbits(16),
+        rng.getrandbits(16), rng.getrandbits(48)
+    )
+
+
+def new_member(rng):
+    """Make a league member with a random name"""
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    return {
+        "id": owner_id(rng),
+        "firstName": first.lower(),
+        "lastName": last.lower(),
+        "displayName": (first + last).lower() + str(rng.randint(1, 99)),
+        "isLeagueManager": False,
+    }
+
+
+def epoch_ms(year, month, day):
+    """Milliseconds since the epoch, the way ESPN stores dates"""
+    return int(datetime(year, month, day).timestamp() * 1000)
+
+
+def round_robin(team_ids, weeks):
+    """Pair teams every week with the circle method.
+
+    With an odd number of teams one team sits out each week, returned as
+    a pair with None for the away team.
+    """
+    ids = list(team_ids)
+    if len(ids) % 2:
+        ids.append(None)
+    schedule = []
+    for _week in range(weeks):
+        half = len(ids) // 2
+        pairs = []
+        for i in range(half):
+            away, home = ids[i], ids[-i - 1]
+            if home is None:
+                away, home = home, away
+            pairs.append((away, home))
+        schedule.append(pairs)
+        ids = [ids[0]] + [ids[-1]] + ids[1:-1]
+    return schedule
+
+
+def generate_league(league_id=1, seasons=10, teams=10, end_year=None, seed=0,
+                    current_week=8, regular_season_weeks=13,
+                    playoff_teams=None, tie_rate=0.005, turnover_rate=0.08,
+                    rename_rate=0.05):
+    """Generate a league's full history.
+
+    Arguments:
+        league_id (int) -- ESPN league ID to use in the responses
+        seasons (int) -- number of seasons, ending with end_year
+        teams (int) -- teams in the league
+        end_year (int or None) -- the current season, this year by default
+        seed (int) -- seed for scores, names and IDs
+        current_week (int) -- matchup period the current season is in
+        regular_season_weeks (int) -- matchup periods before the playoffs
+        playoff_teams (int or None) -- teams that make the playoffs, about
+            half the league by default
+        tie_rate (float) -- fraction of games that end in a tie
+        turnover_rate (float) -- chance each season that a team gets a new
+            owner
+        rename_rate (float) -- chance each season that an owner changes
+            their name
+
+    Returns:
+        league (dict) -- year to view name to response
+    """
+    rng = random.Random(seed)
+    end_year = end_year or date.today().year
+    start_year = end_year - seasons + 1
+    if playoff_teams is None:
+        playoff_teams = max(2, min(teams, 2 * (teams // 4)))
+
+    members = [new_member(rng) for _team in range(teams)]
+    strengths = [rng.gauss(110, 8) for _team in range(teams)]
+
+    league = {}
+    for year in range(start_year, end_year + 1):
+        if year > start_year:
+            for idx in range(teams):
+                if rng.random() < turnover_rate:
+                    members[idx] = new_member(rng)
+                    strengths[idx] = rng.gauss(110, 8)
+                elif rng.random() < rename_rate:
+                    members[idx] = dict(
+                        members[idx],
+                        firstName=rng.choice(FIRST_NAMES).lower(),
+                        lastName=rng.choice(LAST_NAMES).lower(),
+                    )
+                # teams drift a little from year to year
+                strengths[idx] += rng.gauss(0, 4)
+
+        week = current_week if year == end_year else None
+        league[year] = generate_season(
+            rng, league_id, year, start_year, list(members), strengths, week,
+            regular_season_weeks, playoff_teams, tie_rate
+        )
+    return league
+
+
+def play(rng, strengths, away, home, tie_rate):
+    """Score a game between two teams.
+
+    Returns:
+        game (tuple) -- away points, home points and the winner
+    """
+    away_pts = round(max(30, rng.gauss(strengths[away - 1], 25)), 2)
+    if rng.random() < tie_rate:
+        home_pts = away_pts
+    else:
+        home_pts = round(max(30, rng.gauss(strengths[home - 1], 25)), 2)
+
+    if away_pts > home_pts:
+        return away_pts, home_pts, "AWAY"
+    elif home_pts > away_pts:
+        return away_pts, home_pts, "HOME"
+    return away_pts, home_pts, "TIE"
+
+
+def matchup_side(team_id, points, period):
+    """One side of an mMatchupScore matchup"""
+    return {
+        "adjustment": 0.0,
+        "cumulativeScore": {"losses": 0, "statBySlot": None, "ties": 0,
+                            "wins": 0},
+        "pointsByScoringPeriod": {str(period): points},
+        "teamId": team_id,
+        "tiebreak": 0.0,
+        "totalPoints": points,
+    }
+
+
+def generate_season(rng, league_id, year, start_year, members, strengths,
+                    week, regular_season_weeks, playoff_teams, tie_rate):
+    """Generate every view for one season.
+
+    A week of None means the season is over, otherwise week is the current
+    matchup period and only earlier periods have been played.
+    """
+    team_ids = list(range(1, len(members) + 1))
+    playoff_rounds = max(1, math.ceil(math.log2(playoff_teams)))
+    total_weeks = regular_season_weeks + playoff_rounds
+    complete = week is None
+    if complete:
+        week = total_weeks + 1
+
+    schedule = []
+    # team id -> wins, losses, ties, points for, points against
+    records = {team_id: [0, 0, 0, 0.0, 0.0] for team_id in team_ids}
+
+    def add_matchup(period, tier, away, home):
+        """Play a game if the period is over and add it to the schedule"""
+        played = period < week
+        if away is None:
+            schedule.append({
+                "id": len(schedule),
+                "matchupPeriodId": period,
+                "playoffTierType": tier,
+                "winner": "UNDECIDED",
+                "home": matchup_side(home, 0, period),
+            })
+            return None
+
+        if played:
+            away_pts, home_pts, winner = play(rng, strengths, away, home,
+                                              tie_rate)
+        else:
+            away_pts, home_pts, winner = 0, 0, "UNDECIDED"
+
+        schedule.append({
+            "id": len(schedule),
+            "matchupPeriodId": period,
+            "playoffTierType": tier,
+            "winner": winner,
+            "away": matchup_side(away, away_pts, period),
+            "home": matchup_side(home, home_pts, period),
+        })
+        if played and tier == "NONE":
+            update_records(records, away, home, away_pts, home_pts, winner)
+        return winner
+
+    for idx, pairs in enumerate(round_robin(team_ids, regular_season_weeks)):
+        for away, home in pairs:
+            add_matchup(idx + 1, "NONE", away, home)
+
+    # win percentage, then SEEDING_RULE
+    seeds = sorted(team_ids, key=lambda t: (
+        -(records[t][0] + records[t][2] / 2), -records[t][3]
+    ))
+
+    final_ranks = {}
+    if week > regular_season_weeks + 1:
+        final_ranks = play_playoffs(
+            seeds, playoff_teams, playoff_rounds, regular_season_weeks, week,
+            add_matchup
+        )
+
+    return season_views(
+        rng, league_id, year, start_year, members, team_ids, schedule,
+        records, seeds, final_ranks if complete else {}, week, total_weeks,
+        regular_season_weeks, playoff_teams
+    )
+
+
+def update_records(records, away, home, away_pts, home_pts, winner):
+    """Add a regular season result to both teams' records"""
+    if winner == "TIE":
+        records[away][2] += 1
+        records[home][2] += 1
+    else:
+        winner_id, loser_id = (away, home) if winner == "AWAY" else (home, away)
+        records[winner_id][0] += 1
+        records[loser_id][1] += 1
+    records[away][3] += away_pts
+    records[away][4] += home_pts
+    records[home][3] += home_pts
+    records[home][4] += away_pts
+
+
+def play_playoffs(seeds, playoff_teams, playoff_rounds, regular_season_weeks,
+                  week, add_matchup):
+    """Play the winners bracket and consolation games.
+
+    Top seeds get byes in the first round when the bracket isn't full.
+    Every round the best remaining seed plays the worst. Teams knocked out
+    play WINNERS_CONSOLATION_LADDER games against teams that went out in
+    the same round or close to it, so the last round has a third place
+    game, and teams that missed the playoffs play LOSERS_CONSOLATION_LADDER
+    games.
+
+    Returns:
+        final_ranks (dict) -- team id to final place
+    """
+    alive = seeds[:playoff_teams]
+    # latest eliminated first, then by seed
+    knocked_out = []
+    non_playoff = seeds[playoff_teams:]
+    byes = 2 ** playoff_rounds - playoff_teams
+
+    for round_idx in range(playoff_rounds):
+        period = regular_season_weeks + round_idx + 1
+        if period >= week:
+            break
+
+        playing = alive
+        if round_idx == 0 and byes:
+            for team_id in alive[:byes]:
+                add_matchup(period, "WINNERS_BRACKET", None, team_id)
+            playing = alive[byes:]
+
+        advancing = alive[:byes] if round_idx == 0 else []
+        eliminated = []
+        half = len(playing) // 2
+        for high, low in zip(playing[:half], reversed(playing[half:])):
+            winner = add_matchup(period, "WINNERS_BRACKET", low, high)
+            # ties in the playoffs go to the higher seed
+            if winner == "AWAY":
+                advancing.append(low)
+                eliminated.append(high)
+            else:
+                advancing.append(high)
+                eliminated.append(low)
+
+        for tier, teams in (("WINNERS_CONSOLATION_LADDER", knocked_out),
+                            ("LOSERS_CONSOLATION_LADDER", non_playoff)):
+            for away, home in zip(teams[1::2], teams[0::2]):
+                winner = add_matchup(period, tier, away, home)
+                # the first consolation game of the last round is for third
+                if (round_idx == playoff_rounds - 1 and winner == "AWAY" and
+                        teams is knocked_out and home == knocked_out[0]):
+                    knocked_out[0], knocked_out[1] = away, home
+
+        alive = [t for t in seeds if t in advancing]
+        knocked_out = [t for t in seeds if t in eliminated] + knocked_out
+
+    final_ranks = {}
+    for place, team_id in enumerate(alive + knocked_out + non_playoff):
+        final_ranks[team_id] = place + 1
+    return final_ranks
+
+
+def season_views(rng, league_id, year, start_year, members, team_ids,
+                 schedule, records, seeds, final_ranks, week, total_weeks,
+                 regular_season_weeks, playoff_teams):
+    """Assemble the responses for every view of a season"""
+    complete = week > total_weeks
+    status = {
+        "currentMatchupPeriod": min(week, total_weeks),
+        "finalScoringPeriod": total_weeks,
+        "firstScoringPeriod": 1,
+        "isActive": not complete,
+        "isExpired": False,
+        "latestScoringPeriod": week,
+        "previousSeasons": list(range(start_year, year)),
+        "teamsJoined": len(team_ids),
+    }
+    base = {
+        "gameId": 1,
+        "id": league_id,
+        "scoringPeriodId": week,
+        "seasonId": year,
+        "segmentId": 0,
+        "status": status,
+        "draftDetail": {"drafted": True, "inProgress": False},
+    }
+    name = "Synthetic League " + str(league_id)
+    draft_date = epoch_ms(year, 9, 1)
+    deadline = epoch_ms(year, 11, 15)
+
+    nav_teams = []
+    full_teams = []
+    roster_teams = []
+    picks = []
+    for team_id, member in zip(team_ids, members):
+        nickname = NICKNAMES[(team_id + year) % len(NICKNAMES)]
+        nav_team = {
+            "id": team_id,
+            "abbrev": "T" + str(team_id),
+            "location": member["firstName"].capitalize() + "'s",
+            "nickname": nickname,
+            "logo": "https://example.com/logos/" + str(team_id) + ".png",
+            "owners": [member["id"]],
+        }
+        nav_teams.append(nav_team)
+
+        wins, losses, ties, points_for, points_against = records[team_id]
+        games = wins + losses + ties
+        full_teams.append(dict(
+            nav_team,
+            primaryOwner=member["id"],
+            playoffSeed=seeds.index(team_id) + 1,
+            rankCalculatedFinal=final_ranks.get(team_id, 0),
+            record={"overall": {
+                "wins": wins,
+                "losses": losses,
+                "ties": ties,
+                "percentage": round(wins / games, 4) if games else 0,
+                "pointsFor": round(points_for, 2),
+                "pointsAgainst": round(points_against, 2),
+            }},
+        ))
+
+        entries = []
+        for slot in range(ROSTER_SIZE):
+            player_id = year * 10000 + team_id * 100 + slot
+            drafted = slot < DRAFT_ROUNDS
+            acquired = draft_date if drafted else rng.randint(
+                draft_date, deadline + 30 * 86400000
+            )
+            entries.append({
+                "acquisitionDate": acquired,
+                "acquisitionType": "DRAFT" if drafted else "ADD",
+                "playerPoolEntry": {"player": {
+                    "id": player_id,
+                    "fullName": "Player " + str(player_id),
+                }},
+            })
+            if drafted:
+                picks.append({
+                    "playerId": player_id,
+                    "roundId": slot + 1,
+                    "teamId": team_id,
+                })
+        roster_teams.append({"id": team_id, "roster": {"entries": entries}})
+
+    settings = {
+        "name": name,
+        "size": len(team_ids),
+        "scheduleSettings": {
+            "matchupPeriodCount": regular_season_weeks,
+            "playoffMatchupPeriodLength": 1,
+            "playoffSeedingRule": SEEDING_RULE,
+            "playoffSeedingRuleBy": 0,
+            "playoffTeamCount": playoff_teams,
+        },
+        "tradeSettings": {"deadlineDate": deadline},
+    }
+
+    return {
+        "mStatus": dict(base),
+        "mNav": dict(base, members=members, settings={"name": name},
+                     teams=nav_teams),
+        "mTeam": dict(base, members=members, teams=full_teams),
+        "mSettings": dict(base, settings=settings),
+        "mMatchupScore": dict(base, schedule=schedule),
+        "mRoster": dict(base, teams=roster_teams),
+        "mDraftDetail": dict(base, settings={"name": name},
+                             draftDetail=dict(base["draftDetail"], picks=picks)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--league-id', type=int, default=1)
+    parser.add_argument('--seasons', type=int, default=10)
+    parser.add_argument('--teams', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--current-week', type=int, default=8)
+    parser.add_argument('--tie-rate', type=float, default=0.005)
+    parser.add_argument('--turnover-rate', type=float, default=0.08)
+    parser.add_argument('--out', required=True,
+                        help='directory to write {year}/{view}.json files to')
+    args = parser.parse_args()
+
+    league = generate_league(
+        args.league_id, args.seasons, args.teams, seed=args.seed,
+        current_week=args.current_week, tie_rate=args.tie_rate,
+        turnover_rate=args.turnover_rate
+    )
+    for year, views in league.items():
+        directory = os.path.join(args.out, str(year))
+        os.makedirs(directory, exist_ok=True)
+        for view, resp in views.items():
+            with open(os.path.join(directory, view + '.json'), 'w') as f:
+                json.dump(resp, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
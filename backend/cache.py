@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get(
+    'ALMANAC_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+)
+MEMORY_ENTRIES = int(os.environ.get('ALMANAC_CACHE_ENTRIES', 512))
+DISK_BYTES = int(os.environ.get('ALMANAC_CACHE_BYTES', 256 * 1024 * 1024))
+
+# seconds current season data stays fresh, depending on season status
+CURRENT_SEASON_TTL = {
+    "preseason": 60 * 60,
+    "drafted": 5 * 60,
+    "active": 60,
+    "postseason": 60 * 60,
+}
+# used until the current season for a league is known
+DEFAULT_TTL = 60
+
+# league id -> (current season, season status), set by utils.season_status
+current_seasons = {}
+
+
+def key(league_id, year, view, week=None, headers=None):
+    """Build the cache key for a single ESPN API response.
+
+    Arguments:
+        league_id (str or int) -- ESPN league ID
+        year (int) -- season the data is for
+        view (str) -- the endpoint view, mTeam, mRoster, etc.
+        week (int or None) -- scoringPeriodId passed to the endpoint
+        headers (object or None) -- headers included in the request
+
+    Returns:
+        key (tuple) -- every input that shapes the response
+    """
+    fantasy_filter = (headers or {}).get('x-fantasy-filter')
+    return (str(league_id), int(year), view, week, fantasy_filter)
+
+
+def set_current_season(league_id, season, status):
+    """Record the current season and its status for a league"""
+    current_seasons[str(league_id)] = (season, status)
+
+
+def completed(league_id, year):
+    """Check if a season is before the league's current season"""
+    if str(league_id) not in current_seasons:
+        return False
+    season, _status = current_seasons[str(league_id)]
+    return int(year) < season
+
+
+def ttl(league_id, year):
+    """Determine how long a response for the given season stays fresh.
+
+    Completed seasons never change so they are cached forever. The current
+    season gets a short TTL that depends on where it is in the season.
+
+    Returns:
+        ttl (int or None) -- seconds until the entry expires, None for never
+    """
+    if str(league_id) not in current_seasons:
+        return DEFAULT_TTL
+    if completed(league_id, year):
+        return None
+
+    _season, status = current_seasons[str(league_id)]
+    return CURRENT_SEASON_TTL.get(status, DEFAULT_TTL)
+
+
+class ResponseCache:
+    """Two tier cache of decoded ESPN responses.
+
+    The first tier is an in-process LRU of decoded objects bounded by entry
+    count. The second tier is a directory of JSON files bounded by total
+    bytes, evicting the least recently used files first. Values returned
+    from the memory tier are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_entries=MEMORY_ENTRIES,
+                 max_bytes=DISK_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Find a fresh value for key, checking memory then disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > now:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+        entry = self._read_disk(key, now)
+        if entry is None:
+            return None
+
+        with self._lock:
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key, value, ttl=None):
+        """Store value in both tiers, expiring after ttl seconds if given"""
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._remember(key, (expires, value))
+        self._write_disk(key, expires, value)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            self._disk_bytes = 0
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _remember(self, key, entry):
+        """Add entry to the memory tier and evict the least recently used"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        """Map a key to its file in the disk tier"""
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def _read_disk(self, key, now):
+        """Load an entry from disk, or None if missing or expired.
+
+        Files hold the expiry timestamp on the first line and the JSON
+        response on the rest.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires = json.loads(f.readline())
+                if expires is not None and expires <= now:
+                    return None
+                value = json.loads(f.read())
+            # bump mtime so eviction treats the file as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return (expires, value)
+
+    def _write_disk(self, key, expires, value):
+        """Write an entry to disk and evict files over the byte budget"""
+        path = self._path(key)
+        body = (json.dumps(expires) + '\n' + json.dumps(value)).encode('utf-8')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._disk_usage()
+            else:
+                self._disk_bytes += len(body) - previous
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+
+    def _disk_usage(self):
+        """Total bytes used by the disk tier"""
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                total += entry.stat().st_size
+        return total
+
+    def _evict_disk(self):
+        """Remove least recently used files until under the byte budget"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+
+        total = sum(size for _mtime, size, _path in files)
+        for _mtime, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+responses = ResponseCache()
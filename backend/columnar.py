@@ -0,0 +1,211 @@
+import identity
+import numpy as np
+from utils import is_bye_week, weeks_in_season
+
+TIERS = ('NONE', 'WINNERS_BRACKET', 'WINNERS_CONSOLATION_LADDER',
+         'LOSERS_CONSOLATION_LADDER')
+
+
+class MatchupTable:
+    """Every finished matchup of a league as numpy columns.
+
+    There are two rows per matchup, one for each team, in schedule order:
+    by year, then position in the schedule, away team first. Queries are
+    boolean masks over the columns plus a partial sort for the top rows, so
+    they cost the same whether the league is three seasons old or thirty.
+
+    Strings are stored once in the names, owners and tiers lists and the
+    columns hold their index.
+    """
+
+    def __init__(self, matchups):
+        """Build the columns.
+
+        Arguments:
+            matchups (iterable) -- one tuple per matchup of year, week,
+                tier, regular, away team ID, home team ID, away owner ID,
+                home owner ID, away points, home points, margin, away team
+                name and home team name
+        """
+        self.names = []
+        self.owners = []
+        self.tiers = list(TIERS)
+        name_idx = {}
+        owner_idx = {}
+        tier_idx = {tier: idx for idx, tier in enumerate(self.tiers)}
+
+        def index(value, lookup, values):
+            if value not in lookup:
+                lookup[value] = len(values)
+                values.append(value)
+            return lookup[value]
+
+        columns = {column: [] for column in (
+            'year', 'week', 'tier', 'regular', 'home', 'team_id', 'owner',
+            'opponent', 'points', 'opponent_points', 'margin', 'name',
+            'opponent_name'
+        )}
+        for (year, week, tier, regular, away_id, home_id, away_owner,
+             home_owner, away_pts, home_pts, margin, away_name,
+             home_name) in matchups:
+            sides = (
+                (False, away_id, away_owner, home_owner, away_pts, home_pts,
+                 away_name, home_name),
+                (True, home_id, home_owner, away_owner, home_pts, away_pts,
+                 home_name, away_name),
+            )
+            for (home, team_id, owner, opponent, pts, opp_pts, name,
+                 opp_name) in sides:
+                columns['year'].append(year)
+                columns['week'].append(week)
+                columns['tier'].append(index(tier, tier_idx, self.tiers))
+                columns['regular'].append(regular)
+                columns['home'].append(home)
+                columns['team_id'].append(team_id)
+                columns['owner'].append(index(owner, owner_idx, self.owners))
+                columns['opponent'].append(
+                    index(opponent, owner_idx, self.owners)
+                )
+                columns['points'].append(pts)
+                columns['opponent_points'].append(opp_pts)
+                columns['margin'].append(margin)
+                columns['name'].append(index(name, name_idx, self.names))
+                columns['opponent_name'].append(
+                    index(opp_name, name_idx, self.names)
+                )
+
+        self.year = np.array(columns['year'], dtype=np.int32)
+        self.week = np.array(columns['week'], dtype=np.int32)
+        self.tier = np.array(columns['tier'], dtype=np.int8)
+        self.regular = np.array(columns['regular'], dtype=bool)
+        self.home = np.array(columns['home'], dtype=bool)
+        self.team_id = np.array(columns['team_id'], dtype=np.int32)
+        self.owner = np.array(columns['owner'], dtype=np.int32)
+        self.opponent = np.array(columns['opponent'], dtype=np.int32)
+        self.points = np.array(columns['points'], dtype=np.float64)
+        self.opponent_points = np.array(columns['opponent_points'],
+                                        dtype=np.float64)
+        self.margin = np.array(columns['margin'], dtype=np.float64)
+        self.name = np.array(columns['name'], dtype=np.int32)
+        self.opponent_name = np.array(columns['opponent_name'],
+                                      dtype=np.int32)
+
+    def __len__(self):
+        return len(self.year)
+
+    @classmethod
+    def from_bundle(cls, start_year, end_year, bundle):
+        """Build a table from the mSettings, mMatchupScore and mNav views.
+
+        Only weeks that have finished are included and byes are left out.
+        """
+        matchups = []
+        for year in range(int(start_year), int(end_year) + 1):
+            settings = bundle[(year, 'mSettings')]
+            total_weeks = weeks_in_season(settings, True)
+            regular_weeks = (
+                settings["settings"]["scheduleSettings"]["matchupPeriodCount"]
+            )
+            teams = identity.season_teams(bundle[(year, 'mNav')])
+
+            for matchup in bundle[(year, 'mMatchupScore')]["schedule"]:
+                week = matchup["matchupPeriodId"]
+                if week > total_weeks:
+                    break
+
+                if is_bye_week(matchup):
+                    continue
+
+                away = matchup["away"]
+                home = matchup["home"]
+                matchups.append((
+                    year, week, matchup["playoffTierType"],
+                    week <= regular_weeks, away["teamId"], home["teamId"],
+                    teams.owner(away["teamId"]), teams.owner(home["teamId"]),
+                    away["totalPoints"], home["totalPoints"],
+                    round(abs(away["totalPoints"] - home["totalPoints"]), 2),
+                    teams.name(away["teamId"]),
+                    teams.name(home["teamId"])
+                ))
+        return cls(matchups)
+
+    def mask(self, start_year, end_year, playoffs):
+        """Select team-games in a range of seasons.
+
+        Arguments:
+            start_year (int) -- the first year to include
+            end_year (int) -- the last year to include
+            playoffs (bool) -- whether or not to include playoff weeks
+        """
+        selected = (self.year >= int(start_year)) & (self.year <= int(end_year))
+        if not playoffs:
+            selected &= self.regular
+        return selected
+
+    def top(self, key, selected, count):
+        """Find the rows with the smallest key.
+
+        Only the best `count` rows are sorted. Equal keys keep table order,
+        the same as a stable sort of every row.
+
+        Returns:
+            rows (ndarray) -- row indexes, best first
+        """
+        rows = np.flatnonzero(selected)
+        if count <= 0 or rows.size == 0:
+            return rows[:0]
+
+        keys = key[rows]
+        if count < rows.size:
+            kth = keys[np.argpartition(keys, count - 1)[count - 1]]
+            # keep every row tied with the kth so ties resolve in order
+            keep = keys <= kth
+            rows = rows[keep]
+            keys = keys[keep]
+        return rows[np.lexsort((rows, keys))[:count]]
+
+    def weeks(self, start_year, end_year, playoffs, count, highest):
+        """Find the highest or lowest single week scores.
+
+        Returns:
+            scores (list) -- year, week, team_name and score of each week
+        """
+        selected = self.mask(start_year, end_year, playoffs)
+        key = -self.points if highest else self.points
+        return [
+            {
+                "year": int(self.year[row]),
+                "week": int(self.week[row]),
+                "team_name": self.names[self.name[row]],
+                "score": float(self.points[row]),
+            }
+            for row in self.top(key, selected, count)
+        ]
+
+    def margins(self, start_year, end_year, playoffs, count, blowouts):
+        """Find the biggest or smallest margins of victory.
+
+        Consolation games for teams out of the playoffs aren't included.
+        Ties count as a win for the home team.
+
+        Returns:
+            matchups (list) -- year, week, difference, winner and loser
+        """
+        selected = self.mask(start_year, end_year, playoffs)
+        selected &= ~self.home
+        selected &= self.tier != self.tiers.index('LOSERS_CONSOLATION_LADDER')
+        key = -self.margin if blowouts else self.margin
+
+        results = []
+        for row in self.top(key, selected, count):
+            away_won = self.points[row] > self.opponent_points[row]
+            away_name = self.names[self.name[row]]
+            home_name = self.names[self.opponent_name[row]]
+            results.append({
+                "year": int(self.year[row]),
+                "week": int(self.week[row]),
+                "difference": float(self.margin[row]),
+                "winner": away_name if away_won else home_name,
+                "loser": home_name if away_won else away_name,
+            })
+        return results
@@ -1,18 +1,22 @@
-import aiohttp
+import http_client
+import identity
+import numpy as np
+import rivalries
+import warehouse
+from columnar import MatchupTable
+from flask import session
+from planner import FetchPlan
 from utils import (
-    is_bye_week,
     latest_season,
-    load_matchups,
-    number_of_weeks,
-    compare_lists,
     load_data,
     team_name,
-    fantasy_team_logo,
-    current_streak,
-    longest_streak
+    fantasy_team_logo
 )
 from decimal import Decimal
 
+# views needed from every season for the head to head matrix
+SEASON_VIEWS = ('mSettings', 'mMatchupScore', 'mNav')
+
 
 async def options():
     """Get current team name and owner ID for all active teams.
@@ -27,7 +31,7 @@ async def options():
             {...},
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
+    async with http_client.session() as http_session:
         year = await latest_season(http_session)
         teams_res = await load_data(year, 'mNav', http_session)
         teams = teams_res["teams"]
@@ -40,44 +44,97 @@ async def options():
         return team_options
 
 
-async def add_scores(matchup, data, away_oid, home_oid, away_pts, home_pts, winners):
-    """Check the details of a matchup and add scores to data object.
+class HeadToHeadMatrix:
+    """Head to head records between every pair of owners in a league.
 
-    This is a helper for the all_time function.
+    Any pair is a dict lookup into the entries, see rivalries.py for what
+    each one holds.
+    """
 
-    Arguments:
-        matchup (object) -- the matchup object from mMatchupScore api
-        data (object) -- the full data object from all_time function
-        away_oid (str) -- the owner ID of the away team
-        home_oid (str) -- the owner ID of the home team
-        away_pts (float) -- points scored by away team
-        home_pts (float) -- points scored by home team
-        winners (list) -- array of winning teams for each matchup
+    def __init__(self, entries, last_names):
+        """
+        Arguments:
+            entries (dict) -- pair key to rivalries entry
+            last_names (dict) -- owner ID to the name of their team in the
+                latest season they played, in the order owners joined
+        """
+        self.entries = entries
+        self.last_names = last_names
+
+    @classmethod
+    def from_bundle(cls, start_year, end_year, bundle):
+        """Build the matrix from the mSettings, mMatchupScore and mNav views"""
+        table = MatchupTable.from_bundle(start_year, end_year, bundle)
+        entries = {}
+        # away rows are always followed by the home row of the same matchup
+        away = np.flatnonzero(~table.home)
+        games = zip(
+            table.owner[away].tolist(), table.opponent[away].tolist(),
+            table.team_id[away].tolist(), table.team_id[away + 1].tolist(),
+            table.points[away].tolist(), table.opponent_points[away].tolist(),
+            table.tier[away].tolist()
+        )
+        for (away_owner, home_owner, away_team, home_team, away_pts,
+             home_pts, tier) in games:
+            away_owner = table.owners[away_owner]
+            home_owner = table.owners[home_owner]
+            if away_owner is None or home_owner is None:
+                continue
+            key = rivalries.pair_key(away_owner, home_owner)
+            if key not in entries:
+                entries[key] = rivalries.new_entry(key)
+            rivalries.add_matchup(
+                entries[key], away_owner, home_owner, away_team, home_team,
+                Decimal(str(away_pts)), Decimal(str(home_pts)),
+                table.tiers[tier]
+            )
+
+        last_names = {}
+        for year in range(int(start_year), int(end_year) + 1):
+            teams = identity.season_teams(bundle[(year, 'mNav')]).teams
+            for team in teams.values():
+                if team["owner_id"] is not None:
+                    last_names[team["owner_id"]] = team["name"]
+        return cls(entries, last_names)
+
+    def pair(self, owner_id_1, owner_id_2):
+        """Look up two owners by ID, in either order.
+
+        Returns:
+            entry (dict or None) -- the pair's entry, None if they never met
+        """
+        return self.entries.get(rivalries.pair_key(owner_id_1, owner_id_2))
+
+    def streak(self, entry, name):
+        """Format a pair's current_streak or longest_streak"""
+        owner, length = entry[name] if entry else (None, 0)
+        return {
+            "team": owner,
+            "length": length
+        }
+
+
+async def load_matrix(end_year, current_info, http_session):
+    """Get the head to head matrix from the first season to end_year.
+
+    With the warehouse, past seasons are joined from their stored
+    aggregates and only this season's are added on top. Otherwise it's
+    built from the season responses.
     """
-    if matchup["playoffTierType"] == "NONE":
-        data[away_oid]["reg_points"] += away_pts
-        data[home_oid]["reg_points"] += home_pts
-
-        if away_pts > home_pts:
-            winners.append(away_oid)
-            data[away_oid]["reg_wins"] += 1
-        elif away_pts < home_pts:
-            winners.append(home_oid)
-            data[home_oid]["reg_wins"] += 1
-        elif away_pts == home_pts:
-            data[away_oid]["reg_ties"] += 1
-            data[home_oid]["reg_ties"] += 1
-
-    elif matchup["playoffTierType"] == "WINNERS_BRACKET":
-        data[away_oid]["playoff_points"] += away_pts
-        data[home_oid]["playoff_points"] += home_pts
-
-        if away_pts > home_pts:
-            winners.append(away_oid)
-            data[away_oid]["playoff_wins"] += 1
-        elif away_pts < home_pts:
-            winners.append(home_oid)
-            data[home_oid]["playoff_wins"] += 1
+    start_year = current_info["status"]["previousSeasons"][0]
+    if warehouse.ENABLED:
+        league_id = session['league_id']
+        await warehouse.sync(league_id, start_year, end_year, http_session)
+        return HeadToHeadMatrix(*warehouse.head_to_head(league_id))
+
+    plan = FetchPlan().add_seasons(start_year, end_year, SEASON_VIEWS)
+    bundle = await plan.resolve(http_session)
+    return HeadToHeadMatrix.from_bundle(start_year, end_year, bundle)
+
+
+def current_team(owner_id, current_info):
+    """Find the current season team ID of an owner, if they have one"""
+    return identity.season_teams(current_info).team(owner_id)
 
 
 async def all_time(owner_id_1, owner_id_2):
@@ -126,93 +183,140 @@ async def all_time(owner_id_1, owner_id_2):
             }
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
-        data = {
-            owner_id_1: {
-                "owner_id": owner_id_1,
-                "reg_wins": 0,
-                "reg_ties": 0,
-                "reg_points": Decimal(0.00),
-                "playoff_wins": 0,
-                "playoff_points": Decimal(0.00),
-            },
-            owner_id_2: {
-                "owner_id": owner_id_2,
-                "reg_wins": 0,
-                "reg_ties": 0,
-                "reg_points": Decimal(0.00),
-                "playoff_wins": 0,
-                "playoff_points": Decimal(0.00),
-            },
-            "current_streak": {},
-            "longest_streak": {}
-        }
-
+    async with http_client.session() as http_session:
         end_year = await latest_season(http_session)
         current_info = await load_data(end_year, 'mNav', http_session)
-        start_year = current_info["status"]["previousSeasons"][0]
-        winners = []
+        h2h = await load_matrix(end_year, current_info, http_session)
+        entry = h2h.pair(owner_id_1, owner_id_2)
+
+        data = {}
+        for owner_id in (owner_id_1, owner_id_2):
+            record = rivalries.new_record()
+            team_id = current_team(owner_id, current_info)
+            if entry is not None:
+                record = entry["records"][owner_id]
+                # named after the team used in their latest meeting
+                team_id = entry["team_ids"][owner_id]
+
+            data[owner_id] = dict(
+                record,
+                owner_id=owner_id,
+                name=team_name(team_id, current_info),
+                logo=fantasy_team_logo(team_id, current_info)
+            )
+
+        data["current_streak"] = h2h.streak(entry, "current_streak")
+        data["longest_streak"] = h2h.streak(entry, "longest_streak")
+        return data
 
-        for year in range(start_year, end_year + 1):
-            weeks = await number_of_weeks(year, True, http_session)
-            if weeks == 0:
-                continue
 
-            matchups = await load_matchups(year, http_session)
-            map_resp = await load_data(year, 'mNav', http_session)
-            team_owner_mapping = map_resp["teams"]
-
-            for matchup in matchups:
-                if matchup["matchupPeriodId"] > weeks:
-                    break
-
-                if is_bye_week(matchup):
-                    continue
-
-                away_details = matchup["away"]
-                away_team_id = away_details["teamId"]
-                away_owner_id = next(
-                    item for item in team_owner_mapping
-                    if item["id"] == away_team_id
-                    )["owners"][0]
-
-                home_details = matchup["home"]
-                home_team_id = home_details["teamId"]
-                home_owner_id = next(
-                    item for item in team_owner_mapping
-                    if item["id"] == home_team_id
-                    )["owners"][0]
-
-                right_teams = compare_lists([owner_id_1, owner_id_2],
-                                            [away_owner_id, home_owner_id])
-                if not right_teams:
-                    continue
-
-                # matchup be right
-                away_pts = Decimal(str(away_details["totalPoints"]))
-                home_pts = Decimal(str(home_details["totalPoints"]))
-
-                data[away_owner_id]["name"] = team_name(away_team_id,
-                                                        current_info)
-                data[away_owner_id]["logo"] = fantasy_team_logo(away_team_id,
-                                                                current_info)
-
-                data[home_owner_id]["name"] = team_name(home_team_id,
-                                                        current_info)
-                data[home_owner_id]["logo"] = fantasy_team_logo(home_team_id,
-                                                                current_info)
-
-                await add_scores(matchup, data, away_owner_id, home_owner_id,
-                           away_pts, home_pts, winners)
-
-        cstreak = current_streak(winners)
-        lstreak = longest_streak(winners)
-        data["current_streak"]["team"] = cstreak[0]
-        data["current_streak"]["length"] = cstreak[1]
-        data["longest_streak"]["team"] = lstreak[0]
-        data["longest_streak"]["length"] = lstreak[1]
+async def matrix():
+    """Calculate head to head records between every pair of owners.
 
-        return data
+    Owners with a team this season come first, in team order, followed by
+    past owners. Entry [i][j] is owner i's record against owner j, or None
+    if they never played.
+
+    Returns:
+        h2h (object) -- owners and their records against each other
+        {
+            "owners": [
+                {
+                    "owner_id": "{ABCDEF-123456-GHIJKL}",
+                    "name": "Fantasy Football Team",
+                    "logo": "https://www.imgur.com/abcdef"
+                },
+                {...}
+            ],
+            "records": [
+                [
+                    None,
+                    {
+                        "reg_wins": 12,
+                        "reg_losses": 9,
+                        "reg_ties": 0,
+                        "reg_points": 1200.24,
+                        "reg_points_against": 1096.54,
+                        "playoff_wins": 0,
+                        "playoff_losses": 1,
+                        "playoff_points": 86.24,
+                        "playoff_points_against": 102.80,
+                        "current_streak": {
+                            "team": "{MNOPQR-789101-STUVWX}",
+                            "length": 3
+                        },
+                        "longest_streak": {
+                            "team": "{MNOPQR-789101-STUVWX}",
+                            "length": 1
+                        }
+                    },
+                    ...
+                ],
+                [...]
+            ]
+        }
+    """
+    async with http_client.session() as http_session:
+        end_year = await latest_season(http_session)
+        current_info = await load_data(end_year, 'mNav', http_session)
+        h2h = await load_matrix(end_year, current_info, http_session)
+
+        order = []
+        owners = []
+        for team in current_info["teams"]:
+            owner_id = team["owners"][0]
+            if owner_id in h2h.last_names and owner_id not in order:
+                order.append(owner_id)
+                owners.append({
+                    "owner_id": owner_id,
+                    "name": team_name(team["id"], current_info),
+                    "logo": team["logo"],
+                })
+        for owner_id, name in h2h.last_names.items():
+            if owner_id not in order:
+                order.append(owner_id)
+                owners.append({
+                    "owner_id": owner_id,
+                    "name": name,
+                    "logo": None,
+                })
+
+        records = []
+        for owner in order:
+            row = []
+            for opponent in order:
+                entry = None
+                if owner != opponent:
+                    entry = h2h.pair(owner, opponent)
+                row.append(matrix_entry(h2h, entry, owner, opponent))
+            records.append(row)
+
+        return {
+            "owners": owners,
+            "records": records
+        }
+
+
+def matrix_entry(h2h, entry, owner, opponent):
+    """Format one owner's record against another for the matrix"""
+    if entry is None:
+        return None
+
+    mine = entry["records"][owner]
+    theirs = entry["records"][opponent]
+    return {
+        "reg_wins": mine["reg_wins"],
+        "reg_losses": theirs["reg_wins"],
+        "reg_ties": mine["reg_ties"],
+        "reg_points": mine["reg_points"],
+        "reg_points_against": theirs["reg_points"],
+        "playoff_wins": mine["playoff_wins"],
+        "playoff_losses": theirs["playoff_wins"],
+        "playoff_points": mine["playoff_points"],
+        "playoff_points_against": theirs["playoff_points"],
+        "current_streak": h2h.streak(entry, "current_streak"),
+        "longest_streak": h2h.streak(entry, "longest_streak"),
+    }
 
 
 async def record(owner_id_1, owner_id_2, http_session):
@@ -241,64 +345,19 @@ async def record(owner_id_1, owner_id_2, http_session):
             }
         ]
     """
-    data = {
-        owner_id_1: {
-            "owner_id": owner_id_1,
-            "wins": 0,
-        },
-        owner_id_2: {
-            "owner_id": owner_id_2,
-            "wins": 0,
-        },
-    }
-
     end_year = await latest_season(http_session)
-
-    for year in range(http_session['start_year'], end_year + 1):
-        weeks = await number_of_weeks(year, True, http_session)
-        if weeks == 0:
-            continue
-
-        matchups = await load_matchups(year, http_session)
-        map_resp = await load_data(year, 'mNav', http_session)
-        team_owner_mapping = map_resp["teams"]
-
-        for matchup in matchups:
-            if matchup["matchupPeriodId"] > weeks:
-                break
-
-            if is_bye_week(matchup):
-                continue
-
-            away_details = matchup["away"]
-            away_team_id = away_details["teamId"]
-            away_owner_id = next(
-                item for item in team_owner_mapping
-                if item["id"] == away_team_id
-                )["owners"][0]
-
-            home_details = matchup["home"]
-            home_team_id = home_details["teamId"]
-            home_owner_id = next(
-                item for item in team_owner_mapping
-                if item["id"] == home_team_id
-                )["owners"][0]
-
-            right_teams = compare_lists([owner_id_1, owner_id_2],
-                                        [away_owner_id, home_owner_id])
-            if not right_teams:
-                continue
-
-            # matchup be right
-            if (
-                matchup["playoffTierType"] == "NONE" or
-                matchup["playoffTierType"] == "WINNERS_BRACKET"
-            ):
-                if matchup["winner"] == "AWAY":
-                    data[away_owner_id]["wins"] += 1
-                elif matchup["winner"] == "HOME":
-                    data[home_owner_id]["wins"] += 1
-    return [
-        data[owner_id_1],
-        data[owner_id_2],
-    ]
+    current_info = await load_data(end_year, 'mNav', http_session)
+    h2h = await load_matrix(end_year, current_info, http_session)
+    entry = h2h.pair(owner_id_1, owner_id_2)
+
+    data = []
+    for owner_id in (owner_id_1, owner_id_2):
+        wins = 0
+        if entry is not None:
+            owner_record = entry["records"][owner_id]
+            wins = owner_record["reg_wins"] + owner_record["playoff_wins"]
+        data.append({
+            "owner_id": owner_id,
+            "wins": wins,
+        })
+    return data
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import threading
+import aiohttp
+
+CONNECTION_LIMIT = int(os.environ.get('ESPN_CONNECTION_LIMIT', 32))
+DNS_CACHE_SECONDS = int(os.environ.get('ESPN_DNS_CACHE_SECONDS', 300))
+KEEPALIVE_SECONDS = int(os.environ.get('ESPN_KEEPALIVE_SECONDS', 60))
+TIMEOUT_SECONDS = int(os.environ.get('ESPN_TIMEOUT_SECONDS', 30))
+
+# Flask runs every async view in a new event loop, and an aiohttp session
+# only works on the loop that created it. The pooled session lives on its
+# own loop in a background thread so connections outlive the request.
+_loop = None
+_thread = None
+_session = None
+_pid = None
+_lock = threading.Lock()
+
+
+def start():
+    """Start the background loop and open the pooled ESPN session.
+
+    Safe to call more than once. A forked worker gets its own loop and
+    session because threads don't survive a fork.
+    """
+    global _loop, _thread, _pid
+    with _lock:
+        if _loop is not None and _pid == os.getpid():
+            return
+
+        _loop = asyncio.new_event_loop()
+        _thread = threading.Thread(
+            target=_loop.run_forever, name='espn-http', daemon=True
+        )
+        _thread.start()
+        _pid = os.getpid()
+        asyncio.run_coroutine_threadsafe(_open(), _loop).result()
+
+
+def stop():
+    """Close the pooled session and stop the background loop"""
+    global _loop, _thread, _session
+    with _lock:
+        if _loop is None or _pid != os.getpid():
+            return
+
+        asyncio.run_coroutine_threadsafe(_session.close(), _loop).result()
+        _loop.call_soon_threadsafe(_loop.stop)
+        _thread.join()
+        _loop.close()
+        _loop = _thread = _session = None
+
+
+def session():
+    """Get the shared session, starting it if needed.
+
+    This replaces aiohttp.ClientSession() in the request handlers and
+    supports the same `async with` usage, but leaving the block doesn't
+    close anything.
+    """
+    start()
+    return PooledSession()
+
+
+async def _open():
+    """Create the aiohttp session on the background loop"""
+    global _session
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_SECONDS,
+        keepalive_timeout=KEEPALIVE_SECONDS,
+    )
+    _session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=TIMEOUT_SECONDS),
+    )
+
+
+async def _request(method, url, headers):
+    """Make a request on the background loop and read the whole body"""
+    resp = await _session.request(method=method, url=url, headers=headers)
+    try:
+        body = await resp.read()
+    finally:
+        resp.release()
+    return resp.status, body
+
+
+class PooledSession:
+    """Handle to the shared session for a single request handler"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # the pool outlives the request, it's closed by stop()
+        return False
+
+    async def request(self, method, url, headers=None):
+        """Make a request over the pooled connections.
+
+        Returns:
+            resp (Response) -- status and body of the ESPN response
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            _request(method, url, headers), _loop
+        )
+        status, body = await asyncio.wrap_future(future)
+        return Response(status, body)
+
+
+class Response:
+    """Fully read response with the parts of aiohttp's response we use"""
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    async def json(self):
+        """Decode the body, in the caller's thread rather than the pool's"""
+        return json.loads(self.body)
@@ -0,0 +1,128 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Who owns which team, season by season.
+#
+# ESPN lists a season's teams and members as arrays, so finding a team's
+# name or an owner's team means scanning them. A SeasonTeams is built once
+# per season response and cached, after which those are dict lookups.
+# People matches owners across seasons for the standings.
+
+# season responses kept indexed, by default as many as the response
+# cache keeps in memory
+MAX_SEASONS = int(os.environ.get('ALMANAC_TEAM_INDEX_ENTRIES', 512))
+
+# id(response) -> (response, SeasonTeams)
+_seasons = OrderedDict()
+_lock = threading.Lock()
+
+
+class SeasonTeams:
+    """Teams and members of one season response, keyed by ID.
+
+    Works with any view that has teams, mNav and mTeam have names, logos
+    and owners, mTeam also has members.
+    """
+
+    def __init__(self, season_obj):
+        self.teams = {}
+        # owner ID -> first team they own, in team order
+        self.owner_teams = {}
+        for team in season_obj.get("teams", []):
+            owners = team.get("owners") or []
+            name = None
+            if "location" in team and "nickname" in team:
+                name = str(team["location"] + " " + team["nickname"])
+            self.teams[team["id"]] = {
+                "owner_id": owners[0] if owners else None,
+                "primary_owner": team.get("primaryOwner"),
+                "name": name,
+                "logo": team.get("logo"),
+            }
+            for owner_id in owners:
+                self.owner_teams.setdefault(owner_id, team["id"])
+
+        self.members = {
+            member["id"]: member for member in season_obj.get("members", [])
+        }
+
+    def name(self, team_id):
+        """Team name, None if the team isn't in the season"""
+        return self.teams.get(team_id, {}).get("name")
+
+    def logo(self, team_id):
+        """Team logo URL, None if the team isn't in the season"""
+        return self.teams.get(team_id, {}).get("logo")
+
+    def owner(self, team_id):
+        """First listed owner ID of a team"""
+        return self.teams.get(team_id, {}).get("owner_id")
+
+    def team(self, owner_id):
+        """Team ID an owner has this season, None if they don't have one"""
+        return self.owner_teams.get(owner_id)
+
+    def member(self, owner_id):
+        """Member details of an owner, with firstName and lastName"""
+        return self.members.get(owner_id)
+
+
+def season_teams(season_obj):
+    """Get the index for a season response, building it the first time.
+
+    Responses from the memory cache are shared between requests, so a
+    season is only indexed again once its response is refetched.
+    """
+    with _lock:
+        cached = _seasons.get(id(season_obj))
+        if cached is not None and cached[0] is season_obj:
+            _seasons.move_to_end(id(season_obj))
+            return cached[1]
+
+    teams = SeasonTeams(season_obj)
+    with _lock:
+        # the response is kept with its index so its id can't be reused
+        _seasons[id(season_obj)] = (season_obj, teams)
+        _seasons.move_to_end(id(season_obj))
+        while len(_seasons) > MAX_SEASONS:
+            _seasons.popitem(last=False)
+    return teams
+
+
+def clear():
+    """Drop every indexed season"""
+    with _lock:
+        _seasons.clear()
+
+
+class People:
+    """Owners matched across seasons.
+
+    An owner is the same person as an earlier one with the same name, or
+    failing that the same owner ID, for owners who changed their name. A
+    person keeps the name and ID they were first seen with.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.owner_ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, owner_id, name):
+        """Find the person an owner is, adding them if they're new.
+
+        Returns:
+            person (int) -- index of the person in the order first seen
+        """
+        if name in self.names:
+            return self.names[name]
+        if owner_id in self.owner_ids:
+            return self.owner_ids[owner_id]
+
+        person = len(self.names)
+        self.names[name] = person
+        self.owner_ids[owner_id] = person
+        return person
@@ -1,10 +1,10 @@
-import aiohttp
+import http_client
 from utils import load_data, season_status
 
 
 async def summary():
     """Assemble basic league information."""
-    async with aiohttp.ClientSession() as http_session:
+    async with http_client.session() as http_session:
         status = await season_status(http_session)
         if "error" in status:
             return status
@@ -0,0 +1,243 @@
+import http_client
+import numpy as np
+import warehouse
+from columnar import MatchupTable
+from flask import session
+from planner import FetchPlan
+from utils import check_end_year, check_start_year
+
+# views needed from every season in range
+SEASON_VIEWS = ('mSettings', 'mMatchupScore', 'mNav')
+MAX_PERMUTATIONS = 20000
+
+
+def season_matrix(table, year):
+    """Arrange a season's regular season games into team by week matrices.
+
+    Returns None if the season has no finished regular season games.
+
+    Returns:
+        season (dict) -- team_ids, names and owner IDs of each row, and
+            points and opponent_points by week, NaN for a bye
+    """
+    rows = np.flatnonzero((table.year == int(year)) & table.regular)
+    if rows.size == 0:
+        return None
+
+    team_ids, team_idx = np.unique(table.team_id[rows], return_inverse=True)
+    weeks, week_idx = np.unique(table.week[rows], return_inverse=True)
+    shape = (len(team_ids), len(weeks))
+    points = np.full(shape, np.nan)
+    opponent_points = np.full(shape, np.nan)
+    points[team_idx, week_idx] = table.points[rows]
+    opponent_points[team_idx, week_idx] = table.opponent_points[rows]
+
+    # name and owner the team had in its latest game of the season
+    names = {}
+    owners = {}
+    for idx, row in zip(team_idx.tolist(), rows.tolist()):
+        names[idx] = table.names[table.name[row]]
+        owners[idx] = table.owners[table.owner[row]]
+
+    return {
+        "team_ids": team_ids.tolist(),
+        "names": [names[idx] for idx in range(len(team_ids))],
+        "owners": [owners[idx] for idx in range(len(team_ids))],
+        "points": points,
+        "opponent_points": opponent_points,
+    }
+
+
+def record(points, opponent_points):
+    """Wins, losses and ties of each row, summed over the weeks"""
+    return (
+        (points > opponent_points).sum(axis=1),
+        (points < opponent_points).sum(axis=1),
+        (points == opponent_points).sum(axis=1),
+    )
+
+
+def all_play(points):
+    """Record of each team against every other team's score every week.
+
+    Returns:
+        wins, losses, ties (ndarray) -- summed over the weeks
+        expected_wins (ndarray) -- all-play win rate each week, ties
+            counting half, summed over the weeks
+    """
+    mine = points[:, None, :]
+    theirs = points[None, :, :]
+    # comparisons with NaN are False so byes drop out
+    wins = (mine > theirs).sum(axis=1)
+    losses = (mine < theirs).sum(axis=1)
+    ties = (mine == theirs).sum(axis=1) - ~np.isnan(points)
+
+    opponents = wins + losses + ties
+    rate = np.divide(wins + ties / 2, opponents,
+                     out=np.zeros(points.shape), where=opponents > 0)
+    return wins.sum(axis=1), losses.sum(axis=1), ties.sum(axis=1), \
+        rate.sum(axis=1)
+
+
+def permuted_wins(points, permutations, rng):
+    """Replay a season under random schedules.
+
+    Every week the teams that played are paired at random, with the same
+    scores they put up that week.
+
+    Returns:
+        wins (ndarray) -- schedule by team, ties counting half
+    """
+    teams, weeks = points.shape
+    wins = np.zeros((permutations, teams))
+    schedules = np.arange(permutations)[:, None]
+    for week in range(weeks):
+        played = np.flatnonzero(~np.isnan(points[:, week]))
+        if played.size < 2:
+            continue
+        shuffled = played[np.argsort(rng.random((permutations, played.size)),
+                                     axis=1)]
+        away = shuffled[:, 0:played.size - 1:2]
+        home = shuffled[:, 1::2]
+        away_pts = points[away, week]
+        home_pts = points[home, week]
+        tied = (away_pts == home_pts) / 2
+        # a team is in each schedule's pairs once, so no index repeats
+        wins[schedules, away] += (away_pts > home_pts) + tied
+        wins[schedules, home] += (home_pts > away_pts) + tied
+    return wins
+
+
+def distribution(wins, actual):
+    """Summarize each team's wins over the random schedules.
+
+    Arguments:
+        wins (ndarray) -- schedule by team
+        actual (ndarray) -- wins each team really had
+
+    Returns:
+        summaries (list) -- per team, mean, spread, percentiles, where
+            their real schedule falls and the share of schedules giving each
+            win total
+    """
+    summaries = []
+    p10, p50, p90 = np.percentile(wins, (10, 50, 90), axis=0)
+    below = (wins < actual).mean(axis=0)
+    equal = (wins == actual).mean(axis=0)
+    for team in range(wins.shape[1]):
+        totals, counts = np.unique(wins[:, team], return_counts=True)
+        summaries.append({
+            "mean": round(float(wins[:, team].mean()), 2),
+            "std_dev": round(float(wins[:, team].std()), 2),
+            "p10": float(p10[team]),
+            "p50": float(p50[team]),
+            "p90": float(p90[team]),
+            # share of schedules with fewer wins, ties count half
+            "percentile": round(float(below[team] + equal[team] / 2), 4),
+            "wins": [
+                {"wins": float(total), "share": round(count / len(wins), 4)}
+                for total, count in zip(totals.tolist(), counts.tolist())
+            ],
+        })
+    return summaries
+
+
+def season_luck(season, year, permutations=0, rng=None):
+    """All-play record, expected wins and luck of every team in a season"""
+    points = season["points"]
+    wins, losses, ties = record(points, season["opponent_points"])
+    ap_wins, ap_losses, ap_ties, expected = all_play(points)
+    actual = wins + ties / 2
+
+    schedules = None
+    if permutations:
+        schedules = distribution(permuted_wins(points, permutations, rng),
+                                 actual)
+
+    results = []
+    for row, team_id in enumerate(season["team_ids"]):
+        result = {
+            "year": int(year),
+            "team_id": team_id,
+            "team_name": season["names"][row],
+            "owner_id": season["owners"][row],
+            "wins": int(wins[row]),
+            "losses": int(losses[row]),
+            "ties": int(ties[row]),
+            "all_play_wins": int(ap_wins[row]),
+            "all_play_losses": int(ap_losses[row]),
+            "all_play_ties": int(ap_ties[row]),
+            "expected_wins": round(float(expected[row]), 2),
+            "luck": round(float(actual[row] - expected[row]), 2),
+        }
+        if schedules is not None:
+            result["schedules"] = schedules[row]
+        results.append(result)
+    return results
+
+
+async def history(start_year, end_year, permutations=0, seed=None):
+    """Calculate all-play records and schedule luck for every team-season.
+
+    Expected wins are what a team would win if it played a random
+    opponent each week, its all-play win rate summed over the weeks. Luck
+    is its real wins, ties counting half, minus expected wins.
+
+    Arguments:
+        start_year (str or None) -- the first year to check
+        end_year (str or None) -- the last year to check
+        permutations (int) -- random schedules to replay each season
+            under, none if 0
+        seed (int or None) -- seed for repeatable schedules
+
+    Returns:
+        seasons (list) -- every team-season, luckiest first
+        [
+            {
+                "year": 2019,
+                "team_id": 4,
+                "team_name": "Fantasy Football Team",
+                "owner_id": "{ABCDEF-123456-GHIJKL}",
+                "wins": 9,
+                "losses": 4,
+                "ties": 0,
+                "all_play_wins": 98,
+                "all_play_losses": 45,
+                "all_play_ties": 0,
+                "expected_wins": 8.91,
+                "luck": 0.09,
+                "schedules": {
+                    "mean": 8.9,
+                    "std_dev": 1.21,
+                    "p10": 7.0,
+                    "p50": 9.0,
+                    "p90": 10.0,
+                    "percentile": 0.52,
+                    "wins": [{"wins": 5.0, "share": 0.004}, {...}]
+                }
+            },
+            {...}
+        ]
+    """
+    permutations = max(0, min(int(permutations or 0), MAX_PERMUTATIONS))
+    async with http_client.session() as http_session:
+        start_year = await check_start_year(start_year, http_session)
+        end_year = await check_end_year(end_year, http_session)
+
+        if warehouse.ENABLED:
+            league_id = session['league_id']
+            await warehouse.sync(league_id, start_year, end_year, http_session)
+            table = warehouse.matchup_table(league_id)
+        else:
+            plan = FetchPlan().add_seasons(start_year, end_year, SEASON_VIEWS)
+            bundle = await plan.resolve(http_session)
+            table = MatchupTable.from_bundle(start_year, end_year, bundle)
+
+        rng = np.random.default_rng(seed)
+        seasons = []
+        for year in range(start_year, end_year + 1):
+            season = season_matrix(table, year)
+            if season is not None:
+                seasons.extend(season_luck(season, year, permutations, rng))
+
+        return sorted(seasons, key=lambda s: s["luck"], reverse=True)
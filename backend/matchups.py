@@ -1,14 +1,16 @@
-import aiohttp
+import http_client
+import warehouse
+from columnar import MatchupTable
+from flask import session
+from planner import FetchPlan
 from utils import (
-    is_bye_week,
-    load_matchups,
-    number_of_weeks,
     check_start_year,
-    check_end_year,
-    load_data,
-    team_name
+    check_end_year
 )
 
+# views needed from every season in range
+SEASON_VIEWS = ('mSettings', 'mNav', 'mMatchupScore')
+
 
 async def results(start_year, end_year, playoffs, count, blowouts):
     """Calculate the biggest or smallest wins in league history.
@@ -33,62 +35,17 @@ async def results(start_year, end_year, playoffs, count, blowouts):
             {...}
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
-        all_matchups = []
-
+    async with http_client.session() as http_session:
         end_year = await check_end_year(end_year, http_session)
         start_year = await check_start_year(start_year, http_session)
 
-        for year in range(int(start_year), int(end_year) + 1):
-            weeks = await number_of_weeks(year, playoffs, http_session)
-            if weeks == 0:
-                continue
-
-            season = await load_data(year, 'mNav', http_session)
-            matchups = await load_matchups(year, http_session)
-
-            for _idx, matchup in enumerate(matchups):
-                matchup_result = {}
-                if matchup["matchupPeriodId"] > weeks:
-                    break
-
-                if is_bye_week(matchup) or matchup["playoffTierType"] == 'LOSERS_CONSOLATION_LADDER':
-                    continue
-
-                away_score = matchup["away"]["totalPoints"]
-                away_team_id = matchup["away"]["teamId"]
-
-                if season["seasonId"] == year:
-                    away_team_name = team_name(away_team_id, season)
-
-                home_score = matchup["home"]["totalPoints"]
-                home_team_id = matchup["home"]["teamId"]
-
-                if season["seasonId"] == year:
-                    home_team_name = team_name(home_team_id, season)
-
-                difference = 0
-                if away_score > home_score:
-                    difference = away_score - home_score
-                    winner = away_team_name
-                    loser = home_team_name
-                else:
-                    difference = home_score - away_score
-                    winner = home_team_name
-                    loser = away_team_name
-
-                matchup_result["year"] = year
-                matchup_result["week"] = matchup["matchupPeriodId"]
-                matchup_result["difference"] = round(difference, 2)
-                matchup_result["winner"] = winner
-                matchup_result["loser"] = loser
-
-                all_matchups.append(matchup_result)
-
-        sorted_matchups = sorted(
-            all_matchups,
-            key=lambda t: t['difference'],
-            reverse=blowouts
-            )
+        if warehouse.ENABLED:
+            league_id = session['league_id']
+            await warehouse.sync(league_id, start_year, end_year, http_session)
+            table = warehouse.matchup_table(league_id)
+        else:
+            plan = FetchPlan().add_seasons(start_year, end_year, SEASON_VIEWS)
+            bundle = await plan.resolve(http_session)
+            table = MatchupTable.from_bundle(start_year, end_year, bundle)
 
-        return sorted_matchups[0:count]
+        return table.margins(start_year, end_year, playoffs, count, blowouts)
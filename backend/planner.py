@@ -0,0 +1,74 @@
+import asyncio
+import os
+from utils import for_each_season, load_data, load_views
+
+# request every view of a season in one ESPN call instead of one per view
+COMBINE_VIEWS = os.environ.get('ALMANAC_COMBINE_VIEWS', 'true') == 'true'
+
+
+class FetchPlan:
+    """The (year, view) resources a request needs from the ESPN API.
+
+    Modules declare everything they need up front and resolve the plan
+    once. Each resource is only fetched once and seasons are fetched
+    concurrently. With COMBINE_VIEWS every view of a season comes back from
+    a single ESPN call, otherwise the views are requested at the same time.
+    """
+
+    def __init__(self):
+        # dict keys keep the resources unique and in the order added
+        self.resources = {}
+
+    def add(self, year, view):
+        """Add a single view for a single year"""
+        self.resources[(int(year), view)] = None
+        return self
+
+    def add_seasons(self, start_year, end_year, views):
+        """Add each view for every year from start_year to end_year"""
+        for year in range(int(start_year), int(end_year) + 1):
+            for view in views:
+                self.add(year, view)
+        return self
+
+    async def resolve(self, http_session):
+        """Fetch every resource in the plan.
+
+        Arguments:
+            http_session (aiohttp) -- the aiohttp session created in calling
+                script
+
+        Returns:
+            bundle (dict) -- response for each (year, view) in the plan
+            {
+                (2020, "mNav"): {...},
+                (2020, "mSettings"): {...},
+                (2021, "mNav"): {...}
+            }
+        """
+        bundle = {}
+        if not self.resources:
+            return bundle
+
+        views_by_year = {}
+        for year, view in self.resources:
+            views_by_year.setdefault(year, []).append(view)
+
+        async def fetch_season(year):
+            views = views_by_year.get(year, [])
+            if not views:
+                return {}
+            if COMBINE_VIEWS:
+                return await load_views(year, views, http_session)
+
+            responses = await asyncio.gather(
+                *[load_data(year, view, http_session) for view in views]
+            )
+            return dict(zip(views, responses))
+
+        years = sorted(views_by_year)
+        seasons = await for_each_season(years[0], years[-1], fetch_season)
+        for year, season in zip(range(years[0], years[-1] + 1), seasons):
+            for view, resp in season.items():
+                bundle[(year, view)] = resp
+        return bundle
@@ -0,0 +1,295 @@
+import http_client
+import numpy as np
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from planner import FetchPlan
+from power_rankings import score_matrix
+from utils import is_bye_week, latest_season, weeks_in_season, team_mapping
+
+SIMULATIONS = int(os.environ.get('ALMANAC_ODDS_SIMULATIONS', 100000))
+MAX_SIMULATIONS = 1000000
+# processes to split simulations across, 1 runs them in the request
+PROCESSES = int(os.environ.get('ALMANAC_ODDS_PROCESSES', 1))
+# simulations per batch, bounds memory to a few MB per batch
+BATCH = 20000
+
+# games of the league's spread a team's own spread counts as, so a team
+# with a couple of games isn't certain to score the same every week
+PRIOR_GAMES = 4
+# used before anyone has played
+DEFAULT_MEAN = 100.0
+DEFAULT_STD = 25.0
+
+# process count -> ProcessPoolExecutor, see pool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def season_state(matchups, team_ids, regular_weeks, last_week):
+    """Summarize a season so far and what's left of the regular season.
+
+    Arguments:
+        matchups (list) -- schedule from the mMatchupScore view
+        team_ids (list) -- every team in the season
+        regular_weeks (int) -- matchupPeriodCount
+        last_week (int) -- the last finished week
+
+    Returns:
+        state (dict) -- wins, ties and points per team, and the away and
+            home rows of every remaining game
+    """
+    rows = {team_id: row for row, team_id in enumerate(team_ids)}
+    wins = np.zeros(len(team_ids))
+    ties = np.zeros(len(team_ids))
+    points = np.zeros(len(team_ids))
+    away = []
+    home = []
+    for matchup in matchups:
+        week = matchup["matchupPeriodId"]
+        if week > regular_weeks:
+            break
+
+        if is_bye_week(matchup):
+            continue
+
+        away_row = rows[matchup["away"]["teamId"]]
+        home_row = rows[matchup["home"]["teamId"]]
+        if week > last_week:
+            away.append(away_row)
+            home.append(home_row)
+            continue
+
+        points[away_row] += matchup["away"]["totalPoints"]
+        points[home_row] += matchup["home"]["totalPoints"]
+        if matchup["winner"] == "AWAY":
+            wins[away_row] += 1
+        elif matchup["winner"] == "HOME":
+            wins[home_row] += 1
+        else:
+            ties[away_row] += 1
+            ties[home_row] += 1
+
+    return {
+        "wins": wins,
+        "ties": ties,
+        "points": points,
+        "away": np.array(away, dtype=np.int64),
+        "home": np.array(home, dtype=np.int64),
+    }
+
+
+def score_distributions(points):
+    """Mean and standard deviation each team's scores are drawn from.
+
+    A team's spread is shrunk toward the league's by PRIOR_GAMES, and teams
+    that haven't played use the league's average.
+
+    Arguments:
+        points (ndarray) -- team by week scores, NaN for weeks not played
+    """
+    played = ~np.isnan(points)
+    games = played.sum(axis=1)
+    if not played.any():
+        teams = len(points)
+        return np.full(teams, DEFAULT_MEAN), np.full(teams, DEFAULT_STD)
+
+    league_mean = np.nanmean(points)
+    league_var = np.nanvar(points) if played.sum() > 1 else DEFAULT_STD ** 2
+    mean = np.divide(np.nansum(points, axis=1), games,
+                     out=np.full(len(points), league_mean), where=games > 0)
+    deviations = np.where(played, points - mean[:, None], 0)
+    var = (
+        ((deviations ** 2).sum(axis=1) + PRIOR_GAMES * league_var) /
+        (games + PRIOR_GAMES)
+    )
+    return mean, np.sqrt(var)
+
+
+def simulate(state, mean, std, playoff_teams, byes, sims, seed):
+    """Play out the rest of the regular season sims times.
+
+    Every remaining game draws both scores from the teams' distributions.
+    Teams are seeded by win percentage, ties counting as half a win, then
+    by total points.
+
+    Returns:
+        counts (dict) -- per team, how many simulations they made the
+            playoffs, got a bye, and their summed wins and seeds
+    """
+    rng = np.random.default_rng(seed)
+    teams = len(mean)
+    away = state["away"]
+    home = state["home"]
+    # one hot team of each game, so season totals are a matrix product
+    away_teams = np.zeros((len(away), teams))
+    away_teams[np.arange(len(away)), away] = 1
+    home_teams = np.zeros((len(home), teams))
+    home_teams[np.arange(len(home)), home] = 1
+
+    counts = {
+        "playoffs": np.zeros(teams),
+        "bye": np.zeros(teams),
+        "wins": np.zeros(teams),
+        "seed": np.zeros(teams),
+    }
+    done = 0
+    while done < sims:
+        batch = min(BATCH, sims - done)
+        done += batch
+
+        draws = rng.standard_normal((2, batch, len(away)))
+        away_pts = mean[away] + std[away] * draws[0]
+        home_pts = mean[home] + std[home] * draws[1]
+        away_won = (away_pts > home_pts).astype(np.float64)
+        tied = (away_pts == home_pts).astype(np.float64)
+
+        wins = (state["wins"] + away_won @ away_teams +
+                (1 - away_won - tied) @ home_teams)
+        record = wins + (state["ties"] + tied @ (away_teams + home_teams)) / 2
+        points = state["points"] + away_pts @ away_teams + home_pts @ home_teams
+
+        # best record first, then most points
+        order = np.lexsort((-points, -record), axis=1)
+        seeds = np.empty_like(order)
+        np.put_along_axis(seeds, order, np.arange(1, teams + 1)[None, :],
+                          axis=1)
+
+        counts["playoffs"] += (seeds <= playoff_teams).sum(axis=0)
+        counts["bye"] += (seeds <= byes).sum(axis=0)
+        counts["wins"] += wins.sum(axis=0)
+        counts["seed"] += seeds.sum(axis=0)
+    return counts
+
+
+def pool(processes):
+    """Get a process pool for splitting simulations, started once"""
+    with _pools_lock:
+        if processes not in _pools:
+            _pools[processes] = ProcessPoolExecutor(processes)
+        return _pools[processes]
+
+
+def run(state, mean, std, playoff_teams, byes, sims, seed=None,
+        processes=PROCESSES):
+    """Simulate, split across processes when there is more than one.
+
+    Each process gets its own random stream from the seed, so results
+    are repeatable for a seed and process count.
+    """
+    streams = np.random.SeedSequence(seed).spawn(processes)
+    if processes <= 1:
+        return simulate(state, mean, std, playoff_teams, byes, sims,
+                        streams[0])
+
+    shares = [sims // processes + (idx < sims % processes)
+              for idx in range(processes)]
+    futures = [
+        pool(processes).submit(simulate, state, mean, std, playoff_teams, byes,
+                      share, stream)
+        for share, stream in zip(shares, streams)
+    ]
+    counts = None
+    for future in futures:
+        result = future.result()
+        if counts is None:
+            counts = result
+        else:
+            for name in counts:
+                counts[name] += result[name]
+    return counts
+
+
+def bracket_byes(playoff_teams):
+    """Top seeds that skip the first round of a bracket"""
+    if playoff_teams < 2:
+        return 0
+    size = 1 << (int(playoff_teams) - 1).bit_length()
+    return size - playoff_teams
+
+
+async def odds(sims=None, seed=None):
+    """Estimate each team's chances of making the playoffs and a bye.
+
+    Team scores are drawn from a normal distribution around their average
+    so far. The league's playoff team count is used, seeds go by record
+    then total points, and division winners aren't given a spot.
+
+    Arguments:
+        sims (int or None) -- simulations to run, SIMULATIONS by default
+        seed (int or None) -- seed for repeatable odds
+
+    Returns:
+        odds (object) -- playoff spots, byes and each team's odds, best
+            average seed first
+        {
+            "simulations": 100000,
+            "playoff_teams": 6,
+            "byes": 2,
+            "weeks_left": 4,
+            "teams": [
+                {
+                    "name": "Josh Allen",
+                    "team_id": 15,
+                    "wins": 7,
+                    "ties": 0,
+                    "points": 1290.5,
+                    "projected_wins": 9.34,
+                    "average_seed": 1.8,
+                    "playoffs": 0.9731,
+                    "bye": 0.6127
+                },
+                {...}
+            ]
+        }
+    """
+    sims = max(1, min(int(sims or SIMULATIONS), MAX_SIMULATIONS))
+    async with http_client.session() as http_session:
+        year = await latest_season(http_session)
+
+        plan = FetchPlan()
+        for view in ('mMatchupScore', 'mSettings', 'mTeam'):
+            plan.add(year, view)
+        bundle = await plan.resolve(http_session)
+
+        settings = bundle[(year, 'mSettings')]
+        schedule_settings = settings["settings"]["scheduleSettings"]
+        regular_weeks = schedule_settings["matchupPeriodCount"]
+        last_week = weeks_in_season(settings, False)
+        matchups = bundle[(year, 'mMatchupScore')]["schedule"]
+
+        # already fetched by the plan so this doesn't hit ESPN again
+        team_names = await team_mapping(year, http_session)
+        team_ids = list(team_names)
+
+        playoff_teams = min(schedule_settings["playoffTeamCount"],
+                            len(team_ids))
+        byes = bracket_byes(playoff_teams)
+
+        state = season_state(matchups, team_ids, regular_weeks, last_week)
+        _ids, _weeks, points, _won = score_matrix(matchups, last_week,
+                                                  team_ids)
+        mean, std = score_distributions(points)
+        counts = run(state, mean, std, playoff_teams, byes, sims, seed)
+
+        teams = []
+        for row, team_id in enumerate(team_ids):
+            teams.append({
+                "name": team_names[team_id],
+                "team_id": team_id,
+                "wins": int(state["wins"][row]),
+                "ties": int(state["ties"][row]),
+                "points": round(float(state["points"][row]), 2),
+                "projected_wins": round(counts["wins"][row] / sims, 2),
+                "average_seed": round(counts["seed"][row] / sims, 2),
+                "playoffs": round(counts["playoffs"][row] / sims, 4),
+                "bye": round(counts["bye"][row] / sims, 4),
+            })
+
+        return {
+            "simulations": sims,
+            "playoff_teams": playoff_teams,
+            "byes": byes,
+            "weeks_left": regular_weeks - last_week,
+            "teams": sorted(teams, key=lambda tm: tm["average_seed"]),
+        }
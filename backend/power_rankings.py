@@ -1,29 +1,185 @@
+from flask import session
+from planner import FetchPlan
 from utils import (
     is_bye_week,
     latest_season,
-    load_data,
-    number_of_weeks,
+    weeks_in_season,
     team_mapping
 )
-import statistics
-import aiohttp
+import http_client
+import math
+import numpy as np
+import os
+import threading
+from collections import OrderedDict
 
+# The ranking engine, from DEFAULT_WEIGHTS to number, is mirrored in
+# lambdas/powerRankings.py, which can't import the backend. Change both.
 
-def update_overall_wins(tm, all_week_pts):
-    """Calculate overall wins in the week and add to overall."""
-    if 'overall_wins' not in tm:
-        tm["overall_wins"] = 0
-    for idx, s in enumerate(tm["scores"]):
-        week_overall_wins = sorted(all_week_pts[idx + 1]).index(s)
-        tm["overall_wins"] += week_overall_wins
+# how much each metric's rank counts toward the power ranking score
+DEFAULT_WEIGHTS = {
+    "wins": 3,
+    "l5": 1,
+    "points": 2,
+    "consistency": 1,
+    "overall_wins": 1,
+}
+# metrics where the lowest value ranks first, the rest rank highest first
+ASCENDING_METRICS = ('consistency',)
 
+# most seasons of rankings history kept in memory, least recently used go
+MAX_HISTORIES = int(os.environ.get('ALMANAC_HISTORY_CACHE_ENTRIES', 256))
 
-async def current():
+# (league id, year) -> RankingsHistory, see history
+_histories = OrderedDict()
+_histories_lock = threading.Lock()
+
+
+def parse_weights(args):
+    """Read metric weights from request args.
+
+    Metrics that aren't in args keep their default weight.
+
+    Arguments:
+        args (dict) -- request args, e.g. {"wins": "4", "points": "1"}
+
+    Returns:
+        weights (dict) -- weight for every metric in DEFAULT_WEIGHTS
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for metric in DEFAULT_WEIGHTS:
+        value = args.get(metric)
+        if value is not None and value != '':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = float('nan')
+            if not math.isfinite(weight):
+                raise ValueError(metric + ' weight must be a number')
+            weights[metric] = weight
+
+    if min(weights.values()) < 0 or sum(weights.values()) <= 0:
+        raise ValueError('Weights must not be negative and must not all be 0')
+    return weights
+
+
+def score_matrix(matchups, last_week, team_ids=None):
+    """Arrange regular season scores into a team by week matrix.
+
+    Teams are in the order they first appear in the schedule unless
+    team_ids is given. Weeks a team didn't play, such as a bye, are NaN.
+
+    Arguments:
+        matchups (list) -- schedule from the mMatchupScore view
+        last_week (int) -- the last week to include
+        team_ids (list or None) -- every team in the season, in row order
+
+    Returns:
+        team_ids (list) -- team ID of each row
+        weeks (list) -- week of each column
+        points (ndarray) -- points scored each week
+        won (ndarray) -- whether the team won each week
+    """
+    team_ids = list(team_ids or [])
+    rows = {team_id: row for row, team_id in enumerate(team_ids)}
+    weeks = []
+    games = []
+    for matchup in matchups:
+        week = matchup["matchupPeriodId"]
+        if week > last_week:
+            break
+
+        if is_bye_week(matchup):
+            continue
+
+        if not weeks or weeks[-1] != week:
+            weeks.append(week)
+        for t in ["home", "away"]:
+            team_id = matchup[t]["teamId"]
+            if team_id not in rows:
+                rows[team_id] = len(team_ids)
+                team_ids.append(team_id)
+            games.append((rows[team_id], len(weeks) - 1,
+                          matchup[t]["totalPoints"],
+                          matchup["winner"].lower() == t))
+
+    points = np.full((len(team_ids), len(weeks)), np.nan)
+    won = np.zeros((len(team_ids), len(weeks)), dtype=bool)
+    if games:
+        rows, cols, pts, wins = zip(*games)
+        points[rows, cols] = pts
+        won[rows, cols] = wins
+    return team_ids, weeks, points, won
+
+
+def average_ranks(values, descending=False):
+    """Rank values from 1, tied values share the average of their ranks"""
+    values = np.asarray(values, dtype=np.float64)
+    if descending:
+        values = -values
+    _unique, inverse, counts = np.unique(
+        values, return_inverse=True, return_counts=True
+    )
+    last = np.cumsum(counts)
+    return (last - (counts - 1) / 2)[inverse.reshape(-1)]
+
+
+def all_play_wins(points):
+    """Count wins each week if every team played every other team.
+
+    A tied score is half a win. Weeks a team didn't play are NaN.
+    """
+    wins = np.full(points.shape, np.nan)
+    for col in range(points.shape[1]):
+        played = ~np.isnan(points[:, col])
+        scores = points[played, col]
+        ordered = np.sort(scores)
+        below = np.searchsorted(ordered, scores, 'left')
+        tied = np.searchsorted(ordered, scores, 'right') - below - 1
+        wins[played, col] = below + tied / 2
+    return wins
+
+
+def last_games(played, count):
+    """Select each team's last `count` games played"""
+    from_end = np.cumsum(played[:, ::-1], axis=1)[:, ::-1]
+    return played & (from_end <= count)
+
+
+def power_scores(metrics, weights):
+    """Weight each metric's rank into a power ranking score, lower is better.
+
+    Arguments:
+        metrics (dict) -- metric name to an array with a value per team
+        weights (dict) -- metric name to its weight
+    """
+    total = 0
+    for metric, weight in weights.items():
+        ranks = average_ranks(metrics[metric],
+                              descending=metric not in ASCENDING_METRICS)
+        total = total + ranks * weight
+    return total / sum(weights.values())
+
+
+def number(value):
+    """Make a numpy number JSON friendly, as an int when it's whole"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+async def current(weights=None):
     """Calculate current power rankings.
 
     The return object is a list of the teams objects definedbelow.
     The "games" list has True for a win, False for a loss.
 
+    Each metric is ranked across the league, with tied teams sharing the
+    average of their ranks, and the ranks are weighted into pr_score.
+
+    Arguments:
+        weights (dict or None) -- weight of each metric's rank, see
+            DEFAULT_WEIGHTS
+
     Returns:
         teams (object) -- OrderedDict of power ranking details
         [
@@ -32,84 +188,265 @@ async def current():
                 "team_id": 15,
                 "scores": [158.9, 150.16],
                 "games": [True, True],
+                "weeks": [1, 2],
                 "wins": 2,
                 "l5": 2,
                 "points": 309.06,
                 "consistency": 4.37,
                 "overall_wins": 20,
+                "pr_score": 1.5,
             },
             {...}
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
-        teams = []
+    weights = weights or DEFAULT_WEIGHTS
+    async with http_client.session() as http_session:
         year = await latest_season(http_session)
 
-        matchups_resp = await load_data(year, 'mMatchupScore', http_session)
+        plan = FetchPlan()
+        for view in ('mMatchupScore', 'mSettings', 'mTeam'):
+            plan.add(year, view)
+        bundle = await plan.resolve(http_session)
+
+        matchups_resp = bundle[(year, 'mMatchupScore')]
         matchups = matchups_resp["schedule"]
         current_week = matchups_resp["scoringPeriodId"]
 
-        weeks = await number_of_weeks(year, False, http_session)
+        weeks = weeks_in_season(bundle[(year, 'mSettings')], False)
         if weeks == 0:
             return {"error": "No weeks in this season"}
 
+        # already fetched by the plan so this doesn't hit ESPN again
         team_names = await team_mapping(year, http_session)
 
-        all_week_pts = {}
-        # loop through all matchups in the regular season
-        for matchup in matchups:
-            week = matchup["matchupPeriodId"]
-            if week > weeks or week > current_week:
-                break
-
-            if is_bye_week(matchup):
-                continue
-
-            if week not in all_week_pts:
-                all_week_pts[week] = []
-
-            # add team's score and win/loss to teams obj
-            for t in ["home", "away"]:
-                t_id = matchup[t]["teamId"]
-                pts = matchup[t]["totalPoints"]
-                won = matchup["winner"].lower() == t
-                all_week_pts[week].append(pts)
-
-                team_obj = next((x for x in teams if x["team_id"] == t_id), None)
-                if team_obj is None:
-                    teams.append({
-                        "name": team_names[t_id],
-                        "team_id": t_id,
-                        "scores": [pts],
-                        "games": [won]
-                    })
-                else:
-                    team_obj["scores"].append(pts)
-                    team_obj["games"].append(won)
-
-        all_wins = []
-        all_overall_wins = []
-        all_l5 = []
-        all_pts = []
-        all_consistency = []
-
-        # loop through teams object and add sum values
-        # to teams object and all_ lists
-        for tm in teams:
-            tm["wins"] = sum(tm["games"])
-            all_wins.append(tm["wins"])
-
-            tm["l5"] = sum(tm["games"][-5:])
-            all_l5.append(tm["l5"])
-
-            tm["points"] = round(sum(tm["scores"]), 2)
-            all_pts.append(tm["points"])
-
-            tm["consistency"] = round(statistics.pstdev(tm["scores"]), 2)
-            all_consistency.append(tm["consistency"])
-
-            update_overall_wins(tm, all_week_pts)
-            all_overall_wins.append(tm["overall_wins"])
+        team_ids, week_ids, points, won = score_matrix(
+            matchups, min(weeks, current_week)
+        )
+        played = ~np.isnan(points)
+
+        metrics = {
+            "wins": (won & played).sum(axis=1),
+            "l5": (won & last_games(played, 5)).sum(axis=1),
+            "points": np.round(np.nansum(points, axis=1), 2),
+            "consistency": np.round(np.nanstd(points, axis=1), 2),
+            "overall_wins": np.nansum(all_play_wins(points), axis=1),
+        }
+        pr_scores = np.round(power_scores(metrics, weights), 2)
+
+        teams = []
+        for row, team_id in enumerate(team_ids):
+            team_weeks = played[row]
+            tm = {
+                "name": team_names[team_id],
+                "team_id": team_id,
+                "scores": points[row, team_weeks].tolist(),
+                "games": won[row, team_weeks].tolist(),
+                "weeks": np.array(week_ids)[team_weeks].tolist(),
+            }
+            for metric, values in metrics.items():
+                tm[metric] = number(values[row])
+            tm["pr_score"] = float(pr_scores[row])
+            teams.append(tm)
 
         # return list of teams objects
         return teams
+
+
+class RankingsHistory:
+    """Power ranking metrics and ranks after every week of a season.
+
+    The metrics are running totals, so each new week is added by updating
+    them with that week's scores rather than starting over. Ranks are kept
+    per metric so any weights can be applied to them afterwards.
+    """
+
+    def __init__(self, team_ids):
+        teams = len(team_ids)
+        self.team_ids = list(team_ids)
+        self.weeks = []
+        self.points = np.empty((teams, 0))
+        self.won = np.empty((teams, 0), dtype=bool)
+
+        # running state for each team
+        self.games = np.zeros(teams, dtype=np.int64)
+        self.wins = np.zeros(teams, dtype=np.int64)
+        self.total = np.zeros(teams)
+        self.mean = np.zeros(teams)
+        self.sum_sq = np.zeros(teams)
+        self.overall_wins = np.zeros(teams)
+        # results of the last five games, indexed by game number mod 5
+        self.recent = np.zeros((teams, 5), dtype=bool)
+
+        # metric -> list of arrays, one per week
+        self.metrics = {metric: [] for metric in DEFAULT_WEIGHTS}
+        self.ranks = {metric: [] for metric in DEFAULT_WEIGHTS}
+
+    def matches(self, team_ids, weeks, points, won):
+        """Check the weeks already added are unchanged, e.g. by a stat
+        correction, so the new weeks can be added on top of them"""
+        added = len(self.weeks)
+        return (
+            team_ids == self.team_ids and
+            weeks[:added] == self.weeks and
+            np.array_equal(points[:, :added], self.points, equal_nan=True) and
+            np.array_equal(won[:, :added], self.won)
+        )
+
+    def extend(self, weeks, points, won):
+        """Add the weeks that come after the ones already added"""
+        for col in range(len(self.weeks), len(weeks)):
+            self.add_week(weeks[col], points[:, col], won[:, col])
+
+    def add_week(self, week, points, won):
+        """Update the running metrics with one week's scores"""
+        played = ~np.isnan(points)
+        scores = points[played]
+        won = won & played
+
+        self.weeks.append(week)
+        self.points = np.column_stack((self.points, points))
+        self.won = np.column_stack((self.won, won))
+
+        self.recent[played, self.games[played] % 5] = won[played]
+        self.games += played
+        self.wins += won
+        self.total[played] += scores
+        # Welford's update for the standard deviation
+        delta = scores - self.mean[played]
+        self.mean[played] += delta / self.games[played]
+        self.sum_sq[played] += delta * (scores - self.mean[played])
+        week_wins = all_play_wins(points[:, None])[:, 0]
+        self.overall_wins += np.nan_to_num(week_wins)
+
+        variance = np.divide(self.sum_sq, self.games,
+                             out=np.zeros(len(self.games)),
+                             where=self.games > 0)
+        metrics = {
+            "wins": self.wins.copy(),
+            "l5": self.recent.sum(axis=1),
+            "points": np.round(self.total, 2),
+            "consistency": np.round(np.sqrt(variance), 2),
+            "overall_wins": self.overall_wins.copy(),
+        }
+        for metric, values in metrics.items():
+            self.metrics[metric].append(values)
+            self.ranks[metric].append(average_ranks(
+                values, descending=metric not in ASCENDING_METRICS
+            ))
+
+    def pr_scores(self, weights):
+        """Weight the ranks into power ranking scores, a column per week"""
+        total = 0
+        for metric, weight in weights.items():
+            total = total + np.column_stack(self.ranks[metric]) * weight
+        return total / sum(weights.values())
+
+
+def update_history(league_id, year, team_ids, weeks, points, won):
+    """Get the cached history for a season with any new weeks added.
+
+    It's built from the first week if it's new or earlier weeks changed.
+    """
+    key = (str(league_id), int(year))
+    with _histories_lock:
+        history = _histories.get(key)
+        if history is None or not history.matches(team_ids, weeks, points,
+                                                  won):
+            history = _histories[key] = RankingsHistory(team_ids)
+        _histories.move_to_end(key)
+        while len(_histories) > MAX_HISTORIES:
+            _histories.popitem(last=False)
+        history.extend(weeks, points, won)
+        return history
+
+
+def clear():
+    """Drop every cached rankings history"""
+    with _histories_lock:
+        _histories.clear()
+
+
+async def history(year=None, weights=None):
+    """Calculate power rankings after every week of a season.
+
+    Arguments:
+        year (int or None) -- the season, the latest if not specified
+        weights (dict or None) -- weight of each metric's rank, see
+            DEFAULT_WEIGHTS
+
+    Returns:
+        history (object) -- each team's metrics, score and rank by week
+        {
+            "year": 2023,
+            "weeks": [1, 2, 3],
+            "teams": [
+                {
+                    "name": "Josh Allen",
+                    "team_id": 15,
+                    "wins": [1, 2, 2],
+                    "l5": [1, 2, 2],
+                    "points": [158.9, 309.06, 401.2],
+                    "consistency": [0, 4.37, 26.51],
+                    "overall_wins": [9, 18, 22.5],
+                    "pr_score": [1.5, 1.25, 3.5],
+                    "rank": [1, 1, 2.5]
+                },
+                {...}
+            ]
+        }
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    async with http_client.session() as http_session:
+        year = int(year or await latest_season(http_session))
+
+        plan = FetchPlan()
+        for view in ('mMatchupScore', 'mSettings', 'mTeam'):
+            plan.add(year, view)
+        bundle = await plan.resolve(http_session)
+
+        matchups_resp = bundle[(year, 'mMatchupScore')]
+        current_week = matchups_resp["scoringPeriodId"]
+        weeks = weeks_in_season(bundle[(year, 'mSettings')], False)
+
+        # already fetched by the plan so this doesn't hit ESPN again
+        team_names = await team_mapping(year, http_session)
+
+        team_ids, week_ids, points, won = score_matrix(
+            matchups_resp["schedule"], min(weeks, current_week),
+            team_names.keys()
+        )
+        season = update_history(session['league_id'], year, team_ids,
+                                week_ids, points, won)
+
+        # nothing to rank before the first week is finished
+        if not season.weeks:
+            fields = (*season.metrics, "pr_score", "rank")
+            teams = []
+            for team_id in season.team_ids:
+                tm = {"name": team_names[team_id], "team_id": team_id}
+                tm.update({field: [] for field in fields})
+                teams.append(tm)
+            return {"year": year, "weeks": [], "teams": teams}
+
+        scores = np.round(season.pr_scores(weights), 2)
+        ranks = np.column_stack(
+            [average_ranks(scores[:, col]) for col in range(scores.shape[1])]
+        )
+
+        teams = []
+        for row, team_id in enumerate(season.team_ids):
+            tm = {
+                "name": team_names[team_id],
+                "team_id": team_id,
+            }
+            for metric, values in season.metrics.items():
+                tm[metric] = [number(week[row]) for week in values]
+            tm["pr_score"] = scores[row].tolist()
+            tm["rank"] = [number(rank) for rank in ranks[row]]
+            teams.append(tm)
+
+        return {
+            "year": year,
+            "weeks": list(season.weeks),
+            "teams": teams,
+        }
@@ -0,0 +1,156 @@
+from decimal import Decimal
+
+# Head to head aggregates for a pair of owners, over a season or all time.
+#
+# A pair's entry holds both owners' records, the team IDs they used in
+# their latest meeting, and enough streak state to join two entries
+# without replaying their games: the first, current (last) and first
+# longest run of wins, and how many games had a winner. Regular season and
+# winners bracket games count. Ties only count in the regular season and
+# don't end a streak, and consolation games only update the team IDs.
+
+
+def pair_key(owner_id_1, owner_id_2):
+    """Key a pair the same way no matter the order of the owners"""
+    return tuple(sorted((owner_id_1, owner_id_2), key=str))
+
+
+def new_record():
+    """Empty record for one side of a pair"""
+    return {
+        "reg_wins": 0,
+        "reg_ties": 0,
+        "reg_points": Decimal(0.00),
+        "playoff_wins": 0,
+        "playoff_points": Decimal(0.00),
+    }
+
+
+def new_entry(key):
+    """Empty entry for a pair of owners"""
+    return {
+        "records": {owner: new_record() for owner in key},
+        "team_ids": {},
+        "first_streak": [None, 0],
+        "current_streak": [None, 0],
+        "longest_streak": [None, 0],
+        "decided": 0,
+    }
+
+
+def add_matchup(entry, away_owner, home_owner, away_team, home_team,
+                away_pts, home_pts, tier):
+    """Add a single matchup to a pair's entry.
+
+    Arguments:
+        entry (dict) -- the pair's entry, updated in place
+        away_owner (str) -- owner ID of the away team
+        home_owner (str) -- owner ID of the home team
+        away_team (int) -- team ID of the away team
+        home_team (int) -- team ID of the home team
+        away_pts (Decimal) -- points scored by away team
+        home_pts (Decimal) -- points scored by home team
+        tier (str) -- playoffTierType of the matchup
+    """
+    entry["team_ids"][away_owner] = away_team
+    entry["team_ids"][home_owner] = home_team
+    away = entry["records"][away_owner]
+    home = entry["records"][home_owner]
+
+    if tier == "NONE":
+        away["reg_points"] += away_pts
+        home["reg_points"] += home_pts
+
+        if away_pts > home_pts:
+            away["reg_wins"] += 1
+            add_win(entry, away_owner)
+        elif away_pts < home_pts:
+            home["reg_wins"] += 1
+            add_win(entry, home_owner)
+        else:
+            away["reg_ties"] += 1
+            home["reg_ties"] += 1
+
+    elif tier == "WINNERS_BRACKET":
+        away["playoff_points"] += away_pts
+        home["playoff_points"] += home_pts
+
+        if away_pts > home_pts:
+            away["playoff_wins"] += 1
+            add_win(entry, away_owner)
+        elif away_pts < home_pts:
+            home["playoff_wins"] += 1
+            add_win(entry, home_owner)
+
+
+def add_win(entry, owner):
+    """Extend or start a run of wins and keep the first longest"""
+    first = entry["first_streak"]
+    if entry["decided"] == 0:
+        entry["first_streak"] = [owner, 1]
+    elif first[0] == owner and first[1] == entry["decided"]:
+        first[1] += 1
+    entry["decided"] += 1
+
+    current = entry["current_streak"]
+    if current[0] == owner:
+        current[1] += 1
+    else:
+        current = entry["current_streak"] = [owner, 1]
+
+    if current[1] > entry["longest_streak"][1]:
+        entry["longest_streak"] = list(current)
+
+
+def merge(earlier, later):
+    """Join a pair's entries for two periods, earlier one first.
+
+    Gives the same records and streaks as adding every game of both
+    periods to one entry in order.
+
+    Returns:
+        entry (dict) -- a new entry covering both periods
+    """
+    records = {}
+    for owner in earlier["records"]:
+        records[owner] = {
+            stat: earlier["records"][owner][stat] + later["records"][owner][stat]
+            for stat in earlier["records"][owner]
+        }
+    entry = {
+        "records": records,
+        "team_ids": dict(earlier["team_ids"], **later["team_ids"]),
+        "first_streak": list(earlier["first_streak"]),
+        "current_streak": list(earlier["current_streak"]),
+        "longest_streak": list(earlier["longest_streak"]),
+        "decided": earlier["decided"] + later["decided"],
+    }
+    if later["decided"] == 0:
+        return entry
+    if earlier["decided"] == 0:
+        for streak in ("first_streak", "current_streak", "longest_streak"):
+            entry[streak] = list(later[streak])
+        return entry
+
+    owner, first_length = later["first_streak"]
+    joined = earlier["current_streak"][0] == owner
+    joined_length = earlier["current_streak"][1] + first_length
+
+    # runs happen in this order: earlier's, the joined run, later's
+    if joined and joined_length > entry["longest_streak"][1]:
+        entry["longest_streak"] = [owner, joined_length]
+    later_longest_is_first = later["longest_streak"][1] == first_length
+    if not (joined and later_longest_is_first) and (
+        later["longest_streak"][1] > entry["longest_streak"][1]
+    ):
+        entry["longest_streak"] = list(later["longest_streak"])
+
+    if joined and first_length == later["decided"]:
+        entry["current_streak"] = [owner, joined_length]
+    else:
+        entry["current_streak"] = list(later["current_streak"])
+
+    earlier_one_run = earlier["first_streak"][1] == earlier["decided"]
+    if joined and earlier_one_run:
+        entry["first_streak"] = [owner, joined_length]
+    return entry
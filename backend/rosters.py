@@ -1,5 +1,6 @@
-import aiohttp
-from utils import latest_season, load_data
+import http_client
+from planner import FetchPlan
+from utils import latest_season
 
 
 async def keeper_options():
@@ -26,14 +27,19 @@ async def keeper_options():
             {...}
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
+    async with http_client.session() as http_session:
         year = await latest_season(http_session)
         next_year_rounds = 16
 
-        rosters = await load_data(year, 'mRoster', http_session)
-        draft = await load_data(year, 'mDraftDetail', http_session)
-        teams = await load_data(year, 'mTeam', http_session)
-        settings = await load_data(year, 'mSettings', http_session)
+        plan = FetchPlan()
+        for view in ('mRoster', 'mDraftDetail', 'mTeam', 'mSettings'):
+            plan.add(year, view)
+        bundle = await plan.resolve(http_session)
+
+        rosters = bundle[(year, 'mRoster')]
+        draft = bundle[(year, 'mDraftDetail')]
+        teams = bundle[(year, 'mTeam')]
+        settings = bundle[(year, 'mSettings')]
         deadline = settings["settings"]["tradeSettings"]["deadlineDate"]
 
         all_rosters = []
@@ -1,15 +1,33 @@
-import aiohttp
+import cache
+import http_client
+import os
 import statistics
+import threading
+import warehouse
+from collections import OrderedDict
+from columnar import MatchupTable
+from itertools import groupby
+from flask import session
+from planner import FetchPlan
 from utils import (
     check_end_year,
     is_bye_week,
-    load_matchups,
-    number_of_weeks,
-    load_data,
+    weeks_in_season,
     team_name,
     check_start_year
 )
 
+# views needed from every season in range
+SEASON_VIEWS = ('mSettings', 'mMatchupScore', 'mNav')
+
+# Completed seasons never change, so their scoring averages and distance
+# from the league average are only worked out once.
+MAX_SEASONS = int(os.environ.get('ALMANAC_SEASON_CACHE_ENTRIES', 512))
+
+# (league id, year) -> list of team seasons
+_seasons = OrderedDict()
+_seasons_lock = threading.Lock()
+
 
 async def best_and_worst_weeks(start_year, end_year, playoffs, count, highest):
     """Calculate best and worst weeks in league history.
@@ -33,75 +51,20 @@ async def best_and_worst_weeks(start_year, end_year, playoffs, count, highest):
             {...}
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
-        all_scores = []
+    async with http_client.session() as http_session:
         start_year = await check_start_year(start_year, http_session)
         end_year = await check_end_year(end_year, http_session)
 
-        for year in range(start_year, end_year + 1):
-            weeks = await number_of_weeks(year, playoffs, http_session)
-            if weeks == 0:
-                continue
-
-            matchups = await load_matchups(year, http_session)
-            season = await load_data(year, 'mNav', http_session)
-
-            for matchup in matchups:
-                week = 0
-                if matchup["matchupPeriodId"] > weeks:
-                    break
-
-                if is_bye_week(matchup):
-                    continue
-
-                away_team_id = matchup["away"]["teamId"]
-                if season["seasonId"] == year:
-                    away_team_name = team_name(away_team_id, season)
-
-                away_score = matchup["away"]["totalPoints"]
-                week = matchup["matchupPeriodId"]
-                away_game = {
-                    "year": year,
-                    "week": week,
-                    "team_name": away_team_name,
-                    "score": away_score
-                }
-                all_scores.append(away_game)
-
-                home_team_id = matchup["home"]["teamId"]
-                if season["seasonId"] == year:
-                    home_team_name = team_name(home_team_id, season)
-
-                home_score = matchup["home"]["totalPoints"]
-                week = matchup["matchupPeriodId"]
-                home_game = {
-                    "year": year,
-                    "week": week,
-                    "team_name": home_team_name,
-                    "score": home_score
-                }
-                all_scores.append(home_game)
-
-        sorted_scores = sorted(
-            all_scores,
-            key=lambda s: s['score'],
-            reverse=highest
-            )
-
-        return sorted_scores[0:count]
-
+        if warehouse.ENABLED:
+            league_id = session['league_id']
+            await warehouse.sync(league_id, start_year, end_year, http_session)
+            table = warehouse.matchup_table(league_id)
+        else:
+            plan = FetchPlan().add_seasons(start_year, end_year, SEASON_VIEWS)
+            bundle = await plan.resolve(http_session)
+            table = MatchupTable.from_bundle(start_year, end_year, bundle)
 
-def team_points(matchup, team_id):
-    """Find points scored by the correct team_id"""
-    if is_bye_week(matchup):
-        return 0
-
-    if matchup["away"]["teamId"] == team_id:
-        return matchup["away"]["totalPoints"]
-    elif matchup["home"]["teamId"] == team_id:
-        return matchup["home"]["totalPoints"]
-    else:
-        return 0
+        return table.weeks(start_year, end_year, playoffs, count, highest)
 
 
 def calculate_season_average(season, all_seasons, league_average, std_dev):
@@ -136,60 +99,143 @@ async def best_and_worst_seasons(start_year, end_year, count, best):
             {...}
         ]
     """
-    async with aiohttp.ClientSession() as http_session:
-        all_seasons_all_time = []
-
+    async with http_client.session() as http_session:
         start_year = await check_start_year(start_year, http_session)
         end_year = await check_end_year(end_year, http_session)
 
-        for year in range(int(start_year), int(end_year) + 1):
-            all_averages_this_year = []
-            all_seasons_this_year = []
+        league_id = session['league_id']
+        seasons = {}
+        missing = []
+        for year in range(start_year, end_year + 1):
+            cached = cached_seasons(league_id, year)
+            if cached is None:
+                missing.append(year)
+            else:
+                seasons[year] = cached
+
+        if missing and warehouse.ENABLED:
+            await warehouse.sync(league_id, missing[0], missing[-1],
+                                 http_session)
+            totals = warehouse.season_totals(league_id, missing[0],
+                                             missing[-1])
+            for year, rows in groupby(totals, key=lambda row: row[0]):
+                seasons[year] = season_averages_from_totals(year, rows)
+        elif missing:
+            plan = FetchPlan()
+            for year in missing:
+                for view in SEASON_VIEWS:
+                    plan.add(year, view)
+            bundle = await plan.resolve(http_session)
+
+            for year in missing:
+                seasons[year] = season_averages(year, bundle)
+
+        for year in missing:
+            store_seasons(league_id, year, seasons.get(year, []))
+
+        all_seasons_all_time = [
+            team_season
+            for year in range(start_year, end_year + 1)
+            for team_season in seasons.get(year, [])
+        ]
+        sorted_top_seasons = sorted(
+            all_seasons_all_time,
+            key=lambda t: t['std_dev_away'],
+            reverse=best
+            )
 
-            season = await load_data(year, 'mNav', http_session)
-            current_year_teams = season["teams"]
+        return sorted_top_seasons[0:count]
 
-            matchups = await load_matchups(year, http_session)
-            weeks = await number_of_weeks(year, False, http_session)
-            if weeks == 0:
-                continue
 
-            for team in current_year_teams:
-                current_team_id = team["id"]
-                current_team_name = team_name(current_team_id, season)
+def season_averages(year, bundle):
+    """Calculate every team's scoring average for a single season"""
+    all_seasons = []
 
-                total_points = 0
+    season = bundle[(year, 'mNav')]
+    current_year_teams = season["teams"]
 
-                for matchup in matchups:
-                    if matchup["matchupPeriodId"] > weeks:
-                        break
+    matchups = bundle[(year, 'mMatchupScore')]["schedule"]
+    weeks = weeks_in_season(bundle[(year, 'mSettings')], False)
+    if weeks == 0:
+        return all_seasons
 
-                    total_points += team_points(matchup, current_team_id)
+    # every team's points in one pass over the schedule
+    points = {team["id"]: 0 for team in current_year_teams}
+    for matchup in matchups:
+        if matchup["matchupPeriodId"] > weeks:
+            break
 
-                average_team_score = total_points / weeks
-                all_seasons_this_year.append({
-                        "year": year,
-                        "team_name": current_team_name,
-                        "average": round(average_team_score, 2)
-                    }
-                )
-                all_averages_this_year.append(round(average_team_score, 2))
+        if is_bye_week(matchup):
+            continue
 
-            std_dev_this_year = statistics.stdev(all_averages_this_year)
-            league_average = round(
-                sum(all_averages_this_year) / len(all_averages_this_year), 2
-            )
+        for side in ("away", "home"):
+            team_id = matchup[side]["teamId"]
+            if team_id in points:
+                points[team_id] += matchup[side]["totalPoints"]
 
-            for season in all_seasons_this_year:
-                calculate_season_average(season,
-                                         all_seasons_all_time,
-                                         league_average,
-                                         std_dev_this_year)
+    totals = [
+        (year, team_name(team_id, season), total_points, weeks)
+        for team_id, total_points in points.items()
+    ]
+    return season_averages_from_totals(year, totals)
 
-        sorted_top_seasons = sorted(
-            all_seasons_all_time,
-            key=lambda t: t['std_dev_away'],
-            reverse=best
-            )
 
-        return sorted_top_seasons[0:count]
+def season_averages_from_totals(year, totals):
+    """Compare every team's scoring average to the league for a season.
+
+    Arguments:
+        year (int) -- the season
+        totals (iterable) -- (year, team name, points, weeks) for each team
+    """
+    all_seasons = []
+    all_averages_this_year = []
+    all_seasons_this_year = []
+
+    for _year, current_team_name, total_points, weeks in totals:
+        average_team_score = total_points / weeks
+        all_seasons_this_year.append({
+                "year": year,
+                "team_name": current_team_name,
+                "average": round(average_team_score, 2)
+            }
+        )
+        all_averages_this_year.append(round(average_team_score, 2))
+
+    std_dev_this_year = statistics.stdev(all_averages_this_year)
+    league_average = round(
+        sum(all_averages_this_year) / len(all_averages_this_year), 2
+    )
+
+    for season in all_seasons_this_year:
+        calculate_season_average(season,
+                                 all_seasons,
+                                 league_average,
+                                 std_dev_this_year)
+
+    return all_seasons
+
+
+def cached_seasons(league_id, year):
+    """Get a completed season's team seasons, None if not worked out yet"""
+    with _seasons_lock:
+        cached = _seasons.get((str(league_id), int(year)))
+        if cached is not None:
+            _seasons.move_to_end((str(league_id), int(year)))
+        return cached
+
+
+def store_seasons(league_id, year, seasons):
+    """Keep a season's team seasons if the season is over"""
+    if not cache.completed(league_id, year):
+        return
+    with _seasons_lock:
+        _seasons[(str(league_id), int(year))] = seasons
+        _seasons.move_to_end((str(league_id), int(year)))
+        while len(_seasons) > MAX_SEASONS:
+            _seasons.popitem(last=False)
+
+
+def clear():
+    """Drop every cached season"""
+    with _seasons_lock:
+        _seasons.clear()
@@ -1,10 +1,16 @@
 # Import flask and datetime module for showing date and time
 from flask import Flask, request, session
 from flask_cors import CORS
+import atexit
 import datetime
+import functools
+import http_client
+import single_flight
 import league_info
+import luck
 import standings
 import head_to_head
+import playoff_odds
 import power_rankings
 import scores
 import matchups
@@ -20,23 +26,78 @@ app.config['CORS_HEADERS'] = 'Content-Type'
 app.secret_key = 'super secret key'
 app.config['SESSION_TYPE'] = 'filesystem'
 
+# one pooled, keep-alive connection to ESPN shared by every request
+http_client.start()
+atexit.register(http_client.stop)
+
+
+def bad_request(message):
+    """Respond to a request with a bad query string"""
+    return {"error": message}, 400
+
+
+def int_arg(args, name, minimum=0):
+    """Read a whole number from the query string, None if it's missing.
+
+    Raises ValueError if it isn't a whole number or is below minimum.
+    """
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(name + ' must be a whole number')
+    if number < minimum:
+        raise ValueError(name + ' must be at least ' + str(minimum))
+    return number
+
+
+def coalesce(view):
+    """Share one run of a route between identical requests in flight.
+
+    Requests are identical when they have the same path and query string,
+    e.g. a group chat full of people opening the same league's standings.
+    The league is put in each request's own session before joining, since
+    a request that joins another's run doesn't run the view itself.
+    """
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        session['league_id'] = request.args.get('leagueId')
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        return await single_flight.routes.do(
+            key, lambda: view(*args, **kwargs)
+        )
+    return wrapper
+
 
 @app.route('/', methods=['GET'])
 def health():
     return 'OK'
 
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    return single_flight.stats()
+
+
 @app.route('/info', methods=['GET'])
 # @cross_origin()
 async def home():
-    session['league_id'] = request.args.get('leagueId')
-    resp = await league_info.summary()
+    resp = await league_summary()
+    # outside the coalesced run so requests that joined it get it too
     if "established" in resp:
         session['start_year'] = resp['established']
     return resp
 
 
+@coalesce
+async def league_summary():
+    return await league_info.summary()
+
+
 @app.route('/standings', methods=['GET'])
+@coalesce
 async def all_time_standings():
     session['league_id'] = request.args.get('leagueId')
     resp = await standings.list()
@@ -44,6 +105,7 @@ async def all_time_standings():
 
 
 @app.route('/head-to-head-form', methods=['GET'])
+@coalesce
 async def h2h_form():
     session['league_id'] = request.args.get('leagueId')
     resp = await head_to_head.options()
@@ -51,6 +113,7 @@ async def h2h_form():
 
 
 @app.route('/head-to-head', methods=['GET'])
+@coalesce
 async def h2h_results():
     args = request.args
     session['league_id'] = args.get('leagueId')
@@ -60,7 +123,16 @@ async def h2h_results():
     return resp
 
 
+@app.route('/head-to-head-matrix', methods=['GET'])
+@coalesce
+async def h2h_matrix():
+    session['league_id'] = request.args.get('leagueId')
+    resp = await head_to_head.matrix()
+    return resp
+
+
 @app.route('/individual-weeks', methods=['GET'])
+@coalesce
 async def list_weeks():
     args = request.args
     session['league_id'] = args.get('leagueId')
@@ -76,6 +148,7 @@ async def list_weeks():
 
 
 @app.route('/individual-seasons', methods=['GET'])
+@coalesce
 async def list_seasons():
     args = request.args
     session['league_id'] = args.get('leagueId')
@@ -90,6 +163,7 @@ async def list_seasons():
 
 
 @app.route('/matchups', methods=['GET'])
+@coalesce
 async def list_matchups():
     args = request.args
     session['league_id'] = args.get('leagueId')
@@ -105,13 +179,63 @@ async def list_matchups():
 
 
 @app.route('/power-rankings', methods=['GET'])
+@coalesce
 async def get_power_rankings():
     session['league_id'] = request.args.get('leagueId')
-    resp = await power_rankings.current()
+    try:
+        weights = power_rankings.parse_weights(request.args)
+    except ValueError as e:
+        return bad_request(str(e))
+    resp = await power_rankings.current(weights)
+    return resp
+
+
+@app.route('/power-rankings-history', methods=['GET'])
+@coalesce
+async def get_power_rankings_history():
+    args = request.args
+    session['league_id'] = args.get('leagueId')
+    try:
+        year = int_arg(args, 'year')
+        weights = power_rankings.parse_weights(args)
+    except ValueError as e:
+        return bad_request(str(e))
+    resp = await power_rankings.history(year, weights)
+    return resp
+
+
+@app.route('/playoff-odds', methods=['GET'])
+@coalesce
+async def get_playoff_odds():
+    args = request.args
+    session['league_id'] = args.get('leagueId')
+    try:
+        sims = int_arg(args, 'sims', minimum=1)
+        seed = int_arg(args, 'seed')
+    except ValueError as e:
+        return bad_request(str(e))
+    resp = await playoff_odds.odds(sims, seed)
+    return resp
+
+
+@app.route('/schedule-luck', methods=['GET'])
+@coalesce
+async def get_schedule_luck():
+    args = request.args
+    session['league_id'] = args.get('leagueId')
+    start_year = args.get('startyear') or None
+    end_year = args.get('endyear') or None
+    try:
+        permutations = int_arg(args, 'permutations') or 0
+        seed = int_arg(args, 'seed')
+    except ValueError as e:
+        return bad_request(str(e))
+    resp = await luck.history(start_year, end_year, permutations, seed)
     return resp
 
 
 @app.route('/keepers', methods=['GET'])
+@coalesce
 async def get_keeper_options():
     session['league_id'] = request.args.get('leagueId')
     resp = await rosters.keeper_options()
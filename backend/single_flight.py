@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Run one call per key at a time and share its result.
+
+    Calls with the same key that arrive while the first one is still
+    running wait for it instead of doing the work again. Flask runs each
+    request on its own thread and event loop, so waiters are handed a
+    thread-safe Future rather than an asyncio one.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key, fn):
+        """Run fn, or wait for the call already running with the same key.
+
+        Arguments:
+            key (hashable) -- identifies identical calls
+            fn (function) -- takes no arguments and returns a coroutine
+
+        Returns:
+            result (object) -- the result of the one call to fn
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        """Count calls that ran and calls that shared another's result"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced
+        }
+
+
+# identical ESPN API calls
+fetches = SingleFlight()
+# identical route computations in server.py
+routes = SingleFlight()
+
+
+def stats():
+    """Coalescing counters for ESPN calls and routes"""
+    return {
+        "fetches": fetches.stats(),
+        "routes": routes.stats()
+    }
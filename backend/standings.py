@@ -1,4 +1,8 @@
-import aiohttp
+import http_client
+import identity
+import warehouse
+from flask import session
+from planner import FetchPlan
 from utils import load_data, latest_season
 
 async def list():
@@ -29,7 +33,7 @@ async def list():
             ]
         }
     """
-    async with aiohttp.ClientSession() as http_session:
+    async with http_client.session() as http_session:
         all_records = {
             "seasons": [],
             "teams": []
@@ -39,59 +43,79 @@ async def list():
         details = await load_data(end_year, 'mNav', http_session)
         start_year = details["status"]["previousSeasons"][0]
 
+        people = identity.People()
+        if warehouse.ENABLED:
+            league_id = session['league_id']
+            await warehouse.sync(league_id, start_year, end_year, http_session)
+            for row in warehouse.standings(league_id, start_year, end_year):
+                if row["year"] not in all_records["seasons"]:
+                    all_records["seasons"].append(row["year"])
+                add_season(all_records, people, row["year"], row["owner_id"],
+                           row["first_name"], row["last_name"], row["wins"],
+                           row["losses"], row["ties"], row["playoff_seed"],
+                           row["final_rank"], row["teams_joined"])
+            return all_records
+
+        plan = FetchPlan().add_seasons(start_year, end_year, ['mTeam'])
+        bundle = await plan.resolve(http_session)
+
+        # owners are matched across seasons so merge them in year order
         for year in range(int(start_year), int(end_year) + 1):
-            team_details = await load_data(year, 'mTeam', http_session)
+            team_details = bundle[(year, 'mTeam')]
             if team_details["status"]["currentMatchupPeriod"] == 1:
                 continue
 
             all_records["seasons"].append(year)
             teams = team_details["teams"]
-            owners = team_details["members"]
+            owners = identity.season_teams(team_details)
 
             for team in teams:
                 record = team["record"]["overall"]
-                reg_season_place = team["playoffSeed"]
-                playoff_place = team["rankCalculatedFinal"]
-                total_teams = team_details["status"]["teamsJoined"]
-
                 owner_id = team["primaryOwner"]
-                team_info = next(
-                    (owner for owner in owners if owner["id"] == owner_id)
-                    )
-                fname = team_info["firstName"].strip().capitalize()
-                lname = team_info["lastName"].strip().capitalize()
-                owner = f'{fname} {lname}'
-
-                season_wins = record["wins"]
-                season_losses = record["losses"]
-                season_ties = record["ties"]
+                team_info = owners.member(owner_id)
                 # season_pf = int(record["pointsFor"])
                 # season_pa = int(record["pointsAgainst"])
 
-                season_summary = {
-                    "year": year,
-                    "wins": season_wins,
-                    "losses": season_losses,
-                    "ties": season_ties,
-                    "reg_season_champ": reg_season_place == 1,
-                    "playoff_champ": playoff_place == 1,
-                    "toilet_bowl": reg_season_place == total_teams
-                }
-
-                # check if this owner has entry in all_records
-                obj = (
-                    next((x for x in all_records["teams"] if x["name"] == owner), None) or # try to match on name
-                    next((x for x in all_records["teams"] if x["id"] == owner_id), None) # use id in case name changed
-                )
-                if obj is not None:
-                    obj["seasons"].append(season_summary)
-                else:
-                    all_records["teams"].append({
-                        "name": owner,
-                        "id": owner_id,
-                        "seasons": [
-                            season_summary
-                        ]
-                    })
+                add_season(all_records, people, year, owner_id,
+                           team_info["firstName"], team_info["lastName"],
+                           record["wins"], record["losses"], record["ties"],
+                           team["playoffSeed"], team["rankCalculatedFinal"],
+                           team_details["status"]["teamsJoined"])
 
         return all_records
+
+
+def add_season(all_records, people, year, owner_id, first_name, last_name,
+               wins, losses, ties, reg_season_place, playoff_place,
+               total_teams):
+    """Add one team's season to its owner's entry in all_records.
+
+    people (identity.People) matches the owner to their entry, by name or
+    by ID in case their name changed.
+    """
+    fname = first_name.strip().capitalize()
+    lname = last_name.strip().capitalize()
+    owner = f'{fname} {lname}'
+
+    season_summary = {
+        "year": year,
+        "wins": wins,
+        "losses": losses,
+        "ties": ties,
+        "reg_season_champ": reg_season_place == 1,
+        "playoff_champ": playoff_place == 1,
+        "toilet_bowl": reg_season_place == total_teams
+    }
+
+    # check if this owner has entry in all_records
+    person = people.find(owner_id, owner)
+    if person < len(all_records["teams"]):
+        all_records["teams"][person]["seasons"].append(season_summary)
+    else:
+        all_records["teams"].append({
+            "name": owner,
+            "id": owner_id,
+            "seasons": [
+                season_summary
+            ]
+        })
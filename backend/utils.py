@@ -1,10 +1,37 @@
+import asyncio
 import json
 import collections
-from flask import session
+import os
+import cache
+import identity
+import single_flight
+from flask import g, session
 
 from datetime import date
 from itertools import groupby
 
+# league endpoints live here, fantasy.espn.com redirects to the same host
+ESPN_API_URL = os.environ.get(
+    'ESPN_API_URL', 'https://lm-api-reads.fantasy.espn.com/apis/v3/games/ffl'
+)
+
+# max number of seasons fetched at once by for_each_season
+SEASON_CONCURRENCY = int(os.environ.get('ALMANAC_SEASON_CONCURRENCY', 8))
+
+# top level keys in every response no matter the view
+COMMON_KEYS = ('gameId', 'id', 'scoringPeriodId', 'seasonId', 'segmentId')
+
+# top level keys each view returns, used to split combined responses
+VIEW_KEYS = {
+    'mDraftDetail': ('draftDetail', 'settings', 'status'),
+    'mMatchupScore': ('draftDetail', 'schedule', 'status'),
+    'mNav': ('draftDetail', 'members', 'settings', 'status', 'teams'),
+    'mRoster': ('draftDetail', 'status', 'teams'),
+    'mSettings': ('draftDetail', 'settings', 'status'),
+    'mStatus': ('draftDetail', 'status'),
+    'mTeam': ('draftDetail', 'members', 'status', 'teams'),
+}
+
 
 async def load_data(year, uri, http_session, week=None, headers=None):
     """Call the ESPN API based on arguments passed and current year.
@@ -12,6 +39,11 @@ async def load_data(year, uri, http_session, week=None, headers=None):
     The format of the endpoint is different from pre-2019 and 2019-present
     so the format of the url depends on the year.
 
+    Successful responses are kept in the response cache. Completed seasons
+    are cached forever and the current season for a short time depending
+    on the season status. Identical calls made during the same request
+    share a single fetch.
+
     Arguments:
         year (int) -- year data is needed for
         uri (str) -- the endpoint to hit, mTeam, mRoster, etc.
@@ -22,28 +54,136 @@ async def load_data(year, uri, http_session, week=None, headers=None):
     Returns:
         resp_json (object) -- the data returned by the API
     """
+    resp = await load_views(year, [uri], http_session, week, headers)
+    return resp[uri]
+
+
+async def load_views(year, views, http_session, week=None, headers=None):
+    """Call the ESPN API once for several views of the same season.
+
+    The endpoint accepts any number of view parameters and merges them into
+    one response. That response is split back up and cached per view so
+    later calls to load_data for a single view are still cache hits.
+
+    Arguments:
+        year (int) -- year data is needed for
+        views (list) -- the endpoints to combine, mTeam, mRoster, etc.
+        http_session (aiohttp) -- the aiohttp session created in calling script
+        week (int or None) -- week of season if it needs to be specified
+        headers (object or None) -- headers to include in request
+
+    Returns:
+        resp (dict) -- the data returned by the API for each view
+    """
+    league_id = session['league_id']
+    in_flight = g.setdefault('espn_requests', {})
+    keys = [cache.key(league_id, year, view, week, headers) for view in views]
+
+    missing = [view for view, key in zip(views, keys) if key not in in_flight]
+    if missing:
+        fetch = asyncio.ensure_future(
+            fetch_views(league_id, year, missing, http_session, week, headers)
+        )
+        for view in missing:
+            key = cache.key(league_id, year, view, week, headers)
+            in_flight[key] = asyncio.ensure_future(pick_view(fetch, view))
+
+    responses = await asyncio.gather(*[in_flight[key] for key in keys])
+    return dict(zip(views, responses))
+
+
+async def pick_view(fetch, view):
+    """Wait for a combined fetch and return the response for one view"""
+    return (await fetch)[view]
+
+
+async def fetch_views(league_id, year, views, http_session, week=None,
+                      headers=None):
+    """Call the ESPN API for the views that aren't cached.
+
+    Identical calls already in flight from other requests are shared
+    rather than sent to ESPN again.
+
+    Returns:
+        resp (dict) -- the data for each view, cached or fetched
+    """
+    resp = {}
+    for view in views:
+        cached = cache.responses.get(
+            cache.key(league_id, year, view, week, headers)
+        )
+        if cached is not None:
+            resp[view] = cached
+
+    uncached = [view for view in views if view not in resp]
+    if not uncached:
+        return resp
+
+    flight_key = cache.key(league_id, year, tuple(uncached), week, headers)
+    fetched = await single_flight.fetches.do(
+        flight_key,
+        lambda: request_views(league_id, year, uncached, http_session, week,
+                              headers)
+    )
+    resp.update(fetched)
+    return resp
+
+
+async def request_views(league_id, year, views, http_session, week=None,
+                        headers=None):
+    """Make a single ESPN API call for views and cache each one"""
+    resp = {}
+    view_params = "".join("&view=" + view for view in views)
     if year > 2019:
         url = (
-          "http://fantasy.espn.com/apis/v3/games/ffl/seasons/" + str(year) +
-          "/segments/0/leagues/" + str(session['league_id']) +
-          "?&view=" + uri +
+          ESPN_API_URL + "/seasons/" + str(year) +
+          "/segments/0/leagues/" + str(league_id) +
+          "?" + view_params +
           ("&scoringPeriodId=" + str(week) if week is not None else '')
         )
-        resp = await http_session.request(method='GET', url=url, headers=headers)
-        resp_json = await resp.json()
-        return resp_json
+        http_resp = await http_session.request(method='GET', url=url,
+                                               headers=headers)
+        resp_json = await http_resp.json()
     else:
         url = (
-            "https://lm-api-reads.fantasy.espn.com/apis/v3/games/ffl/leagueHistory/" +
-            str(session['league_id']) +
+            ESPN_API_URL + "/leagueHistory/" +
+            str(league_id) +
             "?seasonId=" +
             str(year) +
-            "&view=" + uri +
+            view_params +
             ("&scoringPeriodId=" + str(week) if week is not None else '')
         )
-        resp = await http_session.request(method='GET', url=url, headers=headers)
-        resp_json = await resp.json()
-        return resp_json[0]
+        http_resp = await http_session.request(method='GET', url=url,
+                                               headers=headers)
+        resp_json = (await http_resp.json())[0]
+
+    for view in views:
+        # errors such as GENERAL_NOT_FOUND are returned but not cached
+        if http_resp.status != 200:
+            resp[view] = resp_json
+            continue
+
+        resp[view] = split_view(resp_json, view, len(views) > 1)
+        cache.responses.put(
+            cache.key(league_id, year, view, week, headers),
+            resp[view],
+            cache.ttl(league_id, year)
+        )
+    return resp
+
+
+def split_view(resp_json, view, combined):
+    """Pull the part of a combined response that belongs to one view.
+
+    Views share top level objects like teams and status, so the split keeps
+    every top level key the view returns on its own. Views that aren't in
+    VIEW_KEYS keep the whole response.
+    """
+    if not combined or view not in VIEW_KEYS:
+        return resp_json
+
+    keys = COMMON_KEYS + VIEW_KEYS[view]
+    return {k: v for k, v in resp_json.items() if k in keys}
 
 
 async def player_info(year, http_session):
@@ -78,7 +218,11 @@ async def load_transactions(year, http_session, week=None):
 async def number_of_weeks(year, playoffs, http_session):
     """Determine weeks in season depending on whether playoffs are included"""
     season = await load_data(year, 'mSettings', http_session)
+    return weeks_in_season(season, playoffs)
+
 
+def weeks_in_season(season, playoffs):
+    """Determine weeks in season from an mSettings response"""
     current_week = season["status"]["latestScoringPeriod"]
     total_weeks = season["status"]["finalScoringPeriod"]
     regular_season_weeks = (
@@ -95,6 +239,34 @@ async def number_of_weeks(year, playoffs, http_session):
         return regular_season_weeks
 
 
+async def for_each_season(start_year, end_year, fetch_season, limit=None):
+    """Run a per-season coroutine for every year concurrently.
+
+    At most `limit` seasons are in flight at once so long-lived leagues
+    don't flood the ESPN API. Results are returned in year order no matter
+    which season finishes first.
+
+    Arguments:
+        start_year (int) -- the first year to fetch
+        end_year (int) -- the last year to fetch
+        fetch_season (coroutine function) -- called with each year
+        limit (int or None) -- max concurrent seasons, SEASON_CONCURRENCY
+            if not specified
+
+    Returns:
+        results (list) -- return value of fetch_season for each year
+    """
+    semaphore = asyncio.Semaphore(limit or SEASON_CONCURRENCY)
+
+    async def fetch(year):
+        async with semaphore:
+            return await fetch_season(year)
+
+    return await asyncio.gather(
+        *[fetch(year) for year in range(int(start_year), int(end_year) + 1)]
+    )
+
+
 def is_bye_week(matchup):
     """Determine if matchup object is a bye"""
     if ("away" in matchup) and ("home" in matchup):
@@ -105,9 +277,7 @@ def is_bye_week(matchup):
 
 def team_name(team_id, season_obj):
     """Get team name from season object given team id"""
-    for team in season_obj["teams"]:
-        if team["id"] == team_id:
-            return str(team["location"] + " " + team["nickname"])
+    return identity.season_teams(season_obj).name(team_id)
 
 
 async def team_mapping(year, http_session):
@@ -121,9 +291,7 @@ async def team_mapping(year, http_session):
 
 def fantasy_team_logo(team_id, season_obj):
     """Find team logo URL from seasons object based on team id"""
-    for team in season_obj["teams"]:
-        if team["id"] == team_id:
-            return team["logo"]
+    return identity.season_teams(season_obj).logo(team_id)
 
 
 def print_to_file(content, file):
@@ -143,14 +311,19 @@ async def latest_season(http_session):
 
 
 async def season_status(http_session):
-    """Find the status of the current fantasy season"""
+    """Find the status of the current fantasy season.
+
+    This reads mNav rather than mStatus because mNav has the same status
+    and draft details and is needed by check_start_year and most routes,
+    so the request only fetches it once.
+    """
     this_year = date.today().year
-    resp = await load_data(this_year, 'mStatus', http_session)
+    resp = await load_data(this_year, 'mNav', http_session)
     if "details" in resp:
         # try the year before because the season leaks into January
         if resp["details"][0]["type"] == 'GENERAL_NOT_FOUND':
             this_year = int(this_year) - 1
-            resp = await load_data(this_year, 'mStatus', http_session)
+            resp = await load_data(this_year, 'mNav', http_session)
             if "details" in resp:
                 return {
                     "error": resp["details"][0]
@@ -170,6 +343,8 @@ async def season_status(http_session):
     else:
         status = "active"
 
+    cache.set_current_season(session['league_id'], current_season, status)
+
     return {
         "season": current_season,
         "status": status
@@ -0,0 +1,622 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import cache
+import identity
+import rivalries
+from columnar import MatchupTable
+from decimal import Decimal
+from planner import FetchPlan
+from utils import is_bye_week, team_name, weeks_in_season
+
+# answer history routes from normalized tables instead of raw ESPN JSON
+ENABLED = os.environ.get('ALMANAC_WAREHOUSE', 'true') == 'true'
+WAREHOUSE_PATH = os.environ.get(
+    'ALMANAC_WAREHOUSE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 'warehouse.sqlite3')
+)
+
+# views a season is ingested from
+SEASON_VIEWS = ('mSettings', 'mMatchupScore', 'mNav', 'mTeam')
+
+# Each season is ingested once it's complete. The current season is
+# ingested as weeks finish, only adding the weeks that are new, unless a
+# stat correction changed a week already stored: scores_hash is a hash of
+# the stored weeks' scores and the whole season is ingested again when it
+# no longer matches. A season is also ingested in full when it completes.
+# Matchups and team-weeks only hold finished weeks, and byes are left out
+# since they have no score. regular marks weeks before the playoffs.
+# head_to_head holds each pair of owners' aggregates for a season, see
+# rivalries.py. Points are stored as text to keep them exact.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seasons (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    current_matchup_period INTEGER NOT NULL,
+    latest_scoring_period INTEGER NOT NULL,
+    regular_weeks INTEGER NOT NULL,
+    total_weeks INTEGER NOT NULL,
+    teams_joined INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    scores_hash TEXT,
+    PRIMARY KEY (league_id, year)
+);
+CREATE TABLE IF NOT EXISTS owners (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    owner_id TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    PRIMARY KEY (league_id, year, owner_id)
+);
+CREATE TABLE IF NOT EXISTS teams (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    team_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    owner_id TEXT,
+    primary_owner TEXT,
+    name TEXT,
+    logo TEXT,
+    wins INTEGER,
+    losses INTEGER,
+    ties INTEGER,
+    playoff_seed INTEGER,
+    final_rank INTEGER,
+    PRIMARY KEY (league_id, year, team_id)
+);
+CREATE TABLE IF NOT EXISTS matchups (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    tier TEXT NOT NULL,
+    regular INTEGER NOT NULL,
+    winner TEXT,
+    away_team_id INTEGER NOT NULL,
+    home_team_id INTEGER NOT NULL,
+    away_owner_id TEXT,
+    home_owner_id TEXT,
+    away_points REAL NOT NULL,
+    home_points REAL NOT NULL,
+    margin REAL NOT NULL,
+    PRIMARY KEY (league_id, year, idx)
+);
+CREATE TABLE IF NOT EXISTS team_weeks (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    matchup_idx INTEGER NOT NULL,
+    side INTEGER NOT NULL,
+    team_id INTEGER NOT NULL,
+    owner_id TEXT,
+    points REAL NOT NULL,
+    opponent_points REAL NOT NULL,
+    tier TEXT NOT NULL,
+    regular INTEGER NOT NULL,
+    PRIMARY KEY (league_id, year, matchup_idx, side)
+);
+CREATE TABLE IF NOT EXISTS head_to_head (
+    league_id TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    owner_1 TEXT NOT NULL,
+    owner_2 TEXT NOT NULL,
+    team_id_1 INTEGER,
+    team_id_2 INTEGER,
+    reg_wins_1 INTEGER NOT NULL,
+    reg_wins_2 INTEGER NOT NULL,
+    reg_ties INTEGER NOT NULL,
+    reg_points_1 TEXT NOT NULL,
+    reg_points_2 TEXT NOT NULL,
+    playoff_wins_1 INTEGER NOT NULL,
+    playoff_wins_2 INTEGER NOT NULL,
+    playoff_points_1 TEXT NOT NULL,
+    playoff_points_2 TEXT NOT NULL,
+    decided INTEGER NOT NULL,
+    first_winner TEXT,
+    first_length INTEGER NOT NULL,
+    current_winner TEXT,
+    current_length INTEGER NOT NULL,
+    longest_winner TEXT,
+    longest_length INTEGER NOT NULL,
+    PRIMARY KEY (league_id, year, owner_1, owner_2)
+);
+CREATE INDEX IF NOT EXISTS team_weeks_week
+    ON team_weeks (league_id, year, week);
+CREATE INDEX IF NOT EXISTS team_weeks_team
+    ON team_weeks (league_id, year, team_id, regular, points);
+CREATE INDEX IF NOT EXISTS team_weeks_owner ON team_weeks (league_id, owner_id);
+CREATE INDEX IF NOT EXISTS team_weeks_points ON team_weeks (league_id, points);
+CREATE INDEX IF NOT EXISTS matchups_week ON matchups (league_id, year, week);
+CREATE INDEX IF NOT EXISTS matchups_owners
+    ON matchups (league_id, away_owner_id, home_owner_id);
+CREATE INDEX IF NOT EXISTS matchups_margin ON matchups (league_id, margin);
+"""
+
+# sqlite connections can't be shared between threads
+_local = threading.local()
+# one season is ingested at a time so concurrent requests don't both do it
+_ingest_lock = threading.Lock()
+# league id -> (seasons ingested, MatchupTable), see matchup_table
+_tables = {}
+# league id -> (complete seasons, entries), see head_to_head
+_h2h_complete = {}
+# league id -> (seasons ingested, entries, last team names)
+_h2h = {}
+_tables_lock = threading.Lock()
+
+
+def connect():
+    """Get this thread's connection, creating the tables if needed"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        directory = os.path.dirname(WAREHOUSE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(WAREHOUSE_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        migrate(conn)
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def migrate(conn):
+    """Add columns missing from a database made by an older version"""
+    columns = {row["name"] for row in conn.execute(
+        'PRAGMA table_info(seasons)'
+    )}
+    if 'scores_hash' not in columns:
+        with conn:
+            conn.execute('ALTER TABLE seasons ADD COLUMN scores_hash TEXT')
+
+
+def clear():
+    """Delete every ingested season"""
+    conn = connect()
+    with conn:
+        for table in ('seasons', 'owners', 'teams', 'matchups', 'team_weeks',
+                      'head_to_head'):
+            conn.execute('DELETE FROM ' + table)
+    with _tables_lock:
+        _tables.clear()
+        _h2h_complete.clear()
+        _h2h.clear()
+
+
+async def sync(league_id, start_year, end_year, http_session):
+    """Make sure every season from start_year to end_year is ingested.
+
+    Complete seasons are skipped without calling ESPN. Other seasons are
+    loaded through the response cache and only ingested when a new week
+    has finished.
+
+    Arguments:
+        league_id (str) -- ESPN league ID
+        start_year (int) -- the first year needed
+        end_year (int) -- the last year needed
+        http_session (aiohttp) -- the aiohttp session created in calling
+            script
+    """
+    rows = connect().execute(
+        'SELECT year FROM seasons WHERE league_id = ? AND complete = 1 '
+        'AND year BETWEEN ? AND ?',
+        (str(league_id), int(start_year), int(end_year))
+    ).fetchall()
+    complete = {row["year"] for row in rows}
+
+    plan = FetchPlan()
+    years = [year for year in range(int(start_year), int(end_year) + 1)
+             if year not in complete]
+    for year in years:
+        for view in SEASON_VIEWS:
+            plan.add(year, view)
+    bundle = await plan.resolve(http_session)
+
+    for year in years:
+        ingest(league_id, year, bundle)
+
+
+def scores_hash(schedule, last_week):
+    """Hash every score through last_week, which changes with stat
+    corrections"""
+    digest = hashlib.sha256()
+    for idx, matchup in enumerate(schedule):
+        week = matchup["matchupPeriodId"]
+        if week > last_week or is_bye_week(matchup):
+            continue
+        digest.update(repr((
+            idx, week, matchup.get("winner"),
+            matchup["away"]["teamId"], matchup["away"]["totalPoints"],
+            matchup["home"]["teamId"], matchup["home"]["totalPoints"],
+        )).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def ingest(league_id, year, bundle):
+    """Load a season's responses into the tables.
+
+    Only weeks that finished since the season was last ingested are
+    added, unless the scores of the weeks already stored changed or the
+    season just completed, which ingest the whole season again. Teams and
+    owners are replaced since records change every week.
+    """
+    league_id = str(league_id)
+    settings = bundle[(year, 'mSettings')]
+    status = settings["status"]
+    regular_weeks = weeks_in_season(settings, False)
+    total_weeks = weeks_in_season(settings, True)
+    complete = cache.completed(league_id, year)
+    schedule = bundle[(year, 'mMatchupScore')]["schedule"]
+
+    with _ingest_lock:
+        conn = connect()
+        previous = conn.execute(
+            'SELECT * FROM seasons WHERE league_id = ? AND year = ?',
+            (league_id, year)
+        ).fetchone()
+        if previous is not None and previous["complete"]:
+            return
+
+        # weeks already stored keep their scores unless ESPN corrected one
+        unchanged = (
+            previous is not None and
+            previous["total_weeks"] <= total_weeks and
+            previous["scores_hash"] ==
+            scores_hash(schedule, previous["total_weeks"])
+        )
+        if unchanged and not complete and (
+            previous["latest_scoring_period"] ==
+            status["latestScoringPeriod"] and
+            previous["current_matchup_period"] ==
+            status["currentMatchupPeriod"]
+        ):
+            return
+
+        first_week = 0
+        if unchanged and not complete:
+            first_week = previous["total_weeks"]
+
+        with conn:
+            conn.execute(
+                'DELETE FROM matchups WHERE league_id = ? AND year = ? '
+                'AND week > ?', (league_id, year, first_week)
+            )
+            conn.execute(
+                'DELETE FROM team_weeks WHERE league_id = ? AND year = ? '
+                'AND week > ?', (league_id, year, first_week)
+            )
+            ingest_teams(conn, league_id, year, bundle)
+            ingest_matchups(conn, league_id, year, bundle, first_week,
+                            total_weeks, settings)
+            conn.execute(
+                'INSERT OR REPLACE INTO seasons (league_id, year, '
+                'current_matchup_period, latest_scoring_period, '
+                'regular_weeks, total_weeks, teams_joined, complete, '
+                'scores_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (league_id, year, status["currentMatchupPeriod"],
+                 status["latestScoringPeriod"], regular_weeks, total_weeks,
+                 status["teamsJoined"], int(complete),
+                 scores_hash(schedule, total_weeks))
+            )
+
+
+def ingest_teams(conn, league_id, year, bundle):
+    """Replace a season's teams and owners"""
+    nav = bundle[(year, 'mNav')]
+    mteam = bundle[(year, 'mTeam')]
+    nav_teams = {team["id"]: team for team in nav["teams"]}
+
+    conn.execute('DELETE FROM teams WHERE league_id = ? AND year = ?',
+                 (league_id, year))
+    conn.execute('DELETE FROM owners WHERE league_id = ? AND year = ?',
+                 (league_id, year))
+
+    conn.executemany(
+        'INSERT INTO owners VALUES (?, ?, ?, ?, ?)',
+        [(league_id, year, member["id"], member.get("firstName"),
+          member.get("lastName")) for member in mteam.get("members", [])]
+    )
+
+    rows = []
+    for idx, team in enumerate(mteam["teams"]):
+        nav_team = nav_teams.get(team["id"], team)
+        owners = nav_team.get("owners") or [None]
+        record = team["record"]["overall"]
+        rows.append((
+            league_id, year, team["id"], idx, owners[0],
+            team.get("primaryOwner"), team_name(team["id"], nav),
+            nav_team.get("logo"), record["wins"], record["losses"],
+            record["ties"], team.get("playoffSeed"),
+            team.get("rankCalculatedFinal")
+        ))
+    conn.executemany(
+        'INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        rows
+    )
+
+
+def ingest_matchups(conn, league_id, year, bundle, first_week, last_week,
+                    settings):
+    """Add finished matchups after first_week up to last_week"""
+    regular_season_weeks = (
+        settings["settings"]["scheduleSettings"]["matchupPeriodCount"]
+    )
+    teams = identity.season_teams(bundle[(year, 'mNav')])
+
+    matchup_rows = []
+    week_rows = []
+    games = []
+    schedule = bundle[(year, 'mMatchupScore')]["schedule"]
+    for idx, matchup in enumerate(schedule):
+        week = matchup["matchupPeriodId"]
+        if week <= first_week or week > last_week or is_bye_week(matchup):
+            continue
+
+        tier = matchup["playoffTierType"]
+        regular = int(week <= regular_season_weeks)
+        away = matchup["away"]
+        home = matchup["home"]
+        away_pts = away["totalPoints"]
+        home_pts = home["totalPoints"]
+        away_owner = teams.owner(away["teamId"])
+        home_owner = teams.owner(home["teamId"])
+
+        matchup_rows.append((
+            league_id, year, idx, week, tier, regular, matchup.get("winner"),
+            away["teamId"], home["teamId"], away_owner, home_owner,
+            away_pts, home_pts, round(abs(away_pts - home_pts), 2)
+        ))
+        week_rows.append((league_id, year, week, idx, 0, away["teamId"],
+                          away_owner, away_pts, home_pts, tier, regular))
+        week_rows.append((league_id, year, week, idx, 1, home["teamId"],
+                          home_owner, home_pts, away_pts, tier, regular))
+        if away_owner is not None and home_owner is not None:
+            games.append((away_owner, home_owner, away["teamId"],
+                           home["teamId"], Decimal(str(away_pts)),
+                           Decimal(str(home_pts)), tier))
+
+    conn.executemany(
+        'INSERT OR REPLACE INTO matchups '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        matchup_rows
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO team_weeks '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        week_rows
+    )
+    ingest_head_to_head(conn, league_id, year, games, first_week)
+
+
+def ingest_head_to_head(conn, league_id, year, games, first_week):
+    """Fold new games into the season's head to head aggregates.
+
+    Only the pairs that played are loaded and written, so a weekly update
+    costs the same no matter how old the league is.
+    """
+    entries = {}
+    if first_week == 0:
+        conn.execute('DELETE FROM head_to_head WHERE league_id = ? '
+                     'AND year = ?', (league_id, year))
+    else:
+        keys = {rivalries.pair_key(game[0], game[1]) for game in games}
+        for row in conn.execute(
+            'SELECT * FROM head_to_head WHERE league_id = ? AND year = ?',
+            (league_id, year)
+        ):
+            if (row["owner_1"], row["owner_2"]) in keys:
+                entries[(row["owner_1"], row["owner_2"])] = row_entry(row)
+
+    for game in games:
+        key = rivalries.pair_key(game[0], game[1])
+        if key not in entries:
+            entries[key] = rivalries.new_entry(key)
+        rivalries.add_matchup(entries[key], *game)
+
+    conn.executemany(
+        'INSERT OR REPLACE INTO head_to_head VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
+        '?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [entry_row(league_id, year, key, entry)
+         for key, entry in entries.items()]
+    )
+
+
+def entry_row(league_id, year, key, entry):
+    """Flatten a pair's entry into a head_to_head row"""
+    owner_1, owner_2 = key
+    record_1 = entry["records"][owner_1]
+    record_2 = entry["records"][owner_2]
+    return (
+        league_id, year, owner_1, owner_2,
+        entry["team_ids"].get(owner_1), entry["team_ids"].get(owner_2),
+        record_1["reg_wins"], record_2["reg_wins"], record_1["reg_ties"],
+        str(record_1["reg_points"]), str(record_2["reg_points"]),
+        record_1["playoff_wins"], record_2["playoff_wins"],
+        str(record_1["playoff_points"]), str(record_2["playoff_points"]),
+        entry["decided"],
+        entry["first_streak"][0], entry["first_streak"][1],
+        entry["current_streak"][0], entry["current_streak"][1],
+        entry["longest_streak"][0], entry["longest_streak"][1],
+    )
+
+
+def row_entry(row):
+    """Rebuild a pair's entry from a head_to_head row"""
+    entry = rivalries.new_entry((row["owner_1"], row["owner_2"]))
+    for side in ('1', '2'):
+        owner = row["owner_" + side]
+        entry["team_ids"][owner] = row["team_id_" + side]
+        entry["records"][owner] = {
+            "reg_wins": row["reg_wins_" + side],
+            "reg_ties": row["reg_ties"],
+            "reg_points": Decimal(row["reg_points_" + side]),
+            "playoff_wins": row["playoff_wins_" + side],
+            "playoff_points": Decimal(row["playoff_points_" + side]),
+        }
+    entry["decided"] = row["decided"]
+    entry["first_streak"] = [row["first_winner"], row["first_length"]]
+    entry["current_streak"] = [row["current_winner"], row["current_length"]]
+    entry["longest_streak"] = [row["longest_winner"], row["longest_length"]]
+    return entry
+
+
+def seasons_version(league_id):
+    """Fingerprint of what's been ingested for a league, which changes
+    whenever a season is ingested by any process using the database"""
+    return connect().execute(
+        'SELECT group_concat(version) FROM ('
+        "SELECT year || ':' || latest_scoring_period || ':' || "
+        "current_matchup_period || ':' || complete || ':' || "
+        "COALESCE(scores_hash, '') AS version FROM seasons "
+        'WHERE league_id = ? ORDER BY year)', (str(league_id),)
+    ).fetchone()[0]
+
+
+def matchup_table(league_id):
+    """Get every ingested matchup of a league as a MatchupTable.
+
+    Tables are kept in memory and rebuilt when a season is ingested, by
+    this process or another one sharing the database.
+    """
+    league_id = str(league_id)
+    version = seasons_version(league_id)
+    with _tables_lock:
+        cached = _tables.get(league_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    rows = connect().execute(
+        'SELECT m.year, m.week, m.tier, m.regular, m.away_team_id, '
+        'm.home_team_id, m.away_owner_id, m.home_owner_id, m.away_points, '
+        'm.home_points, m.margin, a.name, h.name FROM matchups m '
+        'JOIN teams a ON a.league_id = m.league_id AND a.year = m.year '
+        'AND a.team_id = m.away_team_id '
+        'JOIN teams h ON h.league_id = m.league_id AND h.year = m.year '
+        'AND h.team_id = m.home_team_id '
+        'WHERE m.league_id = ? ORDER BY m.year, m.idx',
+        (league_id,)
+    ).fetchall()
+    table = MatchupTable(rows)
+
+    with _tables_lock:
+        _tables[league_id] = (version, table)
+    return table
+
+
+def head_to_head(league_id):
+    """Get all-time head to head entries for every pair in a league.
+
+    Complete seasons are joined once and kept until another season is
+    complete. The seasons still going are joined on top of them, which
+    only touches the pairs that have played this season.
+
+    Returns:
+        entries (dict) -- pair key to rivalries entry
+        last_names (dict) -- owner ID to their team's name in the latest
+            season they played, in the order owners joined the league
+    """
+    league_id = str(league_id)
+    version = seasons_version(league_id)
+    with _tables_lock:
+        cached = _h2h.get(league_id)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+    conn = connect()
+    complete_years = tuple(row[0] for row in conn.execute(
+        'SELECT year FROM seasons WHERE league_id = ? AND complete = 1 '
+        'ORDER BY year', (league_id,)
+    ))
+    with _tables_lock:
+        cached = _h2h_complete.get(league_id)
+    if cached is None or cached[0] != complete_years:
+        complete = join_seasons({}, conn.execute(
+            'SELECT h.* FROM head_to_head h JOIN seasons s '
+            'ON s.league_id = h.league_id AND s.year = h.year '
+            'WHERE h.league_id = ? AND s.complete = 1 ORDER BY h.year',
+            (league_id,)
+        ))
+        with _tables_lock:
+            _h2h_complete[league_id] = (complete_years, complete)
+    else:
+        complete = cached[1]
+
+    entries = join_seasons(dict(complete), conn.execute(
+        'SELECT h.* FROM head_to_head h JOIN seasons s '
+        'ON s.league_id = h.league_id AND s.year = h.year '
+        'WHERE h.league_id = ? AND s.complete = 0 ORDER BY h.year',
+        (league_id,)
+    ))
+
+    last_names = {}
+    for row in conn.execute(
+        'SELECT owner_id, name FROM teams '
+        'WHERE league_id = ? AND owner_id IS NOT NULL ORDER BY year, idx',
+        (league_id,)
+    ):
+        last_names[row[0]] = row[1]
+
+    with _tables_lock:
+        _h2h[league_id] = (version, entries, last_names)
+    return entries, last_names
+
+
+def join_seasons(entries, rows):
+    """Join season head_to_head rows, in year order, onto entries.
+
+    Entries already in the dict are replaced rather than changed, so a dict
+    copied from a cached one can be passed in.
+    """
+    for row in rows:
+        key = (row["owner_1"], row["owner_2"])
+        season = row_entry(row)
+        entries[key] = (
+            rivalries.merge(entries[key], season) if key in entries else season
+        )
+    return entries
+
+
+def season_totals(league_id, start_year, end_year):
+    """Total regular season points for every team in every season.
+
+    Returns:
+        totals (list) -- (year, team name, points, weeks) in year and team
+            order, for seasons with at least one finished week
+    """
+    return connect().execute(
+        'SELECT t.year, t.name, COALESCE(SUM(w.points), 0), s.regular_weeks '
+        'FROM teams t '
+        'JOIN seasons s ON s.league_id = t.league_id AND s.year = t.year '
+        'LEFT JOIN team_weeks w ON w.league_id = t.league_id '
+        'AND w.year = t.year AND w.team_id = t.team_id AND w.regular = 1 '
+        'WHERE t.league_id = ? AND t.year BETWEEN ? AND ? '
+        'AND s.regular_weeks > 0 GROUP BY t.year, t.team_id '
+        'ORDER BY t.year, t.idx',
+        (str(league_id), int(start_year), int(end_year))
+    ).fetchall()
+
+
+def standings(league_id, start_year, end_year):
+    """Every team's record and finish in seasons past the first week.
+
+    Returns:
+        teams (list) -- rows of year, owner_id, first_name, last_name,
+            wins, losses, ties, playoff_seed, final_rank and teams_joined
+            in year and team order
+    """
+    return connect().execute(
+        'SELECT t.year, t.primary_owner AS owner_id, o.first_name, '
+        'o.last_name, t.wins, t.losses, t.ties, t.playoff_seed, '
+        't.final_rank, s.teams_joined FROM teams t '
+        'JOIN seasons s ON s.league_id = t.league_id AND s.year = t.year '
+        'JOIN owners o ON o.league_id = t.league_id AND o.year = t.year '
+        'AND o.owner_id = t.primary_owner '
+        'WHERE t.league_id = ? AND t.year BETWEEN ? AND ? '
+        'AND s.current_matchup_period != 1 ORDER BY t.year, t.idx',
+        (str(league_id), int(start_year), int(end_year))
+    ).fetchall()
@@ -5,12 +5,17 @@ import LoadingSpinner from "../loadingSpinner/LoadingSpinner";
 import ReactMarkdown from 'react-markdown';
 import './PowerRankings.css';
 
+// how often, and how many times, to check on a writeup being written
+const WRITEUP_POLL_MS = 5000;
+const WRITEUP_POLLS = 36;
+
 const PowerRankings = ({ setError }) => {
 	const leagueId = useSelector((state) => state.leagueInfo.id)
 
 	const [loading, setLoading] = useState(true);
 	const [rankingsData, setRankingsData] = useState([]);
   const [writeup, setWriteup] = useState(null);
+  const [pendingWriteup, setPendingWriteup] = useState(null);
 	const [parsedRankings, setParsedRankings] = useState([]);
 	const [weights, setWeights] = useState({
 		wins: 3,
@@ -37,6 +42,8 @@ const PowerRankings = ({ setError }) => {
 
           if (data.writeup) {
             setWriteup(data.writeup);
+          } else if (data.writeup_status === 'pending') {
+            setPendingWriteup({ year: data.year, week: data.week });
           }
           
 					setLoading(false);
@@ -50,6 +57,40 @@ const PowerRankings = ({ setError }) => {
 		}
 	}, [rankingsData, leagueId, setError]);
 
+	// poll for the writeup while it's being written, which only reads S3
+	useEffect(() => {
+		if (!pendingWriteup || !leagueId) {
+			return undefined;
+		}
+
+		let polls = 0;
+		const timer = setInterval(() => {
+			polls += 1;
+			fetch(`${process.env.REACT_APP_API_URL}/power-rankings?leagueId=${leagueId}&writeup=true&year=${pendingWriteup.year}&week=${pendingWriteup.week}`,
+				{
+					crossDomain: true,
+					method: 'GET',
+					headers: { 'Content-Type':'application/json' },
+				}
+			)
+			.then((res) => res.json())
+			.then((data) => {
+				if (data.writeup) {
+					setWriteup(data.writeup);
+					setPendingWriteup(null);
+				} else if (data.writeup_status !== 'pending' || polls >= WRITEUP_POLLS) {
+					setPendingWriteup(null);
+				}
+			})
+			.catch((error) => {
+				console.error(error);
+				setPendingWriteup(null);
+			});
+		}, WRITEUP_POLL_MS);
+
+		return () => clearInterval(timer);
+	}, [pendingWriteup, leagueId]);
+
 	useEffect(() => {
 		if (rankingsData.length !== 0) {
 			const weightsSum = Object.values(weights).reduce((accu, val) => {
@@ -152,7 +193,9 @@ const PowerRankings = ({ setError }) => {
                   <ReactMarkdown>{writeup}</ReactMarkdown>
                 </div>
               </div>
-            ) : 'Check back later for the power rankings writeup.'}
+            ) : pendingWriteup
+              ? 'The power rankings writeup is being written...'
+              : 'Check back later for the power rankings writeup.'}
 					</Typography>
 
           <Typography
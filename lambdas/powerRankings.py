@@ -1,30 +1,175 @@
+import hashlib
 import json
+import math
+import time
 from utils import (
+    executor,
     is_bye_week,
     latest_season,
-    load_data,
+    load_all,
+    memory_stats,
     number_of_weeks,
     team_mapping
 )
-import statistics
 import boto3
+import numpy as np
 import os
+import uuid
+from botocore.exceptions import ClientError
 
 BUCKET_NAME = 'ffalmanac-data'
 
+# created once per container and reused by warm invocations
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 
-def update_overall_wins(tm, all_week_pts):
-    """Calculate overall wins in the week and add to overall."""
-    if 'overall_wins' not in tm:
-        tm["overall_wins"] = 0
-    for idx, s in enumerate(tm["scores"]):
-        week_overall_wins = sorted(all_week_pts[idx + 1]).index(s)
-        tm["overall_wins"] += week_overall_wins
+# seconds a checked week is served from S3 before ESPN is asked whether
+# its scores changed
+RANKINGS_TTL = int(os.environ.get('ALMANAC_RANKINGS_TTL', 600))
+# seconds a writeup job holds its lease, after which it's presumed dead
+# and another job may start
+WRITEUP_LEASE = int(os.environ.get('ALMANAC_WRITEUP_LEASE', 300))
+# S3 errors when a conditional put loses to another writer
+LOST_RACE = ('PreconditionFailed', 'ConditionalRequestConflict')
+
+
+# The ranking engine below, from DEFAULT_WEIGHTS to number, mirrors
+# backend/power_rankings.py, which the Lambda can't import. Change both.
+
+# how much each metric's rank counts toward the power ranking score
+DEFAULT_WEIGHTS = {
+    "wins": 3,
+    "l5": 1,
+    "points": 2,
+    "consistency": 1,
+    "overall_wins": 1,
+}
+# metrics where the lowest value ranks first, the rest rank highest first
+ASCENDING_METRICS = ('consistency',)
+
+
+def parse_weights(params):
+    """Read metric weights from query string parameters.
+
+    Metrics that aren't in params keep their default weight.
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for metric in DEFAULT_WEIGHTS:
+        value = (params or {}).get(metric)
+        if value is not None and value != '':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = float('nan')
+            if not math.isfinite(weight):
+                raise ValueError(metric + ' weight must be a number')
+            weights[metric] = weight
+
+    if min(weights.values()) < 0 or sum(weights.values()) <= 0:
+        raise ValueError('Weights must not be negative and must not all be 0')
+    return weights
+
+
+def score_matrix(matchups, last_week):
+    """Arrange regular season scores into a team by week matrix.
+
+    Teams are in the order they first appear in the schedule. Weeks a team
+    didn't play, such as a bye, are NaN.
+
+    Returns:
+        team_ids (list) -- team ID of each row
+        weeks (list) -- week of each column
+        points (ndarray) -- points scored each week
+        against (ndarray) -- points scored by the opponent each week
+        won (ndarray) -- whether the team won each week
+    """
+    team_ids = []
+    rows = {}
+    weeks = []
+    games = []
+    for matchup in matchups:
+        week = matchup["matchupPeriodId"]
+        if week > last_week:
+            break
+
+        if is_bye_week(matchup):
+            continue
+
+        if not weeks or weeks[-1] != week:
+            weeks.append(week)
+        for t in ["home", "away"]:
+            other = t == "home" and "away" or "home"
+            team_id = matchup[t]["teamId"]
+            if team_id not in rows:
+                rows[team_id] = len(team_ids)
+                team_ids.append(team_id)
+            games.append((rows[team_id], len(weeks) - 1,
+                          matchup[t]["totalPoints"],
+                          matchup[other]["totalPoints"],
+                          matchup["winner"].lower() == t))
+
+    points = np.full((len(team_ids), len(weeks)), np.nan)
+    against = np.full((len(team_ids), len(weeks)), np.nan)
+    won = np.zeros((len(team_ids), len(weeks)), dtype=bool)
+    if games:
+        rows, cols, pts, opp_pts, wins = zip(*games)
+        points[rows, cols] = pts
+        against[rows, cols] = opp_pts
+        won[rows, cols] = wins
+    return team_ids, weeks, points, against, won
+
+
+def average_ranks(values, descending=False):
+    """Rank values from 1, tied values share the average of their ranks"""
+    values = np.asarray(values, dtype=np.float64)
+    if descending:
+        values = -values
+    _unique, inverse, counts = np.unique(
+        values, return_inverse=True, return_counts=True
+    )
+    last = np.cumsum(counts)
+    return (last - (counts - 1) / 2)[inverse.reshape(-1)]
+
+
+def all_play_wins(points):
+    """Count wins each week if every team played every other team.
+
+    A tied score is half a win. Weeks a team didn't play are NaN.
+    """
+    wins = np.full(points.shape, np.nan)
+    for col in range(points.shape[1]):
+        played = ~np.isnan(points[:, col])
+        scores = points[played, col]
+        ordered = np.sort(scores)
+        below = np.searchsorted(ordered, scores, 'left')
+        tied = np.searchsorted(ordered, scores, 'right') - below - 1
+        wins[played, col] = below + tied / 2
+    return wins
+
+
+def last_games(played, count):
+    """Select each team's last `count` games played"""
+    from_end = np.cumsum(played[:, ::-1], axis=1)[:, ::-1]
+    return played & (from_end <= count)
+
+
+def power_scores(metrics, weights):
+    """Weight each metric's rank into a power ranking score, lower is better"""
+    total = 0
+    for metric, weight in weights.items():
+        ranks = average_ranks(metrics[metric],
+                              descending=metric not in ASCENDING_METRICS)
+        total = total + ranks * weight
+    return total / sum(weights.values())
+
+
+def number(value):
+    """Make a numpy number JSON friendly, as an int when it's whole"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
 
 
 def invoke_writeup_lambda(payload):
-    import boto3
-    lambda_client = boto3.client('lambda')
     lambda_client.invoke(
         FunctionName='writePowerRankings',
         InvocationType='Event',
@@ -32,10 +177,57 @@ def invoke_writeup_lambda(payload):
     )
 
 
+def rankings_dir(league_id, year, week):
+    """S3 folder for a week's rankings and writeup"""
+    return f"power_rankings/league_{league_id}/{year}/week_{week}"
+
+
+def latest_key(league_id):
+    """S3 key of the last week a league's rankings were checked"""
+    return f"power_rankings/league_{league_id}/latest.json"
+
+
+def rankings_key(league_id, year, week):
+    """S3 key of a week's rankings with the default weights"""
+    return f"{rankings_dir(league_id, year, week)}/rankings.json"
+
+
+def read_json(key):
+    """Load a JSON object from S3, None if it doesn't exist"""
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+def write_json(key, data):
+    """Store a JSON object in S3"""
+    s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=json.dumps(data),
+        ContentType='application/json'
+    )
+
+
+def scores_hash(matchups, last_week):
+    """Hash every score through last_week, which changes with stat
+    corrections"""
+    scores = [
+        [matchup["matchupPeriodId"]] + [
+            [matchup[side]["teamId"], matchup[side]["totalPoints"]]
+            for side in ("away", "home") if side in matchup
+        ]
+        for matchup in matchups
+        if matchup["matchupPeriodId"] <= last_week
+    ]
+    return hashlib.sha256(json.dumps(scores).encode('utf-8')).hexdigest()
+
+
 def check_rankings_cache(league_id, year, week):
-    s3 = boto3.client('s3')
     try:
-        key = f"power_rankings/league_{league_id}/{year}/week_{week}/rankings.md"
+        key = f"{rankings_dir(league_id, year, week)}/rankings.md"
         response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
         llm_output = response['Body'].read().decode('utf-8')
         return {
@@ -53,15 +245,229 @@ def check_rankings_cache(league_id, year, week):
             'message': str(e)
         }
 
-def current(league_id):
-    """Calculate current power rankings.
 
-    The return object is a list of the teams objects definedbelow.
+def lease_key(league_id, year, week):
+    """S3 key held while a week's writeup is being written"""
+    return f"{rankings_dir(league_id, year, week)}/writeup.lock"
+
+
+def read_lease(league_id, year, week):
+    """Get a week's writeup lease and its ETag, None if there isn't one"""
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME,
+                                 Key=lease_key(league_id, year, week))
+    except s3.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response['Body'].read()), response['ETag']
+
+
+def lease_expired(lease):
+    """Check if a writeup job has held its lease too long"""
+    return time.time() - lease["started_at"] > WRITEUP_LEASE
+
+
+def acquire_writeup_lease(league_id, year, week):
+    """Take the lease on writing a week's writeup.
+
+    The lease is created with a conditional put so only one caller gets
+    it. A lease older than WRITEUP_LEASE is taken over with a put
+    conditional on its ETag.
+
+    Returns:
+        token (str or None) -- identifies the lease, None if another
+            job has it
+    """
+    key = lease_key(league_id, year, week)
+    token = uuid.uuid4().hex
+    body = json.dumps({"started_at": time.time(), "token": token})
+    try:
+        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=body,
+                      IfNoneMatch='*')
+        return token
+    except ClientError as e:
+        if e.response['Error']['Code'] not in LOST_RACE:
+            raise
+
+    lease, etag = read_lease(league_id, year, week)
+    if lease is None or not lease_expired(lease):
+        return None
+    try:
+        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=body, IfMatch=etag)
+        return token
+    except ClientError as e:
+        if e.response['Error']['Code'] not in LOST_RACE:
+            raise
+        return None
+
+
+def writeup_pending(league_id, year, week):
+    """Check if a writeup job for the week is still running"""
+    lease, _etag = read_lease(league_id, year, week)
+    return lease is not None and not lease_expired(lease)
+
+
+def with_writeup(league_id, year, week, teams, weights, cache_result):
+    """Add the writeup to the rankings, starting one if there isn't one.
+
+    Only one writeup job runs for a week at a time, callers while it runs
+    get a "pending" status and can poll with writeup_status.
+    """
+    rankings = {
+        "teams": teams,
+        "year": year,
+        "week": week,
+        "writeup": None,
+        "writeup_status": "none",
+    }
+    if cache_result['status'] == 'success':
+        rankings["writeup"] = cache_result['writeup']
+        rankings["writeup_status"] = "ready"
+    elif weights == DEFAULT_WEIGHTS:
+        # call other lambda to write up, only for the default weights so
+        # the cached writeup matches what most people see
+        token = acquire_writeup_lease(league_id, year, week)
+        if token is not None:
+            invoke_writeup_lambda({
+                "year": year,
+                "week": week,
+                "league_id": league_id,
+                "lease": token,
+                "teams": teams
+            })
+        rankings["writeup_status"] = "pending"
+    elif writeup_pending(league_id, year, week):
+        rankings["writeup_status"] = "pending"
+    return rankings
+
+
+def writeup_status(league_id, year, week):
+    """Check on a week's writeup without calling ESPN, for polling"""
+    cache_result = check_rankings_cache(league_id, year, week)
+    if cache_result['status'] == 'success':
+        status = "ready"
+    elif writeup_pending(league_id, year, week):
+        status = "pending"
+    else:
+        status = "none"
+    return {
+        "writeup": cache_result.get('writeup'),
+        "writeup_status": status,
+    }
+
+
+def cached_rankings(league_id):
+    """Get the default rankings of a week checked in the last RANKINGS_TTL
+    seconds.
+
+    Returns:
+        rankings (object or None) -- teams and writeup, None if the week
+            needs checking against ESPN
+    """
+    latest = read_json(latest_key(league_id))
+    if latest is None or time.time() - latest["checked_at"] > RANKINGS_TTL:
+        return None
+
+    year = latest["year"]
+    week = latest["week"]
+    stored = read_json(rankings_key(league_id, year, week))
+    if stored is None or stored["scores_hash"] != latest["scores_hash"]:
+        return None
+
+    return with_writeup(league_id, year, week, stored["teams"],
+                        DEFAULT_WEIGHTS,
+                        check_rankings_cache(league_id, year, week))
+
+
+def rank_teams(matchups, weeks, current_week, team_names, weights):
+    """Work out every team's metrics and power ranking score.
+
+    Returns:
+        teams (list) -- team objects, worst first
+    """
+    team_ids, week_ids, points, against, won = score_matrix(
+        matchups, min(weeks, current_week)
+    )
+    played = ~np.isnan(points)
+    medians = np.nanmedian(points, axis=0)
+
+    metrics = {
+        "wins": (won & played).sum(axis=1),
+        "l5": (won & last_games(played, 5)).sum(axis=1),
+        "points": np.round(np.nansum(points, axis=1), 2),
+        "consistency": np.round(np.nanstd(points, axis=1), 2),
+        "overall_wins": np.nansum(all_play_wins(points), axis=1),
+    }
+    pr_scores = np.round(power_scores(metrics, weights), 2)
+
+    teams = []
+    for row, team_id in enumerate(team_ids):
+        team_weeks = played[row]
+        scores = points[row, team_weeks]
+        opponents = against[row, team_weeks]
+        tm = {
+            "name": team_names[team_id],
+            "team_id": team_id,
+            "scores": scores.tolist(),
+            "against": opponents.tolist(),
+            "games": won[row, team_weeks].tolist(),
+            "matchups": [],
+        }
+        for metric, values in metrics.items():
+            tm[metric] = number(values[row])
+        tm["wins_last_5"] = tm["l5"]  # better label for llm
+
+        # these aren't ranked, they're for the writeup
+        tm["avg_score"] = round(float(scores.mean()), 2)
+        tm["avg_against"] = round(float(opponents.mean()), 2)
+        tm["booms"] = int((scores > 140).sum())
+        tm["busts"] = int((scores < 90).sum())
+        tm["median_wins"] = int((scores > medians[team_weeks]).sum())
+        tm["pr_score"] = float(pr_scores[row])
+        teams.append(tm)
+
+    # build "matchup" objs with the opponent's name
+    rows = {team_id: row for row, team_id in enumerate(team_ids)}
+    for matchup in matchups:
+        week = matchup["matchupPeriodId"]
+        if week > weeks or week > current_week:
+            break
+
+        if is_bye_week(matchup):
+            continue
+
+        for t in ["home", "away"]:
+            other = t == "home" and "away" or "home"
+            pts = matchup[t]["totalPoints"]
+            opp_pts = matchup[other]["totalPoints"]
+            teams[rows[matchup[t]["teamId"]]]["matchups"].append({
+                "week": week,
+                "score": pts,
+                "opponent_score": opp_pts,
+                "opponent": team_names[matchup[other]["teamId"]],
+                "result": pts > opp_pts and "w" or "l"
+            })
+
+    # sort ascending like the frontend
+    teams = sorted(teams, key=lambda x: x["pr_score"])
+
+    return teams
+
+
+def current(league_id, weights=None):
+    """Calculate current power rankings, from S3 when they haven't changed.
+
+    Rankings with the default weights are stored for each week along with
+    a hash of the scores they came from. A week checked against ESPN in
+    the last RANKINGS_TTL seconds is served from S3 without calling ESPN,
+    and a week whose scores changed, say from a stat correction, is
+    ranked again. Other weights are always ranked from ESPN's scores.
+
+    The "teams" list holds the team objects defined below.
     The "games" list has True for a win, False for a loss.
 
     Returns:
-        teams (object) -- OrderedDict of power ranking details
-        [
+        rankings (object) -- teams, and the writeup if there is one
+        {"teams": [
             {
                 "name": "Josh Allen",
                 "team_id": 15,
@@ -79,161 +485,103 @@ def current(league_id):
                 "points": 309.06,
                 "consistency": 4.37,
                 "overall_wins": 20,
+                "pr_score": 1.5,
             },
             {...}
-        ]
+        ],
+        "year": 2024,
+        "week": 6,
+        "writeup": "...",
+        "writeup_status": "ready" | "pending" | "none"}
     """
-    teams = []
+    weights = weights or DEFAULT_WEIGHTS
+    default = weights == DEFAULT_WEIGHTS
+    if default:
+        cached = cached_rankings(league_id)
+        if cached is not None:
+            return cached
+
     year = latest_season(league_id)
 
-    matchups_resp = load_data(year, 'mMatchupScore', league_id)
+    # fetch the season's views together, the helpers below that load
+    # them again get them from memory
+    views = load_all(year, ('mMatchupScore', 'mSettings', 'mTeam'),
+                     league_id)
+    matchups_resp = views['mMatchupScore']
     matchups = matchups_resp["schedule"]
     current_week = matchups_resp["scoringPeriodId"]
 
+    # look for a cached writeup while the rankings are worked out
+    writeup = executor.submit(check_rankings_cache, league_id, year,
+                              current_week)
+
     weeks = number_of_weeks(year, False, league_id)
     if weeks == 0:
         return {"error": "No weeks in this season"}
 
-    team_names = team_mapping(year, league_id)
-
-    all_week_pts = {}
-    # loop through all matchups in the regular season
-    for matchup in matchups:
-        week = matchup["matchupPeriodId"]
-        if week > weeks or week > current_week:
-            break
-
-        if is_bye_week(matchup):
-            continue
-
-        if week not in all_week_pts:
-            all_week_pts[week] = []
-
-        # add team's score and win/loss to teams obj
-        for t in ["home", "away"]:
-            t_id = matchup[t]["teamId"]
-            pts = matchup[t]["totalPoints"]
-            won = matchup["winner"].lower() == t
-            all_week_pts[week].append(pts)
+    if not default:
+        # any weights can be asked for, so only the default are stored
+        team_names = team_mapping(year, league_id)
+        teams = rank_teams(matchups, weeks, current_week, team_names,
+                           weights)
+        return with_writeup(league_id, year, current_week, teams, weights,
+                            writeup.result())
+
+    scores = scores_hash(matchups, min(weeks, current_week))
+    key = rankings_key(league_id, year, current_week)
+    stored = read_json(key)
+    stale = stored is not None and stored["scores_hash"] != scores
+    if stored is not None and not stale:
+        teams = stored["teams"]
+    else:
+        team_names = team_mapping(year, league_id)
+        teams = rank_teams(matchups, weeks, current_week, team_names,
+                           weights)
+        write_json(key, {"scores_hash": scores, "teams": teams})
+
+    write_json(latest_key(league_id), {
+        "year": year,
+        "week": current_week,
+        "scores_hash": scores,
+        "checked_at": time.time(),
+    })
 
-            # get points against
-            other = t == "home" and "away" or "home"
-            against = matchup[other]["totalPoints"]
+    # check s3 for cached llm output
+    cache_result = writeup.result()
+    if stale:
+        # the writeup was about the old scores, write it again
+        writeup_key = rankings_dir(league_id, year, current_week)
+        s3.delete_object(Bucket=BUCKET_NAME, Key=writeup_key + "/rankings.md")
+        s3.delete_object(Bucket=BUCKET_NAME,
+                         Key=lease_key(league_id, year, current_week))
+        cache_result = {'status': 'not_found'}
 
-            # build "matchup" obj
-            matchup_obj = {
-                "week": week,
-                "score": pts,
-                "opponent_score": against,
-                "opponent": team_names[matchup[other]["teamId"]],
-                "result": pts > against and "w" or "l"
-            }
-
-            team_obj = next((x for x in teams if x["team_id"] == t_id), None)
-            if team_obj is None:
-                teams.append({
-                    "name": team_names[t_id],
-                    "team_id": t_id,
-                    "scores": [pts],
-                    "against": [against],
-                    "games": [won],
-                    "matchups": [matchup_obj]
-                })
-            else:
-                team_obj["scores"].append(pts)
-                team_obj["games"].append(won)
-                team_obj["against"].append(against)
-                team_obj["matchups"].append(matchup_obj)
-
-    all_wins = []
-    all_overall_wins = []
-    all_l5 = []
-    all_pts = []
-    all_consistency = []
-
-    # loop through each week to calculate the median score
-    medians = {}
-    for week in all_week_pts:
-        medians[week] = statistics.median(all_week_pts[week])
-
-    # loop through teams object and add sum values
-    # to teams object and all_ lists
-    for tm in teams:
-        tm["wins"] = sum(tm["games"])
-        all_wins.append(tm["wins"])
-
-        tm["l5"] = sum(tm["games"][-5:])
-        tm["wins_last_5"] = sum(tm["games"][-5:]) # better label for llm
-        all_l5.append(tm["l5"])
-
-        tm["points"] = round(sum(tm["scores"]), 2)
-        all_pts.append(tm["points"])
-
-        tm["consistency"] = round(statistics.pstdev(tm["scores"]), 2)
-        all_consistency.append(tm["consistency"])
-
-        update_overall_wins(tm, all_week_pts)
-        all_overall_wins.append(tm["overall_wins"])
-
-        # these don't have all_ lists because they're not used for sorting
-        tm["avg_score"] = round(statistics.mean(tm["scores"]), 2)
-        tm["avg_against"] = round(statistics.mean(tm["against"]), 2)
-        tm["booms"] = sum([x > 140 for x in tm["scores"]])
-        tm["busts"] = sum([x < 90 for x in tm["scores"]])
-        tm["median_wins"] = 0
-        for idx, s in enumerate(tm["scores"]):
-            if s > medians[idx + 1]:
-                tm["median_wins"] += 1
-
-    # rank each data point in all_ lists properly
-    all_wins_sorted = sorted(all_wins, reverse=True)
-    all_l5_sorted = sorted(all_l5, reverse=True)
-    all_pts_sorted = sorted(all_pts, reverse=True)
-    all_consistency_sorted = sorted(all_consistency)  # ascending
-    all_overall_wins_sorted = sorted(all_overall_wins, reverse=True)
-
-    for tm in teams:
-        wins_rank = all_wins_sorted.index(tm["wins"]) + 1
-        l5_rank = all_l5_sorted.index(tm["l5"]) + 1
-        pts_rank = all_pts_sorted.index(tm["points"]) + 1
-        consistency_rank = all_consistency_sorted.index(tm["consistency"]) + 1
-        overall_wins_rank = all_overall_wins_sorted.index(tm["overall_wins"]) + 1
-
-        weights = {"wins": 3, "l5": 1, "points": 2, "consistency": 1, "overall_wins": 1}
-        weights_sum = sum(weights.values())
-
-        tm["pr_score"] = round(
-            (wins_rank * weights["wins"] +
-            l5_rank * weights["l5"] +
-            pts_rank * weights["points"] +
-            consistency_rank * weights["consistency"] +
-            overall_wins_rank * weights["overall_wins"]) / weights_sum, 2
-        )
+    return with_writeup(league_id, year, current_week, teams, weights,
+                        cache_result)
 
-    # sort ascending like the frontend
-    teams = sorted(teams, key=lambda x: x["pr_score"])
 
-    # check s3 for cached llm output
-    cache_result = check_rankings_cache(league_id, year, current_week)
-    if cache_result['status'] == 'success':
-        return {
-            "teams": teams,
-            "writeup": cache_result['writeup']
-        }
-    else:
-        # call other lambda to write up
-        invoke_writeup_lambda({
-            "year": year,
-            "week": current_week,
-            "league_id": league_id,
-            "teams": teams
-        })
+def lambda_handler(event, context):
+    try:
+        return handle(event["queryStringParameters"])
+    finally:
+        # totals for as long as this container has been warm
+        print(f"Memory cache {memory_stats['hits']} hits, "
+              f"{memory_stats['misses']} misses, "
+              f"{memory_stats['bytes']} bytes")
+
+
+def handle(params):
+    """Answer a request for rankings or a writeup's status"""
+    league_id = params["leagueId"]
+    if params.get("writeup") == "true":
+        return writeup_status(league_id, int(params["year"]),
+                              int(params["week"]))
+    try:
+        weights = parse_weights(params)
+    except ValueError as e:
         return {
-            "teams": teams,
-            "writeup": None
+            "statusCode": 400,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"error": str(e)})
         }
-
-
-def lambda_handler(event, context):
-    league_id = event["queryStringParameters"]["leagueId"]
-    return current(league_id)
+    return current(league_id, weights)
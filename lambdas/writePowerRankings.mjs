@@ -1,11 +1,52 @@
-import { S3Client, PutObjectCommand } from "@aws-sdk/client-s3";
+import {
+  S3Client,
+  PutObjectCommand,
+  GetObjectCommand,
+  DeleteObjectCommand
+} from "@aws-sdk/client-s3";
 
 const s3 = new S3Client({ region: "us-east-2" });
 const BUCKET = 'ffalmanac-data';
 
+const leaseKey = (league_id, year, week) =>
+  `power_rankings/league_${league_id}/${year}/week_${week}/writeup.lock`;
+
+// Check this job still holds the writeup lease. The lease moves on when
+// the week's scores change, and a writeup from the old scores must not
+// overwrite the new one.
+const holdsLease = async (league_id, year, week, lease) => {
+  try {
+    const current = await s3.send(new GetObjectCommand({
+      Bucket: BUCKET,
+      Key: leaseKey(league_id, year, week)
+    }));
+    const held = JSON.parse(await current.Body.transformToString());
+    return held.token === lease;
+  } catch (error) {
+    console.error('Error reading writeup lease:', error);
+    return false;
+  }
+};
+
+// Free the writeup lease if this job still holds it, so the next page load
+// can start another job instead of waiting for the lease to expire
+const releaseLease = async (league_id, year, week, lease) => {
+  try {
+    if (await holdsLease(league_id, year, week, lease)) {
+      await s3.send(new DeleteObjectCommand({
+        Bucket: BUCKET,
+        Key: leaseKey(league_id, year, week)
+      }));
+    }
+  } catch (error) {
+    console.error('Error releasing writeup lease:', error);
+  }
+};
+
 export const handler = async (event) => {
   const apiKey = process.env.ANTHROPIC_API_KEY;
-  const data = event;
+  // the lease token is only for this job, keep it out of the prompt
+  const { lease, ...data } = event;
   console.log('Got data: ');
   console.log(data);
   const { year, week, league_id } = data;
@@ -72,6 +113,7 @@ ${JSON.stringify(data)}
 
   if (!response.ok) {
     console.error('Claude API error', response.status, await response.text());
+    await releaseLease(league_id, year, week, lease);
     return;
   }  
 
@@ -85,6 +127,14 @@ ${JSON.stringify(data)}
   // Create a unique S3 key
   const key = `power_rankings/league_${league_id}/${year}/week_${week}/rankings.md`;
 
+  if (!(await holdsLease(league_id, year, week, lease))) {
+    console.log('Writeup lease moved on, dropping this writeup');
+    return {
+      statusCode: 409,
+      body: 'Writeup lease is held by a newer job',
+    };
+  }
+
   try {
     const command = new PutObjectCommand({
       Bucket: BUCKET,
@@ -96,6 +146,7 @@ ${JSON.stringify(data)}
     await s3.send(command);
   } catch (error) {
     console.error('Error writing to S3:', error);
+    await releaseLease(league_id, year, week, lease);
   }
 
   return {
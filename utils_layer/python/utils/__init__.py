@@ -1,15 +1,157 @@
+import gzip
+import hashlib
 import json
+import logging
+import os
 import requests
+import threading
+import time
 import boto3
-from datetime import datetime, date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
 
 s3 = boto3.client('s3')
+logger = logging.getLogger(__name__)
 CACHE_BUCKET = 'ffalmanac-data'
+# bump when the format of cached objects changes
+CACHE_PREFIX = 'espn-cache/v2'
+# request headers that change what ESPN sends back
+SHAPING_HEADERS = ('x-fantasy-filter',)
+
+# Responses are also kept in memory, which lasts as long as a warm Lambda
+# container. Seasons before the league's current one never change so they
+# stay until evicted, the current season and mStatus expire after
+# CURRENT_SEASON_TTL seconds.
+MEMORY_BYTES = int(os.environ.get('ALMANAC_MEMORY_CACHE_BYTES',
+                                  64 * 1024 * 1024))
+CURRENT_SEASON_TTL = int(os.environ.get('ALMANAC_CURRENT_SEASON_TTL', 60))
+
+# s3 key -> (data, size of its JSON in bytes, expiry time or None)
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+memory_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+# S3 and ESPN calls that don't depend on each other run on these threads,
+# and share one keep-alive session for as long as the container is warm
+IO_THREADS = int(os.environ.get('ALMANAC_IO_THREADS', 8))
+executor = ThreadPoolExecutor(max_workers=IO_THREADS)
+http = requests.Session()
+http.mount('https://', HTTPAdapter(pool_connections=4,
+                                   pool_maxsize=IO_THREADS))
+
+
+def memory_get(key):
+    """Get a response from memory, None if missing or expired"""
+    with _memory_lock:
+        entry = _memory.get(key)
+        if entry is not None and entry[2] is not None \
+                and entry[2] <= time.monotonic():
+            del _memory[key]
+            memory_stats["bytes"] -= entry[1]
+            entry = None
+
+        if entry is None:
+            memory_stats["misses"] += 1
+        else:
+            memory_stats["hits"] += 1
+            _memory.move_to_end(key)
+        logger.debug("Memory cache %s for %s (%d hits, %d misses)",
+                     'hit' if entry else 'miss', key, memory_stats['hits'],
+                     memory_stats['misses'])
+        return entry[0] if entry else None
+
+
+def memory_put(key, data, size, ttl=None):
+    """Keep a response in memory, evicting the least recently used"""
+    if size > MEMORY_BYTES:
+        return
+    expires = time.monotonic() + ttl if ttl is not None else None
+    with _memory_lock:
+        previous = _memory.pop(key, None)
+        if previous is not None:
+            memory_stats["bytes"] -= previous[1]
+        _memory[key] = (data, size, expires)
+        memory_stats["bytes"] += size
+        while memory_stats["bytes"] > MEMORY_BYTES:
+            _key, (_data, evicted, _expires) = _memory.popitem(last=False)
+            memory_stats["bytes"] -= evicted
+
+
+def cache_key(year, uri, league_id, week=None, headers=None):
+    """Build the S3 key for a response from everything that shapes it"""
+    key = f'{CACHE_PREFIX}/{league_id}/{year}/{uri}'
+    if week is not None:
+        key += f'/week-{week}'
+    shaping = {
+        name.lower(): value for name, value in (headers or {}).items()
+        if name.lower() in SHAPING_HEADERS
+    }
+    if shaping:
+        digest = hashlib.sha256(
+            json.dumps(shaping, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        key += f'/headers-{digest[:16]}'
+    return key + '.json.gz'
+
+
+def unwrap(data):
+    """leagueHistory responses for 2019 and earlier are a one item list"""
+    if isinstance(data, (list, tuple)):
+        return data[0] if data else None
+    return data
+
+
+def read_cached(s3_key):
+    """Load a cached response from S3, None if missing or corrupt.
+
+    Returns:
+        data (object or None) -- the response
+        size (int) -- bytes of JSON
+    """
+    try:
+        cached = s3.get_object(Bucket=CACHE_BUCKET, Key=s3_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchKey':
+            raise  # Unexpected error
+        return None, 0
+
+    try:
+        body = gzip.decompress(cached['Body'].read())
+    except (OSError, EOFError) as e:
+        # BadGzipFile is an OSError, a truncated object is an EOFError
+        print(f"Unreadable gzip for {s3_key}, ignoring cached copy: {e}")
+        return None, 0
+    expected = cached.get('Metadata', {}).get('sha256')
+    if expected != hashlib.sha256(body).hexdigest():
+        print(f"Hash mismatch for {s3_key}, ignoring cached copy")
+        return None, 0
+    return json.loads(body), len(body)
+
+
+def write_cached(s3_key, data):
+    """Store a response in S3 gzipped, with a hash of the JSON"""
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    s3.put_object(
+        Bucket=CACHE_BUCKET,
+        Key=s3_key,
+        Body=gzip.compress(body),
+        ContentType='application/json',
+        ContentEncoding='gzip',
+        Metadata={'sha256': hashlib.sha256(body).hexdigest()}
+    )
+
 
 def load_data(year, uri, league_id, week=None, headers=None):
     """
-    Load ESPN fantasy data — caching all years to S3 except the current one.
+    Load ESPN fantasy data — caching seasons before the league's current
+    one to S3.
+
+    Cached responses are keyed by week and any headers that shape the
+    response, and stored gzipped with a hash of their JSON. Every year is
+    also kept in memory for later invocations of a warm container.
 
     Args:
         year (int): Season year
@@ -21,23 +163,23 @@ def load_data(year, uri, league_id, week=None, headers=None):
     Returns:
         dict: ESPN data
     """
-    current_year = datetime.now().year
-    should_cache = year != current_year
-    s3_key = f'espn-cache/{league_id}/{year}/{uri}.json'
+    s3_key = cache_key(year, uri, league_id, week, headers)
+    cached = memory_get(s3_key)
+    if cached is not None:
+        return cached
 
-    # Try to load from S3 first
-    try:
+    # mStatus is how a season is known to be over, so it's never kept
+    should_cache = uri != 'mStatus' and completed(year, league_id)
+    ttl = None if should_cache else CURRENT_SEASON_TTL
+
+    # Try to load from S3 next
+    if should_cache:
         print(f"Checking S3 for {s3_key}")
-        cached = s3.get_object(Bucket=CACHE_BUCKET, Key=s3_key)
-        body = cached['Body'].read().decode('utf-8')
-        json_body = json.loads(body)
-        print(f"JSON body: {json_body}")
-        if isinstance(json_body, (list, tuple)):
-            return json_body[0] if json_body else None  # optional: handle empty list/tuple
-        return json_body
-    except ClientError as e:
-        if e.response['Error']['Code'] != 'NoSuchKey':
-            raise  # Unexpected error
+        cached, size = read_cached(s3_key)
+        if cached is not None:
+            cached = unwrap(cached)
+            memory_put(s3_key, cached, size, ttl)
+            return cached
         print(f"Not found in cache, calling ESPN API for {year}/{uri}")
 
     # Build the correct ESPN API URL
@@ -57,25 +199,33 @@ def load_data(year, uri, league_id, week=None, headers=None):
             url += f"&scoringPeriodId={week}"
 
     print('Calling ESPN endpoint:', url)
-    resp = requests.get(url, headers=headers)
+    resp = http.get(url, headers=headers)
     resp.raise_for_status()
-    data = resp.json()
+    data = unwrap(resp.json())
+    memory_put(s3_key, data, len(resp.content), ttl)
 
     if should_cache:
         try:
-            s3.put_object(
-                Bucket=CACHE_BUCKET,
-                Key=s3_key,
-                Body=json.dumps(data),
-                ContentType='application/json'
-            )
+            write_cached(s3_key, data)
             print(f"Cached {s3_key}")
         except Exception as e:
             print(f"Failed to cache {s3_key}: {e}")
     else:
         print(f"Skipping cache for current season ({year})")
 
-    return data[0] if year <= 2018 else data
+    return data
+
+
+def load_all(year, uris, league_id):
+    """Load several views of a season at the same time.
+
+    Returns:
+        data (dict) -- uri to ESPN data
+    """
+    futures = {
+        uri: executor.submit(load_data, year, uri, league_id) for uri in uris
+    }
+    return {uri: future.result() for uri, future in futures.items()}
 
 
 def player_info(year, league_id):
@@ -165,6 +315,15 @@ def print_to_file(content, file):
     f.close()
 
 
+def completed(year, league_id):
+    """Check if a season is before the league's current season.
+
+    The calendar year can't tell, a season runs into January.
+    """
+    status = season_status(league_id)
+    return "season" in status and int(year) < status["season"]
+
+
 def latest_season(league_id):
     """Find the latest completed or currently active fantasy season"""
     status = season_status(league_id)